@@ -1,26 +1,50 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from jose import JWTError, jwt
+from pydantic import BaseModel
 from datetime import datetime, timedelta
 from typing import Optional, List
+from uuid import uuid4
 from backend.database import get_db
+from backend.config import settings
+from backend.hashing import hashear, verificar_y_actualizar
+from backend.procesos import PoolProcesosAcotado
+from backend.revocacion import RegistroRevocaciones
 from backend import models
 
 # Configuración de seguridad
 SECRET_KEY = "tu-clave-secreta-muy-segura-cambiala-en-produccion"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 480
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+REFRESH_TOKEN_EXPIRE_MINUTES = settings.refresh_token_expire_minutes
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+oauth2_scheme_opcional = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Tokens cerrados con /api/auth/logout antes de su expiración
+revocaciones = RegistroRevocaciones(
+    settings.revocacion_archivo, sincronizar_cada=settings.revocacion_sincronizar_segundos
+)
+revocaciones.cargar()
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# bcrypt fuera de los hilos del servidor: una ráfaga de logins no bloquea al resto de la API
+pool_hash = PoolProcesosAcotado("hash", settings.hash_procesos, settings.hash_max_pendientes)
+
+async def hashear_password(password: str) -> str:
+    return await pool_hash.ejecutar(hashear, password)
+
+class TokenUsuario(BaseModel):
+    """Identidad y rol tomados de los claims de un access token ya verificado"""
+    id: int
+    username: str
+    rol: str
+    nombre_completo: Optional[str] = None
+
+def claims_usuario(user: models.Usuario) -> dict:
+    return {"sub": user.username, "uid": user.id, "rol": user.rol, "nombre": user.nombre_completo}
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -28,39 +52,89 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "typ": "access", "jti": uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def create_refresh_token(user: models.Usuario):
+    """Solo sirve para /api/auth/refresh; no lleva rol para que nunca autorice un endpoint"""
+    expire = datetime.utcnow() + timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+    to_encode = {"sub": user.username, "uid": user.id, "exp": expire, "typ": "refresh", "jti": uuid4().hex}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def _credenciales_invalidas():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudo validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decodificar_token(token: str, tipo: str = "access") -> dict:
+    """Verifica firma y expiración y que el token sea del tipo esperado (los tokens sin typ son access)"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    
+        raise _credenciales_invalidas()
+    if payload.get("sub") is None or payload.get("typ", "access") != tipo:
+        raise _credenciales_invalidas()
+    if revocaciones.esta_revocado(payload.get("jti")):
+        raise _credenciales_invalidas()
+    return payload
+
+def revocar_token(payload: dict) -> bool:
+    """
+    Invalida un token ya decodificado hasta su expiración. False si ya estaba
+    revocado (otro request lo usó primero) o no tiene jti
+    """
+    if not payload.get("jti"):
+        return False
+    return revocaciones.revocar(payload["jti"], int(payload["exp"]))
+
+def get_token_usuario(token: str = Depends(oauth2_scheme)) -> TokenUsuario:
+    """
+    Autoriza solo con los claims del access token, sin consultar la base.
+    Un cambio de rol o una desactivación se aplica al renovar el token
+    (como máximo ACCESS_TOKEN_EXPIRE_MINUTES después)
+    """
+    payload = decodificar_token(token)
+    if payload.get("uid") is None or payload.get("rol") is None:
+        # Token emitido antes de que existieran los claims de identidad
+        raise _credenciales_invalidas()
+    return TokenUsuario(
+        id=payload["uid"],
+        username=payload["sub"],
+        rol=payload["rol"],
+        nombre_completo=payload.get("nombre"),
+    )
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """Usuario completo desde la base (para /api/auth/me y datos que no van en el token)"""
+    username = decodificar_token(token)["sub"]
     user = db.query(models.Usuario).filter(models.Usuario.username == username).first()
-    if user is None:
-        raise credentials_exception
+    if user is None or not user.activo:
+        raise _credenciales_invalidas()
     return user
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(models.Usuario).filter(models.Usuario.username == username).first()
+async def autenticar_usuario(db: AsyncSession, username: str, password: str):
+    """
+    Usuario si la contraseña es correcta, False si no; bcrypt corre en
+    pool_hash. Si el hash usa un costo menor a bcrypt_rounds, se guarda rehasheado
+    """
+    user = (await db.execute(
+        select(models.Usuario).where(models.Usuario.username == username)
+    )).scalar_one_or_none()
     if not user:
         return False
-    if not verify_password(password, user.password_hash):
+    valida, nuevo_hash = await pool_hash.ejecutar(verificar_y_actualizar, password, user.password_hash)
+    if not valida:
         return False
+    if nuevo_hash:
+        user.password_hash = nuevo_hash
+        await db.commit()
     return user
 
 def require_roles(allowed_roles: List[str]):
-    def role_checker(current_user: models.Usuario = Depends(get_current_user)):
+    def role_checker(current_user: TokenUsuario = Depends(get_token_usuario)):
         if current_user.rol not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -69,7 +143,7 @@ def require_roles(allowed_roles: List[str]):
         return current_user
     return role_checker
 
-def get_current_admin(current_user: models.Usuario = Depends(get_current_user)):
+def get_current_admin(current_user: TokenUsuario = Depends(get_token_usuario)):
     if current_user.rol != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -77,7 +151,7 @@ def get_current_admin(current_user: models.Usuario = Depends(get_current_user)):
         )
     return current_user
 
-def get_current_medico(current_user: models.Usuario = Depends(get_current_user)):
+def get_current_medico(current_user: TokenUsuario = Depends(get_token_usuario)):
     if current_user.rol != "medico":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -85,7 +159,7 @@ def get_current_medico(current_user: models.Usuario = Depends(get_current_user))
         )
     return current_user
 
-def get_current_recepcion_or_admin(current_user: models.Usuario = Depends(get_current_user)):
+def get_current_recepcion_or_admin(current_user: TokenUsuario = Depends(get_token_usuario)):
     if current_user.rol not in ["recepcion", "admin"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -93,7 +167,7 @@ def get_current_recepcion_or_admin(current_user: models.Usuario = Depends(get_cu
         )
     return current_user
 
-def get_current_medico_or_admin(current_user: models.Usuario = Depends(get_current_user)):
+def get_current_medico_or_admin(current_user: TokenUsuario = Depends(get_token_usuario)):
     if current_user.rol not in ["medico", "admin"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
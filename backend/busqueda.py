@@ -0,0 +1,336 @@
+"""
+Búsqueda de pacientes en el servidor.
+
+Con SQLite se usa la tabla virtual FTS5 pacientes_fts (contenido externo
+sobre pacientes, mantenida por triggers): cada término de la búsqueda se
+trata como prefijo y los resultados se ordenan por bm25. Si la búsqueda es
+muy amplia (más de MAX_CANDIDATOS_RANKING coincidencias, p. ej. "mar") el
+costo de bm25 crece con el número de coincidencias, así que se devuelven los
+pacientes más recientes que coinciden sin calcular el ranking. Con otros motores,
+o si la versión de SQLite no trae FTS5, se recurre a ILIKE por columna.
+
+Si esa búsqueda no llena la página se completa con coincidencias difusas por
+trigramas sobre pacientes.nombre_normalizado ("Jose Peres" encuentra a
+"José Pérez"): en SQLite con la tabla nombres_trigramas, en PostgreSQL con
+pg_trgm y un índice GIN.
+"""
+import logging
+import re
+import unicodedata
+from typing import Iterable, List
+from sqlalchemy import and_, bindparam, column, event, func, insert, inspect, or_, select, table, text
+from backend import models
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS_BUSQUEDA = ("nombre", "apellidos", "identificacion", "telefono", "email")
+
+# Pesos bm25 en el mismo orden que COLUMNAS_BUSQUEDA: el nombre pesa más que el contacto
+PESOS_BM25 = (10.0, 10.0, 5.0, 2.0, 1.0)
+
+MAX_CANDIDATOS_RANKING = 2000
+
+DDL_FTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS pacientes_fts USING fts5("
+    f"{', '.join(COLUMNAS_BUSQUEDA)}, "
+    "content='pacientes', content_rowid='id', prefix='2 3', "
+    "tokenize='unicode61 remove_diacritics 2')",
+
+    "CREATE TRIGGER IF NOT EXISTS pacientes_fts_ai AFTER INSERT ON pacientes BEGIN "
+    f"INSERT INTO pacientes_fts(rowid, {', '.join(COLUMNAS_BUSQUEDA)}) "
+    f"VALUES (new.id, {', '.join('new.' + c for c in COLUMNAS_BUSQUEDA)}); END",
+
+    "CREATE TRIGGER IF NOT EXISTS pacientes_fts_ad AFTER DELETE ON pacientes BEGIN "
+    f"INSERT INTO pacientes_fts(pacientes_fts, rowid, {', '.join(COLUMNAS_BUSQUEDA)}) "
+    f"VALUES ('delete', old.id, {', '.join('old.' + c for c in COLUMNAS_BUSQUEDA)}); END",
+
+    "CREATE TRIGGER IF NOT EXISTS pacientes_fts_au AFTER UPDATE ON pacientes BEGIN "
+    f"INSERT INTO pacientes_fts(pacientes_fts, rowid, {', '.join(COLUMNAS_BUSQUEDA)}) "
+    f"VALUES ('delete', old.id, {', '.join('old.' + c for c in COLUMNAS_BUSQUEDA)}); "
+    f"INSERT INTO pacientes_fts(rowid, {', '.join(COLUMNAS_BUSQUEDA)}) "
+    f"VALUES (new.id, {', '.join('new.' + c for c in COLUMNAS_BUSQUEDA)}); END",
+
+    # Ranking por defecto de la columna oculta rank (persistido en la tabla)
+    "INSERT INTO pacientes_fts(pacientes_fts, rank) "
+    f"VALUES ('rank', 'bm25({', '.join(str(p) for p in PESOS_BM25)})')",
+
+    # Indexa los pacientes que ya existían
+    "INSERT INTO pacientes_fts(pacientes_fts) VALUES ('rebuild')",
+]
+
+pacientes_fts = table("pacientes_fts", column("rowid"), column("rank"))
+
+_fts_disponible = {}
+
+
+def terminos(q: str) -> List[str]:
+    return [t for t in q.split() if t]
+
+
+def expresion_fts(q: str) -> str:
+    """
+    'jose 1-234' -> '"jose"* AND "1-234"*'
+    Cada término va entre comillas (los símbolos no se interpretan como
+    sintaxis FTS5) y con * para buscar por prefijo
+    """
+    return " AND ".join('"{}"*'.format(t.replace('"', '""')) for t in terminos(q))
+
+
+def fts_disponible(db) -> bool:
+    """True si la base tiene la tabla pacientes_fts (se consulta una vez por URL)"""
+    bind = db.get_bind()
+    clave = str(bind.url)
+    if clave not in _fts_disponible:
+        _fts_disponible[clave] = (
+            bind.dialect.name == "sqlite" and inspect(bind).has_table("pacientes_fts")
+        )
+    return _fts_disponible[clave]
+
+
+def _coincide(q: str):
+    return text("pacientes_fts MATCH :expresion").bindparams(expresion=expresion_fts(q))
+
+
+def _buscar_fts(db, q: str, limite: int):
+    # Sondeo sin ranking (barato): ¿hay más candidatos de los que conviene ordenar por bm25?
+    sondeo = select(pacientes_fts.c.rowid).where(_coincide(q)).limit(MAX_CANDIDATOS_RANKING + 1).subquery()
+    amplia = db.execute(select(func.count()).select_from(sondeo)).scalar_one() > MAX_CANDIDATOS_RANKING
+
+    orden = pacientes_fts.c.rowid.desc() if amplia else pacientes_fts.c.rank
+    ranking = (
+        select(pacientes_fts.c.rowid, pacientes_fts.c.rank)
+        .where(_coincide(q))
+        .order_by(orden)
+        .limit(limite)
+        .subquery()
+    )
+    stmt = (
+        select(models.Paciente)
+        .join(ranking, ranking.c.rowid == models.Paciente.id)
+        .order_by(ranking.c.rowid.desc() if amplia else ranking.c.rank)
+    )
+    return db.execute(stmt).scalars().all()
+
+
+def _buscar_like(db, q: str, limite: int):
+    columnas = [getattr(models.Paciente, c) for c in COLUMNAS_BUSQUEDA]
+    condiciones = [
+        or_(*[col.ilike(f"%{t}%") for col in columnas])
+        for t in terminos(q)
+    ]
+    stmt = (
+        select(models.Paciente)
+        .where(and_(*condiciones))
+        .order_by(models.Paciente.apellidos, models.Paciente.nombre, models.Paciente.id)
+        .limit(limite)
+    )
+    return db.execute(stmt).scalars().all()
+
+
+def buscar_pacientes(db, q: str, limite: int = 20) -> list:
+    """
+    Pacientes que coinciden con todos los términos de q, los más relevantes
+    primero, seguidos de los nombres parecidos (búsqueda difusa)
+    """
+    if not terminos(q):
+        return []
+    if fts_disponible(db):
+        exactos = _buscar_fts(db, q, limite)
+    else:
+        exactos = _buscar_like(db, q, limite)
+    if len(exactos) >= limite:
+        return exactos
+
+    vistos = {p.id for p in exactos}
+    similares = [p for p in buscar_similares(db, q, limite) if p.id not in vistos]
+    return exactos + similares[:limite - len(exactos)]
+
+
+def crear_indice_fts(conn) -> bool:
+    """Crea pacientes_fts y sus triggers. Devuelve False si SQLite no trae FTS5"""
+    if conn.dialect.name != "sqlite":
+        return False
+    opciones = {fila[0] for fila in conn.execute(text("PRAGMA compile_options"))}
+    if "ENABLE_FTS5" not in opciones:
+        logger.warning("SQLite sin FTS5: la búsqueda de pacientes usará LIKE")
+        return False
+    for sentencia in DDL_FTS:
+        conn.execute(text(sentencia))
+    return True
+
+
+# ==================== NOMBRES NORMALIZADOS Y TRIGRAMAS ====================
+#
+# Los trigramas se indexan por palabra del vocabulario de nombres y no por
+# paciente: el vocabulario crece mucho más despacio que la tabla, y las
+# listas de un trigrama común ("jos") no son proporcionales al número de
+# pacientes. Cada palabra de la búsqueda se expande a las palabras parecidas
+# del vocabulario y pacientes_fts cruza esas variantes.
+
+_NO_ALFANUMERICO = re.compile(r"[^0-9a-z]+")
+
+
+def normalizar(texto: str) -> str:
+    """'José  Pérez-Núñez' -> 'jose perez nunez'"""
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    sin_tildes = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return _NO_ALFANUMERICO.sub(" ", sin_tildes.lower()).strip()
+
+
+def nombre_normalizado(nombre: str, apellidos: str) -> str:
+    return normalizar(f"{nombre or ''} {apellidos or ''}")
+
+
+def trigramas(palabra: str) -> set:
+    """Trigramas al estilo pg_trgm: la palabra con dos espacios delante y uno detrás"""
+    relleno = f"  {palabra} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def similitud(a: set, b: set) -> float:
+    """Trigramas en común sobre trigramas totales (similarity de pg_trgm)"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def puntaje_nombre(palabras: List[str], normalizado: str) -> float:
+    """Promedio, por palabra buscada, de la similitud con la palabra más parecida del nombre"""
+    propias = [trigramas(p) for p in (normalizado or "").split()]
+    if not palabras or not propias:
+        return 0.0
+    return sum(max(similitud(trigramas(p), t) for t in propias) for p in palabras) / len(palabras)
+
+
+def indexar_trigramas(conn, normalizados: Iterable[str]):
+    """
+    Agrega al vocabulario las palabras de los nombres normalizados dados.
+    Los INSERT masivos (insert(models.Paciente)) no disparan los eventos del
+    mapper: quien los use debe llamar a esta función en la misma transacción
+    """
+    if conn.dialect.name == "postgresql":
+        return  # pg_trgm indexa la columna directamente
+    palabras = {p for n in normalizados for p in (n or "").split()}
+    filas = [{"trigrama": t, "palabra": p} for p in palabras for t in trigramas(p)]
+    if filas:
+        conn.execute(insert(models.NombreTrigrama.__table__).prefix_with("OR IGNORE", dialect="sqlite"), filas)
+
+
+@event.listens_for(models.Paciente, "before_insert")
+@event.listens_for(models.Paciente, "before_update")
+def _normalizar_nombre(mapper, connection, paciente):
+    paciente.nombre_normalizado = nombre_normalizado(paciente.nombre, paciente.apellidos)
+
+
+@event.listens_for(models.Paciente, "after_insert")
+@event.listens_for(models.Paciente, "after_update")
+def _actualizar_trigramas(mapper, connection, paciente):
+    if inspect(paciente).attrs.nombre_normalizado.history.has_changes():
+        indexar_trigramas(connection, [paciente.nombre_normalizado])
+
+
+def reindexar_nombres(conn, lote: int = 1000) -> int:
+    """Recalcula nombre_normalizado y el vocabulario de trigramas de todos los pacientes, por lotes de id"""
+    tabla = models.Paciente.__table__
+    actualizar = (
+        tabla.update()
+        .where(tabla.c.id == bindparam("b_id"))
+        .values(nombre_normalizado=bindparam("b_nombre_normalizado"))
+    )
+    ultimo_id, total = 0, 0
+    while True:
+        filas = conn.execute(
+            select(tabla.c.id, tabla.c.nombre, tabla.c.apellidos)
+            .where(tabla.c.id > ultimo_id)
+            .order_by(tabla.c.id)
+            .limit(lote)
+        ).all()
+        if not filas:
+            return total
+        normalizados = [(f.id, nombre_normalizado(f.nombre, f.apellidos)) for f in filas]
+        conn.execute(actualizar, [{"b_id": pid, "b_nombre_normalizado": n} for pid, n in normalizados])
+        indexar_trigramas(conn, [n for _, n in normalizados])
+        ultimo_id, total = filas[-1].id, total + len(filas)
+
+
+def variantes(db, palabra: str) -> List[str]:
+    """Palabras del vocabulario parecidas a palabra, la más parecida primero"""
+    consulta = trigramas(palabra)
+    umbral = settings.busqueda_similitud_minima
+    comunes = func.count().label("comunes")
+    # Con menos trigramas en común que esto la similitud no puede alcanzar el umbral
+    minimo = max(1, int(len(consulta) * umbral))
+    candidatas = db.execute(
+        select(models.NombreTrigrama.palabra, comunes)
+        .where(models.NombreTrigrama.trigrama.in_(sorted(consulta)))
+        .group_by(models.NombreTrigrama.palabra)
+        .having(comunes >= minimo)
+        .order_by(comunes.desc())
+        .limit(settings.busqueda_max_candidatos)
+    ).scalars().all()
+    puntuadas = sorted(
+        ((similitud(consulta, trigramas(c)), c) for c in candidatas if c != palabra),
+        reverse=True
+    )
+    return [c for puntaje, c in puntuadas[:settings.busqueda_max_variantes] if puntaje >= umbral]
+
+
+def _candidatos_fts(db, grupos: List[List[str]]) -> List[int]:
+    # La palabra tal como se escribió va como prefijo; sus variantes, completas
+    expresion = " AND ".join(
+        "(" + " OR ".join(['"{}"*'.format(grupo[0])] + ['"{}"'.format(v) for v in grupo[1:]]) + ")"
+        for grupo in grupos
+    )
+    return db.execute(
+        select(pacientes_fts.c.rowid)
+        .where(text("pacientes_fts MATCH :expresion").bindparams(expresion=f"{{nombre apellidos}} : ({expresion})"))
+        .order_by(pacientes_fts.c.rowid.desc())
+        .limit(settings.busqueda_max_candidatos)
+    ).scalars().all()
+
+
+def _candidatos_like(db, grupos: List[List[str]]) -> List[int]:
+    columna = models.Paciente.nombre_normalizado
+    return db.execute(
+        select(models.Paciente.id)
+        .where(and_(*[or_(*[columna.like(f"%{v}%") for v in grupo]) for grupo in grupos]))
+        .order_by(models.Paciente.id.desc())
+        .limit(settings.busqueda_max_candidatos)
+    ).scalars().all()
+
+
+def _similares_pg_trgm(db, normalizado: str, limite: int):
+    puntaje = func.word_similarity(normalizado, models.Paciente.nombre_normalizado)
+    stmt = (
+        select(models.Paciente)
+        .where(models.Paciente.nombre_normalizado.op("%>")(normalizado))
+        .order_by(puntaje.desc(), models.Paciente.id)
+        .limit(limite)
+    )
+    return db.execute(stmt).scalars().all()
+
+
+def buscar_similares(db, q: str, limite: int = 20) -> list:
+    """
+    Pacientes cuyo nombre se parece a q ignorando tildes, mayúsculas y errores
+    de tipeo, ordenados por similitud
+    """
+    normalizado = normalizar(q)
+    palabras = normalizado.split()
+    if not palabras:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        return _similares_pg_trgm(db, normalizado, limite)
+
+    grupos = [[p] + variantes(db, p) for p in palabras]
+    if fts_disponible(db):
+        ids = _candidatos_fts(db, grupos)
+    else:
+        ids = _candidatos_like(db, grupos)
+    if not ids:
+        return []
+
+    pacientes = db.execute(select(models.Paciente).where(models.Paciente.id.in_(ids))).scalars().all()
+    pacientes.sort(key=lambda p: (-puntaje_nombre(palabras, p.nombre_normalizado), p.id))
+    return pacientes[:limite]
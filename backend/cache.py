@@ -0,0 +1,103 @@
+"""
+Caché en memoria acotada (LRU + TTL) con contadores de aciertos y fallos.
+
+Es por proceso: con varios workers cada uno tiene la suya, así que el TTL
+acota cuánto tiempo puede servirse un valor ya invalidado en otro worker.
+Con max_bytes también se acota por tamaño (valores bytes): se expulsan las
+entradas menos usadas hasta que la suma de len(valor) entra en el límite.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Todas las cachés creadas, por nombre (las expone /api/metricas)
+CACHES = {}
+
+
+class CacheLRU:
+    def __init__(self, nombre: str, max_entradas: int, ttl_segundos: float, max_bytes: int = 0):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.max_bytes = max_bytes  # 0 = sin límite de tamaño
+        self._datos = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.invalidaciones = 0
+        CACHES[nombre] = self
+
+    @property
+    def activa(self) -> bool:
+        return self.max_entradas > 0 and self.ttl_segundos > 0
+
+    def obtener(self, clave: Hashable) -> Optional[Any]:
+        """Valor guardado para clave, o None si no existe o ya venció"""
+        if not self.activa:
+            return None
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                if entrada is not None:
+                    self._quitar(clave)
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def _tamano(self, valor: Any) -> int:
+        return len(valor) if self.max_bytes else 0
+
+    def _quitar(self, clave: Hashable):
+        self._bytes -= self._tamano(self._datos.pop(clave)[1])
+
+    def guardar(self, clave: Hashable, valor: Any):
+        if not self.activa or (self.max_bytes and len(valor) > self.max_bytes):
+            return
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            self._datos[clave] = (time.monotonic() + self.ttl_segundos, valor)
+            self._bytes += self._tamano(valor)
+            while len(self._datos) > self.max_entradas or (self.max_bytes and self._bytes > self.max_bytes):
+                self._quitar(next(iter(self._datos)))
+                self.expulsiones += 1
+
+    def invalidar(self, condicion: Callable[[Hashable, Any], bool]) -> int:
+        """Elimina las entradas para las que condicion(clave, valor) es verdadera"""
+        with self._lock:
+            claves = [c for c, (_, v) in self._datos.items() if condicion(c, v)]
+            for clave in claves:
+                self._quitar(clave)
+            self.invalidaciones += len(claves)
+            return len(claves)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._bytes = 0
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            estadisticas = {
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "ttl_segundos": self.ttl_segundos,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else None,
+                "expulsiones": self.expulsiones,
+                "invalidaciones": self.invalidaciones,
+            }
+            if self.max_bytes:
+                estadisticas.update(bytes=self._bytes, max_bytes=self.max_bytes)
+            return estadisticas
+
+
+def estadisticas_caches() -> dict:
+    return {nombre: cache.estadisticas() for nombre, cache in CACHES.items()}
@@ -0,0 +1,115 @@
+from typing import Literal, Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """
+    Configuración del backend.
+    Cada campo se puede sobrescribir con una variable de entorno ECE_<CAMPO>
+    (p. ej. ECE_DATABASE_URL) o desde un archivo .env
+    """
+    model_config = SettingsConfigDict(env_prefix="ECE_", env_file=".env", extra="ignore")
+
+    # Base de datos
+    database_url: str = "sqlite:///./ece_medico.db"
+    # URL del engine asíncrono; si se omite se deriva de database_url
+    # (sqlite -> sqlite+aiosqlite, postgresql -> postgresql+asyncpg)
+    async_database_url: Optional[str] = None
+    db_echo: bool = False
+    # Aplicar las migraciones pendientes al iniciar la API. En producción se
+    # recomienda desactivarlo y correr `python -m backend.migraciones` en el
+    # despliegue, antes de levantar los workers
+    db_auto_migrate: bool = True
+
+    # Pool de conexiones (tamaño por worker de uvicorn)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30  # segundos esperando una conexión libre
+    db_pool_recycle: int = 1800  # segundos; -1 desactiva el reciclado
+    db_pool_pre_ping: bool = True
+
+    # Enrutamiento de lecturas (get_read_db):
+    # - "read_pool": engine aparte de solo lectura (query_only en SQLite, o la
+    #   réplica de read_database_url), para que las lecturas no esperen a las escrituras
+    # - "primary": las lecturas usan el mismo pool que las escrituras
+    db_read_routing: Literal["read_pool", "primary"] = "read_pool"
+    read_database_url: Optional[str] = None
+    db_read_pool_size: int = 10
+    db_read_max_overflow: int = 20
+
+    # Tiempo máximo por sentencia (solo PostgreSQL); 0 = sin límite
+    db_statement_timeout_ms: int = 0
+
+    # Perfil de rendimiento SQLite (se aplica en cada conexión nueva)
+    sqlite_wal: bool = True
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_synchronous: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL"
+    sqlite_cache_size: int = -20000  # negativo = KiB (≈20 MB por conexión)
+    sqlite_mmap_size: int = 268435456  # 256 MB; 0 desactiva mmap
+    sqlite_temp_store: Literal["DEFAULT", "FILE", "MEMORY"] = "MEMORY"
+
+    # Nombre que aparece en los logs de arranque (útil con varios workers)
+    db_application_name: Optional[str] = "ece-medico"
+
+    # Búsqueda difusa de pacientes por trigramas (tolerante a tildes y errores de tipeo)
+    busqueda_similitud_minima: float = 0.3  # entre palabras, como pg_trgm.similarity_threshold
+    busqueda_max_variantes: int = 20  # palabras parecidas que se buscan por cada palabra de la consulta
+    busqueda_max_candidatos: int = 200  # pacientes que se puntúan por búsqueda
+
+    # Importación masiva de pacientes (POST /api/pacientes/import)
+    importacion_tam_lote: int = 1000  # filas por consulta de duplicados e INSERT
+    importacion_max_errores: int = 1000  # errores por fila incluidos en el reporte
+    # Un campo entre comillas sin cerrar se reporta como error de su fila en
+    # lugar de acumular el resto del archivo
+    importacion_max_lineas_registro: int = 50
+    importacion_max_kb_registro: int = 64
+
+    # Entradas por Bundle transaction/batch en POST /fhir
+    fhir_max_entradas: int = 1000
+    # Modo depuración: valida cada recurso FHIR generado con los modelos de fhir.resources
+    fhir_validar: bool = False
+    # JSON de recursos FHIR ya generados, por (recurso, id, versiones); 0 la desactiva.
+    # La versión es parte de la clave, así que el TTL solo libera memoria
+    fhir_cache_max_entradas: int = 2048
+    fhir_cache_ttl_segundos: int = 3600
+
+    # Exportación FHIR Bulk Data ($export): archivos NDJSON por tipo de recurso
+    export_directorio: str = "datos/exportaciones"
+    export_gzip: bool = False  # escribir .ndjson.gz
+    export_procesos: int = 1  # exportaciones en paralelo (procesos aparte)
+    export_max_pendientes: int = 4  # exportaciones en cola antes de responder 503
+    export_tam_bloque: int = 500  # filas por lectura (yield_per)
+    export_retencion_horas: int = 24  # luego se borran los archivos
+
+    # PDFs de recetas: se generan en memoria y se guardan en una caché LRU
+    # acotada por tamaño, con el hash de los datos de la receta como clave
+    pdf_cache_max_mb: int = 64
+    pdf_cache_max_entradas: int = 2048
+    pdf_cache_ttl_segundos: int = 86400
+    # Generación de PDFs en un pool de procesos: reportlab ocupa CPU y no debe
+    # frenar al resto de la API
+    pdf_procesos: int = 2
+    pdf_max_pendientes: int = 16  # PDFs en cola antes de responder 503
+    pdf_lote_max_recetas: int = 500  # recetas por documento en POST /api/recetas/pdf/batch
+    # Directorio donde antes se escribía cada PDF descargado; al iniciar la API
+    # se borran los que tengan más de pdf_retencion_legado_horas (0 = todos)
+    pdf_directorio_legado: str = "recetas"
+    pdf_retencion_legado_horas: int = 0
+
+    # Tokens: el access token es corto (los cambios de rol se reflejan al renovarlo)
+    # y el refresh token mantiene la sesión de un turno sin volver a pedir la contraseña
+    access_token_expire_minutes: int = 15
+    refresh_token_expire_minutes: int = 480
+
+    # jti revocados con /api/auth/logout (archivo compartido por los workers; None = solo memoria).
+    # Los archivos que escribe la API van bajo datos/ (ignorado por git)
+    revocacion_archivo: Optional[str] = "datos/revocaciones.log"
+    revocacion_sincronizar_segundos: float = 1.0
+
+    # Hash de contraseñas: costo de bcrypt (2^rounds iteraciones) y pool de procesos dedicado
+    bcrypt_rounds: int = 12
+    hash_procesos: int = 2
+    hash_max_pendientes: int = 32  # logins en cola antes de responder 503
+
+
+settings = Settings()
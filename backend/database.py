@@ -1,15 +1,198 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey
+import logging
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+from typing import Optional
+from backend.config import settings
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./ece_medico.db"
+logger = logging.getLogger(__name__)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+SQLALCHEMY_DATABASE_URL = settings.database_url
+
+_DRIVERS_ASINCRONOS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def _es_sqlite_en_memoria(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def aplicar_pragmas_sqlite(dbapi_connection, en_memoria: bool = False):
+    """
+    Aplica el perfil de concurrencia de SQLite sobre una conexión DBAPI:
+    WAL permite lectores simultáneos a un escritor y busy_timeout hace que
+    los escritores esperen el bloqueo en lugar de fallar con "database is locked"
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        # busy_timeout primero: cambiar journal_mode necesita un bloqueo exclusivo
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        if settings.sqlite_wal and not en_memoria:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA cache_size={int(settings.sqlite_cache_size)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+        cursor.execute(f"PRAGMA temp_store={settings.sqlite_temp_store}")
+    finally:
+        cursor.close()
+
+
+def _opciones_engine(url, asincrono: bool = False, solo_lectura: bool = False):
+    """Argumentos de conexión y de pool comunes a los engines de la aplicación"""
+    connect_args = {}
+    opciones = {"echo": settings.db_echo}
+
+    if url.get_backend_name() == "sqlite":
+        connect_args["check_same_thread"] = False
+        if _es_sqlite_en_memoria(url):
+            opciones["poolclass"] = StaticPool
+        elif asincrono:
+            opciones["poolclass"] = AsyncAdaptedQueuePool
+    elif url.get_backend_name() == "postgresql":
+        if asincrono:
+            # asyncpg recibe los parámetros del servidor como diccionario
+            server_settings = {}
+            if settings.db_statement_timeout_ms > 0:
+                server_settings["statement_timeout"] = str(settings.db_statement_timeout_ms)
+            if settings.db_application_name:
+                server_settings["application_name"] = settings.db_application_name
+            if server_settings:
+                connect_args["server_settings"] = server_settings
+        else:
+            parametros = []
+            if settings.db_statement_timeout_ms > 0:
+                parametros.append(f"-c statement_timeout={settings.db_statement_timeout_ms}")
+            if solo_lectura:
+                parametros.append("-c default_transaction_read_only=on")
+            if parametros:
+                connect_args["options"] = " ".join(parametros)
+            if settings.db_application_name:
+                connect_args["application_name"] = settings.db_application_name
+
+    if opciones.get("poolclass") is not StaticPool:
+        opciones.update(
+            pool_size=settings.db_read_pool_size if solo_lectura else settings.db_pool_size,
+            max_overflow=settings.db_read_max_overflow if solo_lectura else settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=settings.db_pool_pre_ping,
+        )
+    return connect_args, opciones
+
+
+def _registrar_pragmas(sync_engine, url, solo_lectura: bool = False):
+    if url.get_backend_name() != "sqlite":
+        return
+    en_memoria = _es_sqlite_en_memoria(url)
+
+    @event.listens_for(sync_engine, "connect")
+    def _al_conectar(dbapi_connection, connection_record):
+        aplicar_pragmas_sqlite(dbapi_connection, en_memoria)
+        if solo_lectura:
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA query_only=ON")
+            cursor.close()
+
+
+def crear_engine(database_url: str = SQLALCHEMY_DATABASE_URL, **kwargs):
+    """
+    Construye el engine a partir de la configuración.
+    - SQLite en archivo: QueuePool con el tamaño configurado y los PRAGMA
+      de concurrencia aplicados al abrir cada conexión
+    - SQLite en memoria: StaticPool (una sola conexión compartida)
+    - PostgreSQL: QueuePool + statement_timeout y application_name
+    """
+    url = make_url(database_url)
+    connect_args, opciones = _opciones_engine(url)
+    opciones.update(kwargs)
+    nuevo_engine = create_engine(url, connect_args=connect_args, **opciones)
+    _registrar_pragmas(nuevo_engine, url)
+    return nuevo_engine
+
+
+def crear_engine_lectura():
+    """
+    Engine para get_read_db según db_read_routing.
+    Con SQLite en memoria no hay otro archivo que abrir, así que se reutiliza
+    el engine principal
+    """
+    url = make_url(settings.read_database_url or SQLALCHEMY_DATABASE_URL)
+    if settings.db_read_routing == "primary" or _es_sqlite_en_memoria(url):
+        return engine
+    connect_args, opciones = _opciones_engine(url, solo_lectura=True)
+    nuevo_engine = create_engine(url, connect_args=connect_args, **opciones)
+    _registrar_pragmas(nuevo_engine, url, solo_lectura=True)
+    return nuevo_engine
+
+
+def url_asincrona(database_url: str = SQLALCHEMY_DATABASE_URL):
+    """Deriva la URL con driver asíncrono (aiosqlite / asyncpg) a partir de la síncrona"""
+    url = make_url(database_url)
+    driver = _DRIVERS_ASINCRONOS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No hay driver asíncrono configurado para {url.get_backend_name()}")
+    return url.set(drivername=driver)
+
+
+def crear_async_engine(database_url: Optional[str] = None, **kwargs):
+    """
+    Engine asíncrono para los endpoints async def, con el mismo pool y los
+    mismos PRAGMA que el engine síncrono
+    """
+    url = make_url(database_url) if database_url else url_asincrona()
+    connect_args, opciones = _opciones_engine(url, asincrono=True)
+    opciones.update(kwargs)
+    nuevo_engine = create_async_engine(url, connect_args=connect_args, **opciones)
+    _registrar_pragmas(nuevo_engine.sync_engine, url)
+    return nuevo_engine
+
+
+def reportar_pool(engine_a_reportar=None):
+    """Registra en el log el pool elegido para dimensionarlo según los workers"""
+    engine_a_reportar = engine_a_reportar or engine
+    pool = engine_a_reportar.pool
+    url = engine_a_reportar.url
+    detalle = {
+        "dialecto": url.get_backend_name(),
+        "base_datos": url.render_as_string(hide_password=True),
+        "pool": type(pool).__name__,
+    }
+    if hasattr(pool, "size"):
+        detalle.update(
+            pool_size=pool.size(),
+            max_overflow=pool._max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pre_ping=settings.db_pool_pre_ping,
+        )
+    if url.get_backend_name() == "sqlite":
+        detalle.update(
+            wal=settings.sqlite_wal,
+            busy_timeout_ms=settings.sqlite_busy_timeout_ms,
+            synchronous=settings.sqlite_synchronous,
+        )
+    if url.get_backend_name() == "postgresql":
+        detalle["statement_timeout_ms"] = settings.db_statement_timeout_ms
+    logger.info("Pool de base de datos: %s", ", ".join(f"{k}={v}" for k, v in detalle.items()))
+    return detalle
+
+
+engine = crear_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+read_engine = crear_engine_lectura()
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+async_engine = crear_async_engine(settings.async_database_url)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -17,4 +200,16 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    """Sesión para endpoints de solo lectura (ver db_read_routing)"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
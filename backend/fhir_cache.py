@@ -0,0 +1,91 @@
+"""
+Caché de recursos FHIR serializados y GET condicional con ETag.
+
+Cada respuesta lleva un ETag fuerte armado con las columnas version de las
+filas que componen el recurso (p. ej. receta, paciente y médico). Con
+If-None-Match se comparan solo esas versiones, leídas con una consulta
+chica, y si coinciden se responde 304 sin cargar relaciones ni convertir.
+Si no coinciden, el JSON se busca en una CacheLRU por (recurso, id,
+versiones) y solo se convierte cuando falta.
+"""
+import json
+import threading
+from typing import Callable, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import select
+
+from backend import models
+from backend.cache import CacheLRU
+from backend.config import settings
+
+cache_fhir = CacheLRU("fhir", settings.fhir_cache_max_entradas, settings.fhir_cache_ttl_segundos)
+
+_lock = threading.Lock()
+_no_modificados = 0
+
+Paciente, Usuario = models.Paciente, models.Usuario
+
+# Versiones de las filas que componen cada recurso, por id
+_VERSIONES = {
+    "Patient": lambda id_: select(Paciente.version).where(Paciente.id == id_),
+    "Encounter": lambda id_: (
+        select(models.Consulta.version, Paciente.version)
+        .join(Paciente, models.Consulta.paciente_id == Paciente.id)
+        .where(models.Consulta.id == id_)
+    ),
+    "receta": lambda id_: (
+        select(models.Receta.version, Paciente.version, Usuario.version)
+        .join(Paciente, models.Receta.paciente_id == Paciente.id)
+        .join(Usuario, models.Receta.medico_id == Usuario.id)
+        .where(models.Receta.id == id_)
+    ),
+    "laboratorio": lambda id_: (
+        select(models.OrdenLaboratorio.version, Paciente.version, Usuario.version)
+        .join(Paciente, models.OrdenLaboratorio.paciente_id == Paciente.id)
+        .join(Usuario, models.OrdenLaboratorio.medico_id == Usuario.id)
+        .where(models.OrdenLaboratorio.id == id_)
+    ),
+}
+
+
+def versiones(db, recurso: str, id_: int) -> Optional[Tuple[int, ...]]:
+    """Versiones actuales de las filas del recurso; None si no existe"""
+    fila = db.execute(_VERSIONES[recurso](id_)).first()
+    return tuple(fila) if fila else None
+
+
+def etag(recurso: str, id_: int, version: Tuple[int, ...]) -> str:
+    return f'"{recurso}-{id_}-{".".join(map(str, version))}"'
+
+
+def _coincide(if_none_match: Optional[str], etiqueta: str) -> bool:
+    # If-None-Match usa comparación débil: se ignora el prefijo W/
+    if not if_none_match:
+        return False
+    candidatos = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidatos or any(c.removeprefix("W/") == etiqueta for c in candidatos)
+
+
+def responder(request: Request, recurso: str, id_: int, version: Tuple[int, ...], construir: Callable[[], dict]) -> Response:
+    """
+    304 si el cliente ya tiene esta versión; si no, el JSON de la caché o el
+    que devuelve construir() (que solo se llama cuando falta en la caché)
+    """
+    global _no_modificados
+    etiqueta = etag(recurso, id_, version)
+    if _coincide(request.headers.get("if-none-match"), etiqueta):
+        with _lock:
+            _no_modificados += 1
+        return Response(status_code=304, headers={"ETag": etiqueta})
+
+    clave = (recurso, id_, version)
+    cuerpo = cache_fhir.obtener(clave)
+    if cuerpo is None:
+        cuerpo = json.dumps(construir(), ensure_ascii=False, separators=(",", ":")).encode()
+        cache_fhir.guardar(clave, cuerpo)
+    return Response(cuerpo, media_type="application/json", headers={"ETag": etiqueta})
+
+
+def estadisticas() -> dict:
+    return {"no_modificados": _no_modificados}
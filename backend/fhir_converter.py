@@ -1,56 +1,75 @@
-from datetime import datetime
-from fhir.resources.patient import Patient
-from fhir.resources.humanname import HumanName
-from fhir.resources.contactpoint import ContactPoint
-from fhir.resources.address import Address
-from fhir.resources.encounter import Encounter
-from fhir.resources.observation import Observation
-from fhir.resources.condition import Condition
-from fhir.resources.medicationrequest import MedicationRequest
-from fhir.resources.identifier import Identifier
-from fhir.resources.reference import Reference
-from fhir.resources.codeableconcept import CodeableConcept
-from fhir.resources.coding import Coding
+"""
+Conversión entre los modelos internos y recursos FHIR R4.
+
+Los recursos se arman directamente como dicts con tipos JSON (str, float,
+bool), en el mismo orden de campos y con las mismas omisiones que produce
+.dict() de fhir.resources, así que se pueden devolver o serializar sin
+pasar por pydantic. Con ECE_FHIR_VALIDAR=true (modo depuración) cada
+recurso se valida además con su modelo de fhir.resources.
+"""
+import re
+from datetime import datetime, timezone
+from typing import Optional
 from backend import models
+from backend.config import settings
+
+def _validado(recurso: dict) -> dict:
+    """En modo fhir_validar pasa el recurso por su modelo R4B (ValidationError si no es válido)"""
+    if settings.fhir_validar:
+        from fhir.resources.R4B import get_fhir_model_class
+        get_fhir_model_class(recurso["resourceType"]).parse_obj(recurso)
+    return recurso
+
+def bundle_coleccion(entradas: list) -> dict:
+    """Bundle de tipo collection a partir de pares (fullUrl, recurso)"""
+    return _validado({
+        "resourceType": "Bundle",
+        "type": "collection",
+        "entry": [{"fullUrl": full_url, "resource": recurso} for full_url, recurso in entradas]
+    })
+
+def _referencia(referencia: str, display: Optional[str] = None) -> dict:
+    if display is None:
+        return {"reference": referencia}
+    return {"reference": referencia, "display": display}
+
+def _referencia_paciente(paciente: models.Paciente) -> dict:
+    return _referencia(f"Patient/{paciente.id}", f"{paciente.nombre} {paciente.apellidos}")
+
+def _referencia_medico(medico: models.Usuario) -> dict:
+    return _referencia(f"Practitioner/{medico.id}", medico.nombre_completo)
+
+def _instante(fecha: datetime) -> str:
+    """Las fechas se guardan en UTC sin zona; el tipo instant de FHIR exige la zona"""
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return fecha.isoformat()
+
+def valor_json(valor):
+    """default= de json.dumps para las fechas y decimales que devuelve .dict() de fhir.resources"""
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    if hasattr(valor, "as_tuple"):
+        return float(valor)
+    raise TypeError(f"{type(valor).__name__} no es serializable a JSON")
+
+_DOSIS = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*(.*?)\s*$")
+
+def _dosis_fhir(dosis: str) -> list:
+    """"400 mg" -> doseQuantity 400 mg; si la dosis no empieza con un número queda solo en el texto"""
+    coincidencia = _DOSIS.match(dosis or "")
+    if not coincidencia:
+        return []
+    return [{
+        "doseQuantity": {
+            "value": float(coincidencia.group(1).replace(",", ".")),
+            "unit": coincidencia.group(2) or "unidad"
+        }
+    }]
 
 def paciente_to_fhir(paciente: models.Paciente) -> dict:
     """Convierte un paciente del modelo interno a FHIR Patient"""
     
-    # Crear nombre en formato FHIR
-    name = HumanName(
-        family=paciente.apellidos,
-        given=[paciente.nombre],
-        use="official"
-    )
-    
-    # Crear contacto (teléfono)
-    telecom = []
-    if paciente.telefono:
-        telecom.append(ContactPoint(
-            system="phone",
-            value=paciente.telefono,
-            use="mobile"
-        ))
-    if paciente.email:
-        telecom.append(ContactPoint(
-            system="email",
-            value=paciente.email
-        ))
-    
-    # Crear dirección
-    address = []
-    if paciente.direccion:
-        address.append(Address(
-            use="home",
-            text=paciente.direccion
-        ))
-    
-    # Crear identificador
-    identifier = [Identifier(
-        system="urn:oid:ece-medico",
-        value=paciente.identificacion
-    )]
-    
     # Determinar género en formato FHIR
     gender_map = {
         "Masculino": "male",
@@ -58,19 +77,49 @@ def paciente_to_fhir(paciente: models.Paciente) -> dict:
         "Otro": "other"
     }
     
-    # Crear recurso Patient FHIR
-    fhir_patient = Patient(
-        id=str(paciente.id),
-        identifier=identifier,
-        name=[name],
-        telecom=telecom,
-        gender=gender_map.get(paciente.genero, "unknown"),
-        birthDate=paciente.fecha_nacimiento.date() if paciente.fecha_nacimiento else None,
-        address=address,
-        active=True
-    )
-    
-    return fhir_patient.dict()
+    fhir_patient = {
+        "resourceType": "Patient",
+        "id": str(paciente.id),
+        "identifier": [{
+            "system": "urn:oid:ece-medico",
+            "value": paciente.identificacion
+        }],
+        "active": True,
+        "name": [{
+            "use": "official",
+            "family": paciente.apellidos,
+            "given": [paciente.nombre]
+        }]
+    }
+    
+    # Contacto (teléfono y email)
+    telecom = []
+    if paciente.telefono:
+        telecom.append({
+            "system": "phone",
+            "value": paciente.telefono,
+            "use": "mobile"
+        })
+    if paciente.email:
+        telecom.append({
+            "system": "email",
+            "value": paciente.email
+        })
+    if telecom:
+        fhir_patient["telecom"] = telecom
+    
+    fhir_patient["gender"] = gender_map.get(paciente.genero, "unknown")
+    if paciente.fecha_nacimiento:
+        fhir_patient["birthDate"] = paciente.fecha_nacimiento.date().isoformat()
+    
+    # Dirección
+    if paciente.direccion:
+        fhir_patient["address"] = [{
+            "use": "home",
+            "text": paciente.direccion
+        }]
+    
+    return _validado(fhir_patient)
 
 def fhir_to_paciente(fhir_patient: dict) -> dict:
     """Convierte un FHIR Patient a formato interno"""
@@ -129,31 +178,24 @@ def fhir_to_paciente(fhir_patient: dict) -> dict:
 def consulta_to_fhir_encounter(consulta: models.Consulta, paciente: models.Paciente) -> dict:
     """Convierte una consulta a FHIR Encounter"""
     
-    # Crear referencia al paciente
-    patient_reference = Reference(
-        reference=f"Patient/{paciente.id}",
-        display=f"{paciente.nombre} {paciente.apellidos}"
-    )
-    
-    # Crear Encounter
-    encounter = Encounter(
-        id=str(consulta.id),
-        status="finished",
-        class_fhir=Coding(
-            system="http://terminology.hl7.org/CodeSystem/v3-ActCode",
-            code="AMB",
-            display="ambulatory"
-        ),
-        subject=patient_reference,
-        period={
-            "start": consulta.fecha.isoformat()
+    encounter = {
+        "resourceType": "Encounter",
+        "id": str(consulta.id),
+        "status": "finished",
+        "class": {
+            "system": "http://terminology.hl7.org/CodeSystem/v3-ActCode",
+            "code": "AMB",
+            "display": "ambulatory"
         },
-        reasonCode=[CodeableConcept(
-            text=consulta.motivo
-        )]
-    )
+        "subject": _referencia_paciente(paciente),
+        "period": {
+            "start": consulta.fecha.isoformat()
+        }
+    }
+    if consulta.motivo:
+        encounter["reasonCode"] = [{"text": consulta.motivo}]
     
-    return encounter.dict()
+    return _validado(encounter)
 
 def consulta_to_fhir_bundle(consulta: models.Consulta, paciente: models.Paciente) -> dict:
     """
@@ -164,17 +206,12 @@ def consulta_to_fhir_bundle(consulta: models.Consulta, paciente: models.Paciente
     - MedicationRequest (tratamiento)
     """
     
-    from fhir.resources.bundle import Bundle, BundleEntry
-    from fhir.resources.quantity import Quantity
-    
     entries = []
+    subject = _referencia(f"Patient/{paciente.id}")
     
     # 1. Encounter (consulta)
     encounter = consulta_to_fhir_encounter(consulta, paciente)
-    entries.append(BundleEntry(
-        fullUrl=f"urn:uuid:encounter-{consulta.id}",
-        resource=encounter
-    ))
+    entries.append((f"urn:uuid:encounter-{consulta.id}", encounter))
     
     # 2. Observations (signos vitales)
     if consulta.signos_vitales:
@@ -187,212 +224,155 @@ def consulta_to_fhir_bundle(consulta: models.Consulta, paciente: models.Paciente
         
         # Presión arterial
         if 'PA' in signos and signos['PA']:
-            pa_obs = Observation(
-                id=f"obs-pa-{consulta.id}",
-                status="final",
-                code=CodeableConcept(
-                    coding=[Coding(
-                        system="http://loinc.org",
-                        code="85354-9",
-                        display="Blood pressure panel"
-                    )],
-                    text="Presión Arterial"
-                ),
-                subject=Reference(reference=f"Patient/{paciente.id}"),
-                valueString=signos['PA']
-            )
-            entries.append(BundleEntry(
-                fullUrl=f"urn:uuid:obs-pa-{consulta.id}",
-                resource=pa_obs.dict()
-            ))
+            pa_obs = {
+                "resourceType": "Observation",
+                "id": f"obs-pa-{consulta.id}",
+                "status": "final",
+                "code": {
+                    "coding": [{
+                        "system": "http://loinc.org",
+                        "code": "85354-9",
+                        "display": "Blood pressure panel"
+                    }],
+                    "text": "Presión Arterial"
+                },
+                "subject": subject,
+                "valueString": signos['PA']
+            }
+            entries.append((f"urn:uuid:obs-pa-{consulta.id}", _validado(pa_obs)))
         
         # Temperatura
         if 'T' in signos and signos['T'] and signos['T'] != '°C':
-            temp_obs = Observation(
-                id=f"obs-temp-{consulta.id}",
-                status="final",
-                code=CodeableConcept(
-                    coding=[Coding(
-                        system="http://loinc.org",
-                        code="8310-5",
-                        display="Body temperature"
-                    )],
-                    text="Temperatura"
-                ),
-                subject=Reference(reference=f"Patient/{paciente.id}"),
-                valueString=signos['T']
-            )
-            entries.append(BundleEntry(
-                fullUrl=f"urn:uuid:obs-temp-{consulta.id}",
-                resource=temp_obs.dict()
-            ))
+            temp_obs = {
+                "resourceType": "Observation",
+                "id": f"obs-temp-{consulta.id}",
+                "status": "final",
+                "code": {
+                    "coding": [{
+                        "system": "http://loinc.org",
+                        "code": "8310-5",
+                        "display": "Body temperature"
+                    }],
+                    "text": "Temperatura"
+                },
+                "subject": subject,
+                "valueString": signos['T']
+            }
+            entries.append((f"urn:uuid:obs-temp-{consulta.id}", _validado(temp_obs)))
     
     # 3. Condition (diagnóstico)
     if consulta.diagnostico:
-        condition = Condition(
-            id=f"condition-{consulta.id}",
-            clinicalStatus=CodeableConcept(
-                coding=[Coding(
-                    system="http://terminology.hl7.org/CodeSystem/condition-clinical",
-                    code="active"
-                )]
-            ),
-            code=CodeableConcept(
-                text=consulta.diagnostico
-            ),
-            subject=Reference(reference=f"Patient/{paciente.id}")
-        )
-        entries.append(BundleEntry(
-            fullUrl=f"urn:uuid:condition-{consulta.id}",
-            resource=condition.dict()
-        ))
+        condition = {
+            "resourceType": "Condition",
+            "id": f"condition-{consulta.id}",
+            "clinicalStatus": {
+                "coding": [{
+                    "system": "http://terminology.hl7.org/CodeSystem/condition-clinical",
+                    "code": "active"
+                }]
+            },
+            "code": {
+                "text": consulta.diagnostico
+            },
+            "subject": subject
+        }
+        entries.append((f"urn:uuid:condition-{consulta.id}", _validado(condition)))
     
     # 4. MedicationRequest (tratamiento)
     if consulta.tratamiento:
-        med_request = MedicationRequest(
-            id=f"medication-{consulta.id}",
-            status="active",
-            intent="order",
-            medicationCodeableConcept=CodeableConcept(
-                text=consulta.tratamiento
-            ),
-            subject=Reference(reference=f"Patient/{paciente.id}"),
-            authoredOn=consulta.fecha.isoformat()
-        )
-        entries.append(BundleEntry(
-            fullUrl=f"urn:uuid:medication-{consulta.id}",
-            resource=med_request.dict()
-        ))
-    
-    # Crear Bundle
-    bundle = Bundle(
-        type="collection",
-        entry=entries
-    )
+        med_request = {
+            "resourceType": "MedicationRequest",
+            "id": f"medication-{consulta.id}",
+            "status": "active",
+            "intent": "order",
+            "medicationCodeableConcept": {
+                "text": consulta.tratamiento
+            },
+            "subject": subject,
+            "authoredOn": consulta.fecha.isoformat()
+        }
+        entries.append((f"urn:uuid:medication-{consulta.id}", _validado(med_request)))
+    
+    return bundle_coleccion(entries)
+
 def receta_to_fhir_medication_request(receta: models.Receta, paciente: models.Paciente, medico: models.Usuario) -> dict:
-    """Convierte una receta a FHIR MedicationRequest"""
-    from fhir.resources.medicationrequest import MedicationRequest
-    from fhir.resources.dosage import Dosage
+    """Convierte una receta a FHIR MedicationRequest (uno por medicamento)"""
     
-    # Crear MedicationRequests para cada medicamento
-    medication_requests = []
+    subject = _referencia_paciente(paciente)
+    requester = _referencia_medico(medico)
+    status = "active" if receta.activa else "cancelled"
+    authored_on = receta.fecha_emision.isoformat()
     
-    # Función auxiliar para crear un MedicationRequest
-    def create_med_request(nombre, dosis, frecuencia, duracion, via, index):
-        dosage = Dosage(
-            text=f"{dosis} - {frecuencia} - {duracion}",
-            route=CodeableConcept(text=via),
-            doseAndRate=[{
-                "doseQuantity": {
-                    "value": dosis,
-                    "unit": "unidad"
-                }
-            }]
-        )
+    # Crear MedicationRequests para cada medicamento, en el orden de la receta
+    medication_requests = []
+    for med in receta.medicamentos:
+        dosage = {"text": f"{med.dosis} - {med.frecuencia} - {med.duracion}"}
+        if med.via:
+            dosage["route"] = {"text": med.via}
+        dose_and_rate = _dosis_fhir(med.dosis)
+        if dose_and_rate:
+            dosage["doseAndRate"] = dose_and_rate
         
-        med_request = MedicationRequest(
-            id=f"receta-{receta.id}-med-{index}",
-            status="active" if receta.activa else "cancelled",
-            intent="order",
-            medicationCodeableConcept=CodeableConcept(text=nombre),
-            subject=Reference(
-                reference=f"Patient/{paciente.id}",
-                display=f"{paciente.nombre} {paciente.apellidos}"
-            ),
-            requester=Reference(
-                reference=f"Practitioner/{medico.id}",
-                display=medico.nombre_completo
-            ),
-            authoredOn=receta.fecha_emision.isoformat(),
-            dosageInstruction=[dosage],
-            note=[{
-                "text": receta.indicaciones_generales or ""
-            }] if receta.indicaciones_generales else []
-        )
+        med_request = {
+            "resourceType": "MedicationRequest",
+            "id": f"receta-{receta.id}-med-{med.posicion}",
+            "status": status,
+            "intent": "order",
+            "medicationCodeableConcept": {"text": med.nombre},
+            "subject": subject,
+            "authoredOn": authored_on,
+            "requester": requester
+        }
+        if receta.indicaciones_generales:
+            med_request["note"] = [{"text": receta.indicaciones_generales}]
+        med_request["dosageInstruction"] = [dosage]
         
-        return med_request.dict()
-    
-    # Agregar medicamentos
-    if receta.medicamento1_nombre:
-        medication_requests.append(create_med_request(
-            receta.medicamento1_nombre,
-            receta.medicamento1_dosis,
-            receta.medicamento1_frecuencia,
-            receta.medicamento1_duracion,
-            receta.medicamento1_via,
-            1
-        ))
-    
-    if receta.medicamento2_nombre:
-        medication_requests.append(create_med_request(
-            receta.medicamento2_nombre,
-            receta.medicamento2_dosis,
-            receta.medicamento2_frecuencia,
-            receta.medicamento2_duracion,
-            receta.medicamento2_via,
-            2
-        ))
-    
-    if receta.medicamento3_nombre:
-        medication_requests.append(create_med_request(
-            receta.medicamento3_nombre,
-            receta.medicamento3_dosis,
-            receta.medicamento3_frecuencia,
-            receta.medicamento3_duracion,
-            receta.medicamento3_via,
-            3
-        ))
-    
-    if receta.medicamento4_nombre:
-        medication_requests.append(create_med_request(
-            receta.medicamento4_nombre,
-            receta.medicamento4_dosis,
-            receta.medicamento4_frecuencia,
-            receta.medicamento4_duracion,
-            receta.medicamento4_via,
-            4
-        ))
-    
-    if receta.medicamento5_nombre:
-        medication_requests.append(create_med_request(
-            receta.medicamento5_nombre,
-            receta.medicamento5_dosis,
-            receta.medicamento5_frecuencia,
-            receta.medicamento5_duracion,
-            receta.medicamento5_via,
-            5
-        ))
+        medication_requests.append(_validado(med_request))
     
     return medication_requests
 
 
 def receta_to_fhir_bundle(receta: models.Receta, paciente: models.Paciente, medico: models.Usuario) -> dict:
     """Convierte una receta completa a FHIR Bundle"""
-    from fhir.resources.bundle import Bundle, BundleEntry
-    
-    entries = []
     
-    # Agregar paciente
-    patient_fhir = paciente_to_fhir(paciente)
-    entries.append(BundleEntry(
-        fullUrl=f"urn:uuid:patient-{paciente.id}",
-        resource=patient_fhir
-    ))
+    entries = [(f"urn:uuid:patient-{paciente.id}", paciente_to_fhir(paciente))]
     
     # Agregar MedicationRequests
     medication_requests = receta_to_fhir_medication_request(receta, paciente, medico)
     for i, med_req in enumerate(medication_requests):
-        entries.append(BundleEntry(
-            fullUrl=f"urn:uuid:medication-request-{receta.id}-{i+1}",
-            resource=med_req
-        ))
+        entries.append((f"urn:uuid:medication-request-{receta.id}-{i+1}", med_req))
     
-    bundle = Bundle(
-        type="collection",
-        entry=entries
-    )
+    return bundle_coleccion(entries)
+
+def fhir_to_medicamento(resource: dict) -> dict:
+    """Convierte un FHIR MedicationRequest a un medicamento de receta interno"""
+    # Extraer información del medicamento
+    med_name = ""
+    if resource.get("medicationCodeableConcept"):
+        med_name = resource["medicationCodeableConcept"].get("text", "")
+    
+    dosage_text = ""
+    via = "Oral"
+    
+    if resource.get("dosageInstruction"):
+        dosage = resource["dosageInstruction"][0]
+        dosage_text = dosage.get("text", "")
+        if dosage.get("route"):
+            via = dosage["route"].get("text", "Oral")
+    
+    # Parsear dosage_text (formato: "dosis - frecuencia - duracion")
+    parts = dosage_text.split(" - ")
+    dosis = parts[0] if len(parts) > 0 else ""
+    frecuencia = parts[1] if len(parts) > 1 else ""
+    duracion = parts[2] if len(parts) > 2 else ""
     
-    return bundle.dict()
+    return {
+        "nombre": med_name,
+        "dosis": dosis,
+        "frecuencia": frecuencia,
+        "duracion": duracion,
+        "via": via
+    }
 
 
 def fhir_to_receta(fhir_bundle: dict, db) -> dict:
@@ -421,52 +401,18 @@ def fhir_to_receta(fhir_bundle: dict, db) -> dict:
                     receta_data["paciente_id"] = paciente.id
         
         elif resource_type == "MedicationRequest":
-            # Extraer información del medicamento
-            med_name = ""
-            if resource.get("medicationCodeableConcept"):
-                med_name = resource["medicationCodeableConcept"].get("text", "")
-            
-            dosage_text = ""
-            via = "Oral"
-            
-            if resource.get("dosageInstruction"):
-                dosage = resource["dosageInstruction"][0]
-                dosage_text = dosage.get("text", "")
-                if dosage.get("route"):
-                    via = dosage["route"].get("text", "Oral")
-            
-            # Parsear dosage_text (formato: "dosis - frecuencia - duracion")
-            parts = dosage_text.split(" - ")
-            dosis = parts[0] if len(parts) > 0 else ""
-            frecuencia = parts[1] if len(parts) > 1 else ""
-            duracion = parts[2] if len(parts) > 2 else ""
-            
-            medicamentos.append({
-                "nombre": med_name,
-                "dosis": dosis,
-                "frecuencia": frecuencia,
-                "duracion": duracion,
-                "via": via
-            })
+            medicamentos.append(fhir_to_medicamento(resource))
             
             # Extraer indicaciones generales
             if resource.get("note"):
                 receta_data["indicaciones_generales"] = resource["note"][0].get("text", "")
     
-    # Asignar medicamentos (máximo 5)
-    for i, med in enumerate(medicamentos[:5], 1):
-        receta_data[f"medicamento{i}_nombre"] = med["nombre"]
-        receta_data[f"medicamento{i}_dosis"] = med["dosis"]
-        receta_data[f"medicamento{i}_frecuencia"] = med["frecuencia"]
-        receta_data[f"medicamento{i}_duracion"] = med["duracion"]
-        receta_data[f"medicamento{i}_via"] = med["via"]
+    receta_data["medicamentos"] = medicamentos
     
     return receta_data
 
 def orden_laboratorio_to_fhir_diagnostic_report(orden: models.OrdenLaboratorio, paciente: models.Paciente, medico: models.Usuario) -> dict:
     """Convierte una orden de laboratorio a FHIR DiagnosticReport con Observations"""
-    from fhir.resources.diagnosticreport import DiagnosticReport
-    from fhir.resources.observation import Observation, ObservationReferenceRange
     
     # Mapeo de estados
     status_map = {
@@ -476,141 +422,222 @@ def orden_laboratorio_to_fhir_diagnostic_report(orden: models.OrdenLaboratorio,
         "cancelado": "cancelled"
     }
     
-    # Crear DiagnosticReport
-    diagnostic_report = DiagnosticReport(
-        id=f"lab-order-{orden.id}",
-        status=status_map.get(orden.estado, "unknown"),
-        code=CodeableConcept(
-            text="Panel de Laboratorio",
-            coding=[Coding(
-                system="http://loinc.org",
-                code="11502-2",
-                display="Laboratory report"
-            )]
-        ),
-        subject=Reference(
-            reference=f"Patient/{paciente.id}",
-            display=f"{paciente.nombre} {paciente.apellidos}"
-        ),
-        performer=[Reference(
-            reference=f"Practitioner/{medico.id}",
-            display=medico.nombre_completo
-        )],
-        effectiveDateTime=orden.fecha_orden.isoformat(),
-        issued=orden.fecha_resultado.isoformat() if orden.fecha_resultado else datetime.now().isoformat(),
-        conclusionCode=[CodeableConcept(
-            text=orden.diagnostico_presuntivo or "Diagnóstico no especificado"
-        )] if orden.diagnostico_presuntivo else None
-    )
+    subject = _referencia_paciente(paciente)
+    performer = [_referencia_medico(medico)]
+    effective = orden.fecha_orden.isoformat()
     
     # Agregar observaciones (resultados de exámenes)
     observations = []
     result_references = []
     
-    for i in range(1, 11):
-        codigo = getattr(orden, f"examen{i}_codigo_loinc")
-        if codigo:
-            nombre = getattr(orden, f"examen{i}_nombre")
-            resultado = getattr(orden, f"examen{i}_resultado")
-            valor_ref = getattr(orden, f"examen{i}_valor_referencia")
-            unidad = getattr(orden, f"examen{i}_unidad")
-            
-            # Crear Observation
-            obs = Observation(
-                id=f"obs-{orden.id}-{i}",
-                status="final" if resultado else "registered",
-                code=CodeableConcept(
-                    text=nombre,
-                    coding=[Coding(
-                        system="http://loinc.org",
-                        code=codigo,
-                        display=nombre
-                    )]
-                ),
-                subject=Reference(
-                    reference=f"Patient/{paciente.id}",
-                    display=f"{paciente.nombre} {paciente.apellidos}"
-                ),
-                effectiveDateTime=orden.fecha_orden.isoformat(),
-                performer=[Reference(
-                    reference=f"Practitioner/{medico.id}",
-                    display=medico.nombre_completo
-                )]
-            )
-            
-            # Agregar resultado si existe
-            if resultado:
-                # Intentar parsear como número
-                try:
-                    valor_numerico = float(resultado.replace(',', '.').split()[0])
-                    from fhir.resources.quantity import Quantity
-                    obs.valueQuantity = Quantity(
-                        value=valor_numerico,
-                        unit=unidad or "",
-                        system="http://unitsofmeasure.org",
-                        code=unidad or ""
-                    )
-                except (ValueError, AttributeError):
-                    # Si no es número, guardar como string
-                    obs.valueString = resultado
-                
-                # Agregar valor de referencia
-                if valor_ref:
-                    obs.referenceRange = [ObservationReferenceRange(
-                        text=valor_ref
-                    )]
+    for examen in orden.examenes:
+        i = examen.numero
+        nombre = examen.nombre
+        resultado = examen.resultado
+        unidad = examen.unidad
+        
+        coding = {"system": "http://loinc.org"}
+        if examen.codigo_loinc:
+            coding["code"] = examen.codigo_loinc
+        coding["display"] = nombre
+        
+        # Crear Observation
+        obs = {
+            "resourceType": "Observation",
+            "id": f"obs-{orden.id}-{i}",
+            "status": "final" if resultado else "registered",
+            "code": {
+                "coding": [coding],
+                "text": nombre
+            },
+            "subject": subject,
+            "effectiveDateTime": effective,
+            "performer": performer
+        }
+        
+        # Agregar resultado si existe
+        if resultado:
+            # Número con unidad como Quantity; sin unidad o si no es número, como string
+            try:
+                valor_numerico = float(resultado.replace(',', '.').split()[0])
+            except (ValueError, IndexError):
+                valor_numerico = None
+            if valor_numerico is not None and unidad:
+                obs["valueQuantity"] = {
+                    "value": valor_numerico,
+                    "unit": unidad,
+                    "system": "http://unitsofmeasure.org",
+                    "code": unidad
+                }
+            else:
+                obs["valueString"] = resultado
             
-            observations.append(obs.dict())
-            result_references.append(Reference(
-                reference=f"Observation/obs-{orden.id}-{i}",
-                display=nombre
-            ))
+            # Agregar valor de referencia
+            if examen.valor_referencia:
+                obs["referenceRange"] = [{"text": examen.valor_referencia}]
+        
+        observations.append(_validado(obs))
+        result_references.append(_referencia(f"Observation/obs-{orden.id}-{i}", nombre))
+    
+    # Crear DiagnosticReport
+    diagnostic_report = {
+        "resourceType": "DiagnosticReport",
+        "id": f"lab-order-{orden.id}",
+        "status": status_map.get(orden.estado, "unknown"),
+        "code": {
+            "coding": [{
+                "system": "http://loinc.org",
+                "code": "11502-2",
+                "display": "Laboratory report"
+            }],
+            "text": "Panel de Laboratorio"
+        },
+        "subject": subject,
+        "effectiveDateTime": effective,
+        "issued": _instante(orden.fecha_resultado or datetime.utcnow()),
+        "performer": performer
+    }
     
     # Agregar referencias a resultados en el DiagnosticReport
     if result_references:
-        diagnostic_report.result = result_references
+        diagnostic_report["result"] = result_references
+    if orden.diagnostico_presuntivo:
+        diagnostic_report["conclusionCode"] = [{"text": orden.diagnostico_presuntivo}]
     
     return {
-        "diagnosticReport": diagnostic_report.dict(),
+        "diagnosticReport": _validado(diagnostic_report),
         "observations": observations
     }
 
 
 def orden_laboratorio_to_fhir_bundle(orden: models.OrdenLaboratorio, paciente: models.Paciente, medico: models.Usuario) -> dict:
     """Convierte una orden de laboratorio completa a FHIR Bundle"""
-    from fhir.resources.bundle import Bundle, BundleEntry
-    
-    entries = []
     
-    # Agregar paciente
-    patient_fhir = paciente_to_fhir(paciente)
-    entries.append(BundleEntry(
-        fullUrl=f"urn:uuid:patient-{paciente.id}",
-        resource=patient_fhir
-    ))
+    entries = [(f"urn:uuid:patient-{paciente.id}", paciente_to_fhir(paciente))]
     
     # Agregar DiagnosticReport y Observations
     diagnostic_data = orden_laboratorio_to_fhir_diagnostic_report(orden, paciente, medico)
-    
-    # DiagnosticReport
-    entries.append(BundleEntry(
-        fullUrl=f"urn:uuid:diagnostic-report-{orden.id}",
-        resource=diagnostic_data["diagnosticReport"]
-    ))
-    
-    # Observations
+    entries.append((f"urn:uuid:diagnostic-report-{orden.id}", diagnostic_data["diagnosticReport"]))
     for i, obs in enumerate(diagnostic_data["observations"], 1):
-        entries.append(BundleEntry(
-            fullUrl=f"urn:uuid:observation-{orden.id}-{i}",
-            resource=obs
-        ))
+        entries.append((f"urn:uuid:observation-{orden.id}-{i}", obs))
+    
+    return bundle_coleccion(entries)
+
+
+# Modalidades DICOM por categoría de estudio (catálogo de la página de imagenología)
+MODALIDADES_DICOM = {
+    "Radiología Simple": ("DX", "Digital Radiography"),
+    "Tomografía Computarizada (TAC)": ("CT", "Computed Tomography"),
+    "Resonancia Magnética (RM)": ("MR", "Magnetic Resonance"),
+    "Ultrasonido": ("US", "Ultrasound"),
+}
+
+def orden_imagenologia_to_fhir(orden: models.OrdenImagenologia, paciente: models.Paciente, medico: models.Usuario) -> dict:
+    """Convierte una orden de imagenología a FHIR ServiceRequest con un ImagingStudy por estudio"""
+    
+    status_orden = {
+        "pendiente": "active",
+        "programado": "active",
+        "en_proceso": "active",
+        "completado": "completed",
+        "cancelado": "revoked"
+    }
+    status_estudio = {
+        "completado": "available",
+        "cancelado": "cancelled"
+    }
     
-    bundle = Bundle(
-        type="collection",
-        entry=entries
-    )
+    subject = _referencia_paciente(paciente)
+    
+    service_request = {
+        "resourceType": "ServiceRequest",
+        "id": f"img-order-{orden.id}",
+        "status": status_orden.get(orden.estado, "unknown"),
+        "intent": "order",
+        "category": [{
+            "coding": [{
+                "system": "http://snomed.info/sct",
+                "code": "363679005",
+                "display": "Imaging"
+            }]
+        }],
+        "priority": "urgent" if orden.urgente else "routine",
+        "code": {
+            "text": ", ".join(estudio.nombre for estudio in orden.estudios) or "Estudios de imagenología"
+        },
+        "subject": subject,
+        "authoredOn": orden.fecha_orden.isoformat(),
+        "requester": _referencia_medico(medico)
+    }
+    if orden.diagnostico_presuntivo:
+        service_request["reasonCode"] = [{"text": orden.diagnostico_presuntivo}]
+    notas = [{"text": texto} for texto in (orden.indicaciones_clinicas, orden.observaciones) if texto]
+    if notas:
+        service_request["note"] = notas
+    
+    imaging_studies = []
+    for estudio in orden.estudios:
+        codigo, nombre = MODALIDADES_DICOM.get(estudio.categoria, ("OT", "Other"))
+        imaging_study = {
+            "resourceType": "ImagingStudy",
+            "id": f"img-study-{orden.id}-{estudio.numero}",
+            "status": status_estudio.get(estudio.estado, "registered"),
+            "modality": [{
+                "system": "http://dicom.nema.org/resources/ontology/DCM",
+                "code": codigo,
+                "display": nombre
+            }],
+            "subject": subject,
+            "basedOn": [_referencia(f"ServiceRequest/img-order-{orden.id}")]
+        }
+        if estudio.resultado:
+            imaging_study["note"] = [{"text": estudio.resultado}]
+        imaging_study["description"] = estudio.nombre
+        imaging_studies.append(_validado(imaging_study))
     
-    return bundle.dict()
+    return {
+        "serviceRequest": _validado(service_request),
+        "imagingStudies": imaging_studies
+    }
+
+
+def fhir_to_examen(resource: dict) -> Optional[dict]:
+    """Convierte una FHIR Observation a un examen de laboratorio interno (None si no trae código LOINC y nombre)"""
+    codigo_loinc = ""
+    nombre = ""
+    resultado = ""
+    valor_ref = ""
+    unidad = ""
+    
+    if resource.get("code"):
+        if resource["code"].get("coding"):
+            coding = resource["code"]["coding"][0]
+            codigo_loinc = coding.get("code", "")
+            nombre = coding.get("display", "")
+        if not nombre:
+            nombre = resource["code"].get("text", "")
+    
+    # Extraer resultado
+    if resource.get("valueQuantity"):
+        valor = resource["valueQuantity"].get("value", "")
+        unidad = resource["valueQuantity"].get("unit", "")
+        resultado = str(valor)
+    elif resource.get("valueString"):
+        resultado = resource["valueString"]
+    
+    # Extraer valor de referencia
+    if resource.get("referenceRange"):
+        valor_ref = resource["referenceRange"][0].get("text", "")
+    
+    if not (codigo_loinc and nombre):
+        return None
+    return {
+        "codigo_loinc": codigo_loinc,
+        "nombre": nombre,
+        "resultado": resultado,
+        "valor_referencia": valor_ref,
+        "unidad": unidad
+    }
 
 
 def fhir_to_orden_laboratorio(fhir_bundle: dict, db) -> dict:
@@ -641,41 +668,9 @@ def fhir_to_orden_laboratorio(fhir_bundle: dict, db) -> dict:
                 orden_data["diagnostico_presuntivo"] = resource["conclusionCode"][0].get("text", "")
         
         elif resource_type == "Observation":
-            # Extraer información del examen
-            codigo_loinc = ""
-            nombre = ""
-            resultado = ""
-            valor_ref = ""
-            unidad = ""
-            
-            if resource.get("code"):
-                if resource["code"].get("coding"):
-                    coding = resource["code"]["coding"][0]
-                    codigo_loinc = coding.get("code", "")
-                    nombre = coding.get("display", "")
-                if not nombre:
-                    nombre = resource["code"].get("text", "")
-            
-            # Extraer resultado
-            if resource.get("valueQuantity"):
-                valor = resource["valueQuantity"].get("value", "")
-                unidad = resource["valueQuantity"].get("unit", "")
-                resultado = str(valor)
-            elif resource.get("valueString"):
-                resultado = resource["valueString"]
-            
-            # Extraer valor de referencia
-            if resource.get("referenceRange"):
-                valor_ref = resource["referenceRange"][0].get("text", "")
-            
-            if codigo_loinc and nombre:
-                orden_data["examenes"].append({
-                    "codigo_loinc": codigo_loinc,
-                    "nombre": nombre,
-                    "resultado": resultado,
-                    "valor_referencia": valor_ref,
-                    "unidad": unidad
-                })
+            examen = fhir_to_examen(resource)
+            if examen:
+                orden_data["examenes"].append(examen)
     
     return orden_data
     return bundle.dict()
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+Operación FHIR Patient/$everything en streaming.
+
+El Bundle (searchset) se escribe entrada por entrada: cada fila de la base
+se convierte a FHIR, se serializa y se descarta antes de pasar a la
+siguiente, así que la memoria no crece con el historial del paciente. Las
+filas se leen de a bloques con paginación keyset sobre los índices
+(paciente_id, fecha) de cada tabla.
+
+Orden del Bundle: Patient (solo en la primera página) y luego, sección por
+sección y de la más reciente a la más antigua, consultas, recetas, órdenes
+de laboratorio y órdenes de imagenología. `_count` cuenta las filas de
+origen (Encounter, MedicationRequest por receta, DiagnosticReport,
+ServiceRequest); los recursos que dependen de ellas (Observations,
+ImagingStudies) van en la misma página con search.mode = "include".
+"""
+import json
+from typing import Callable, Iterator, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import joinedload, selectinload
+
+from backend import fhir_converter, models
+from backend.database import ReadSessionLocal
+from backend.paginacion import codificar_cursor, decodificar_cursor, paginar
+
+TAM_BLOQUE = 100  # filas por consulta a la base
+
+
+class Seccion(NamedTuple):
+    modelo: type
+    columna_fecha: object
+    carga: tuple  # opciones de carga de relaciones que usa el conversor
+    recursos: Callable  # (fila, paciente) -> [(recurso, modo de búsqueda)]
+
+
+def _recursos_consulta(consulta, paciente):
+    return [(fhir_converter.consulta_to_fhir_encounter(consulta, paciente), "match")]
+
+
+def _recursos_receta(receta, paciente):
+    return [
+        (recurso, "match")
+        for recurso in fhir_converter.receta_to_fhir_medication_request(receta, paciente, receta.medico)
+    ]
+
+
+def _recursos_laboratorio(orden, paciente):
+    convertido = fhir_converter.orden_laboratorio_to_fhir_diagnostic_report(orden, paciente, orden.medico)
+    return [(convertido["diagnosticReport"], "match")] + [
+        (observacion, "include") for observacion in convertido["observations"]
+    ]
+
+
+def _recursos_imagenologia(orden, paciente):
+    convertido = fhir_converter.orden_imagenologia_to_fhir(orden, paciente, orden.medico)
+    return [(convertido["serviceRequest"], "match")] + [
+        (estudio, "include") for estudio in convertido["imagingStudies"]
+    ]
+
+
+SECCIONES = [
+    Seccion(models.Consulta, models.Consulta.fecha, (), _recursos_consulta),
+    Seccion(
+        models.Receta, models.Receta.fecha_emision,
+        (joinedload(models.Receta.medico), selectinload(models.Receta.medicamentos)),
+        _recursos_receta,
+    ),
+    Seccion(
+        models.OrdenLaboratorio, models.OrdenLaboratorio.fecha_orden,
+        (joinedload(models.OrdenLaboratorio.medico), selectinload(models.OrdenLaboratorio.examenes)),
+        _recursos_laboratorio,
+    ),
+    Seccion(
+        models.OrdenImagenologia, models.OrdenImagenologia.fecha_orden,
+        (joinedload(models.OrdenImagenologia.medico), selectinload(models.OrdenImagenologia.estudios)),
+        _recursos_imagenologia,
+    ),
+]
+
+
+def decodificar_posicion(cursor: Optional[str]) -> Tuple[int, Optional[str]]:
+    """
+    (índice de sección, cursor dentro de la sección) a partir del cursor de
+    la operación; HTTPException 400 si no es válido. Se valida en el
+    endpoint porque una vez iniciado el streaming ya no se puede responder
+    con un error
+    """
+    if not cursor:
+        return 0, None
+    # Todas las secciones ordenan por (DateTime, id): las columnas de
+    # Consulta sirven para interpretar los valores de cualquiera
+    seccion, fecha, id_fila = decodificar_cursor(
+        cursor, [models.Consulta.id, models.Consulta.fecha, models.Consulta.id]
+    )
+    if not isinstance(seccion, int) or not 0 <= seccion < len(SECCIONES):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+    return seccion, codificar_cursor([fecha, id_fila])
+
+
+def _filas(db, paciente_id: int, seccion: int, desde: Optional[str], bloque: int) -> Iterator[Tuple[int, object]]:
+    """(índice de sección, fila) desde la posición dada hasta el final del historial"""
+    for indice in range(seccion, len(SECCIONES)):
+        definicion = SECCIONES[indice]
+        columnas = [definicion.columna_fecha, definicion.modelo.id]
+        while True:
+            consulta = db.query(definicion.modelo).options(*definicion.carga).filter(
+                definicion.modelo.paciente_id == paciente_id
+            )
+            filas, desde = paginar(consulta, columnas, desde, bloque, descendente=True)
+            for fila in filas:
+                yield indice, fila
+            # Las filas ya convertidas no quedan retenidas por la sesión
+            db.expunge_all()
+            if desde is None:
+                break
+
+
+def _entrada(recurso: dict, modo: str, base_url: str) -> str:
+    return json.dumps({
+        "fullUrl": f"{base_url}/{recurso['resourceType']}/{recurso['id']}",
+        "resource": recurso,
+        "search": {"mode": modo},
+    }, default=fhir_converter.valor_json, ensure_ascii=False)
+
+
+def generar_everything(paciente_id: int, limite: int, cursor: Optional[str], url) -> Iterator[str]:
+    """
+    Fragmentos JSON del Bundle de una página de Patient/$everything.
+    `url` es la URL del request (starlette.datastructures.URL) para armar
+    fullUrl y los links. Abre su propia sesión de lectura: la del endpoint
+    ya está cerrada cuando se empieza a enviar el cuerpo
+    """
+    seccion, desde = decodificar_posicion(cursor)
+    base_url = str(url.replace(query="")).split("/Patient/")[0]
+    db = ReadSessionLocal()
+    try:
+        yield '{"resourceType":"Bundle","type":"searchset","entry":['
+        separador = ""
+        paciente = db.query(models.Paciente).filter(models.Paciente.id == paciente_id).first()
+        if not cursor:
+            yield _entrada(fhir_converter.paciente_to_fhir(paciente), "match", base_url)
+            separador = ","
+
+        siguiente = None
+        emitidas = 0
+        ultima = None
+        # Una fila más que el límite para saber si existe una página siguiente
+        for indice, fila in _filas(db, paciente_id, seccion, desde, min(TAM_BLOQUE, limite + 1)):
+            if emitidas == limite:
+                indice_ultima, fila_ultima = ultima
+                fecha = getattr(fila_ultima, SECCIONES[indice_ultima].columna_fecha.key)
+                siguiente = codificar_cursor([indice_ultima, fecha, fila_ultima.id])
+                break
+            for recurso, modo in SECCIONES[indice].recursos(fila, paciente):
+                yield separador + _entrada(recurso, modo, base_url)
+                separador = ","
+            emitidas += 1
+            ultima = (indice, fila)
+
+        links = [{"relation": "self", "url": str(url)}]
+        if siguiente:
+            links.append({
+                "relation": "next",
+                "url": str(url.include_query_params(_count=limite, _cursor=siguiente)),
+            })
+        yield '],"link":' + json.dumps(links) + "}"
+    finally:
+        db.close()
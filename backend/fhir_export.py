@@ -0,0 +1,323 @@
+"""
+Exportación FHIR Bulk Data ($export) como trabajos en segundo plano.
+
+Flujo (https://hl7.org/fhir/uv/bulkdata/export.html):
+- kick-off: GET /fhir/$export o /fhir/Patient/$export responde 202 con la
+  URL de estado en Content-Location
+- estado: GET /fhir/$export-status/{id} responde 202 con X-Progress mientras
+  corre y 200 con el manifiesto (un archivo por tipo de recurso) al terminar;
+  DELETE cancela el trabajo y borra sus archivos
+- descarga: GET /fhir/$export-files/{id}/{archivo}
+
+Cada trabajo corre en un proceso del pool "exportacion" y guarda todo en su
+directorio (export_directorio/{id}): estado.json, reescrito de forma atómica
+con el progreso, y un archivo NDJSON (opcionalmente gzip) por tipo de
+recurso. Así cualquier worker de la API puede responder el estado y servir
+los archivos. Las filas se leen con yield_per y cada recurso se escribe y se
+descarta, así que la memoria no depende del tamaño de la clínica.
+"""
+import gzip
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from backend import fhir_converter, models
+from backend.config import settings
+from backend.procesos import PoolProcesosAcotado
+
+pool_exportacion = PoolProcesosAcotado("exportacion", settings.export_procesos, settings.export_max_pendientes)
+
+ESTADO = "estado.json"
+CANCELADO = "cancelado"  # archivo marca: DELETE lo crea, el proceso lo revisa en cada bloque
+
+
+class Fuente(NamedTuple):
+    modelo: type
+    tipos: tuple  # tipos de recurso que produce cada fila
+    carga: tuple
+    recursos: Callable  # fila -> [recurso]
+
+
+def _recursos_laboratorio(orden):
+    convertido = fhir_converter.orden_laboratorio_to_fhir_diagnostic_report(orden, orden.paciente, orden.medico)
+    return [convertido["diagnosticReport"]] + convertido["observations"]
+
+
+def _recursos_imagenologia(orden):
+    convertido = fhir_converter.orden_imagenologia_to_fhir(orden, orden.paciente, orden.medico)
+    return [convertido["serviceRequest"]] + convertido["imagingStudies"]
+
+
+# _since filtra por fecha_modificacion, que se actualiza con cada cambio de la
+# fila o de sus filas hijas (ver models._incrementar_versiones)
+FUENTES = [
+    Fuente(
+        models.Paciente, ("Patient",), (),
+        lambda paciente: [fhir_converter.paciente_to_fhir(paciente)],
+    ),
+    Fuente(
+        models.Consulta, ("Encounter",), (joinedload(models.Consulta.paciente),),
+        lambda consulta: [fhir_converter.consulta_to_fhir_encounter(consulta, consulta.paciente)],
+    ),
+    Fuente(
+        models.Receta, ("MedicationRequest",),
+        (joinedload(models.Receta.paciente), joinedload(models.Receta.medico), selectinload(models.Receta.medicamentos)),
+        lambda receta: fhir_converter.receta_to_fhir_medication_request(receta, receta.paciente, receta.medico),
+    ),
+    Fuente(
+        models.OrdenLaboratorio, ("DiagnosticReport", "Observation"),
+        (
+            joinedload(models.OrdenLaboratorio.paciente),
+            joinedload(models.OrdenLaboratorio.medico),
+            selectinload(models.OrdenLaboratorio.examenes),
+        ),
+        _recursos_laboratorio,
+    ),
+    Fuente(
+        models.OrdenImagenologia, ("ServiceRequest", "ImagingStudy"),
+        (
+            joinedload(models.OrdenImagenologia.paciente),
+            joinedload(models.OrdenImagenologia.medico),
+            selectinload(models.OrdenImagenologia.estudios),
+        ),
+        _recursos_imagenologia,
+    ),
+]
+
+TIPOS = [tipo for fuente in FUENTES for tipo in fuente.tipos]
+
+
+# ==================== ARCHIVOS DEL TRABAJO ====================
+
+def _directorio(trabajo_id: str) -> Optional[str]:
+    """Directorio del trabajo; None si el id no tiene el formato esperado"""
+    try:
+        trabajo_id = uuid.UUID(hex=trabajo_id).hex
+    except ValueError:
+        return None
+    return os.path.join(settings.export_directorio, trabajo_id)
+
+
+def _guardar_estado(directorio: str, estado: dict):
+    temporal = os.path.join(directorio, f"{ESTADO}.tmp")
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(estado, archivo, ensure_ascii=False)
+    os.replace(temporal, os.path.join(directorio, ESTADO))
+
+
+def leer_estado(trabajo_id: str) -> Optional[dict]:
+    directorio = _directorio(trabajo_id)
+    if directorio is None or os.path.exists(os.path.join(directorio, CANCELADO)):
+        return None
+    try:
+        with open(os.path.join(directorio, ESTADO), encoding="utf-8") as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return None
+
+
+def ruta_archivo(trabajo_id: str, nombre: str) -> Optional[str]:
+    """Ruta de un archivo del manifiesto de un trabajo completado"""
+    estado = leer_estado(trabajo_id)
+    if not estado or estado["estado"] != "completado":
+        return None
+    if nombre not in {salida["archivo"] for salida in estado["salida"]}:
+        return None
+    return os.path.join(_directorio(trabajo_id), nombre)
+
+
+def limpiar_vencidos():
+    """Borra los trabajos más viejos que export_retencion_horas"""
+    if not os.path.isdir(settings.export_directorio):
+        return
+    limite = time.time() - settings.export_retencion_horas * 3600
+    for nombre in os.listdir(settings.export_directorio):
+        directorio = os.path.join(settings.export_directorio, nombre)
+        if os.path.isdir(directorio) and os.path.getmtime(directorio) < limite:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+
+# ==================== KICK-OFF, CANCELACIÓN Y MANIFIESTO ====================
+
+def crear_trabajo(tipos: Optional[List[str]], since: Optional[datetime], solicitud: str, usuario_id: int) -> str:
+    """
+    Registra el trabajo y lo envía al pool; PoolSaturado si ya hay
+    demasiadas exportaciones en curso. ValueError si algún tipo no se exporta
+    """
+    desconocidos = set(tipos or ()) - set(TIPOS)
+    if desconocidos:
+        raise ValueError(f"Tipos de recurso no soportados: {', '.join(sorted(desconocidos))}")
+    if since is not None and since.tzinfo is not None:
+        # Las fechas se guardan en UTC sin zona
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+
+    limpiar_vencidos()
+    trabajo_id = uuid.uuid4().hex
+    directorio = _directorio(trabajo_id)
+    os.makedirs(directorio)
+    _guardar_estado(directorio, {
+        "id": trabajo_id,
+        "estado": "en_cola",
+        "solicitud": solicitud,
+        "usuario_id": usuario_id,
+        "tipos": [tipo for tipo in TIPOS if not tipos or tipo in tipos],
+        "since": since.isoformat() if since else None,
+        "gzip": settings.export_gzip,
+        "creado": datetime.now(timezone.utc).isoformat(),
+    })
+    try:
+        pool_exportacion.enviar(ejecutar_exportacion, directorio)
+    except BaseException:
+        shutil.rmtree(directorio, ignore_errors=True)
+        raise
+    return trabajo_id
+
+
+def cancelar(trabajo_id: str) -> bool:
+    """
+    Marca el trabajo como cancelado: deja de aparecer en el estado y el
+    proceso que lo ejecuta se detiene en el próximo bloque y borra los
+    archivos. Si ya había terminado se borran ahora
+    """
+    estado = leer_estado(trabajo_id)
+    if estado is None:
+        return False
+    directorio = _directorio(trabajo_id)
+    if estado["estado"] in ("completado", "error"):
+        shutil.rmtree(directorio, ignore_errors=True)
+    else:
+        open(os.path.join(directorio, CANCELADO), "w").close()
+    return True
+
+
+def progreso(estado: dict) -> str:
+    """Valor de X-Progress"""
+    if estado["estado"] == "en_cola":
+        return "en cola"
+    avance = estado.get("progreso") or {}
+    total = avance.get("total") or 0
+    procesadas = avance.get("procesadas", 0)
+    porcentaje = procesadas * 100 // total if total else 0
+    return f"{porcentaje}% ({procesadas}/{total} filas, {avance.get('fuente', '')})"
+
+
+def manifiesto(estado: dict, url_archivos: str) -> dict:
+    return {
+        "transactionTime": estado["transactionTime"],
+        "request": estado["solicitud"],
+        "requiresAccessToken": True,
+        "output": [
+            {"type": salida["type"], "url": f"{url_archivos}/{salida['archivo']}", "count": salida["count"]}
+            for salida in estado["salida"]
+        ],
+        "error": [],
+    }
+
+
+# ==================== EJECUCIÓN (proceso del pool) ====================
+
+class _Cancelado(Exception):
+    pass
+
+
+class _Escritores:
+    """Un archivo NDJSON por tipo de recurso, abierto al escribir el primer recurso"""
+
+    def __init__(self, directorio: str, comprimir: bool):
+        self.directorio = directorio
+        self.comprimir = comprimir
+        self.archivos = {}
+        self.cantidades = {}
+
+    def escribir(self, recurso: dict):
+        tipo = recurso["resourceType"]
+        archivo = self.archivos.get(tipo)
+        if archivo is None:
+            nombre = f"{tipo}.ndjson.gz" if self.comprimir else f"{tipo}.ndjson"
+            ruta = os.path.join(self.directorio, nombre)
+            archivo = gzip.open(ruta, "wt", encoding="utf-8") if self.comprimir else open(ruta, "w", encoding="utf-8")
+            self.archivos[tipo] = archivo
+            self.cantidades[tipo] = 0
+        archivo.write(json.dumps(recurso, default=fhir_converter.valor_json, ensure_ascii=False, separators=(",", ":")))
+        archivo.write("\n")
+        self.cantidades[tipo] += 1
+
+    def cerrar(self):
+        for archivo in self.archivos.values():
+            archivo.close()
+
+    def salida(self, tipos: List[str]) -> list:
+        return [
+            {"type": tipo, "archivo": os.path.basename(self.archivos[tipo].name), "count": self.cantidades[tipo]}
+            for tipo in tipos if tipo in self.archivos
+        ]
+
+
+def _exportar(db, directorio: str, estado: dict):
+    tipos = set(estado["tipos"])
+    since = datetime.fromisoformat(estado["since"]) if estado["since"] else None
+    fuentes = [fuente for fuente in FUENTES if tipos.intersection(fuente.tipos)]
+
+    def consulta(fuente, *columnas):
+        q = select(*columnas) if columnas else select(fuente.modelo)
+        return q.where(fuente.modelo.fecha_modificacion >= since) if since is not None else q
+
+    total = sum(db.scalar(consulta(fuente, func.count(fuente.modelo.id))) for fuente in fuentes)
+    avance = {"procesadas": 0, "total": total}
+    estado.update(estado="en_curso", progreso=avance)
+    _guardar_estado(directorio, estado)
+
+    escritores = _Escritores(directorio, estado["gzip"])
+    try:
+        for fuente in fuentes:
+            avance["fuente"] = fuente.tipos[0]
+            # select() y no Query: Query agrega unique() con joinedload, que no admite yield_per
+            filas = db.scalars(
+                consulta(fuente).options(*fuente.carga).order_by(fuente.modelo.id)
+                .execution_options(yield_per=settings.export_tam_bloque)
+            )
+            for numero, fila in enumerate(filas, 1):
+                for recurso in fuente.recursos(fila):
+                    if recurso["resourceType"] in tipos:
+                        escritores.escribir(recurso)
+                avance["procesadas"] += 1
+                if numero % settings.export_tam_bloque == 0:
+                    if os.path.exists(os.path.join(directorio, CANCELADO)):
+                        raise _Cancelado()
+                    _guardar_estado(directorio, estado)
+    finally:
+        escritores.cerrar()
+    return escritores.salida(estado["tipos"])
+
+
+def ejecutar_exportacion(directorio: str):
+    """Ejecuta el trabajo guardado en directorio (corre en un proceso del pool)"""
+    from backend.database import ReadSessionLocal
+
+    with open(os.path.join(directorio, ESTADO), encoding="utf-8") as archivo:
+        estado = json.load(archivo)
+    if os.path.exists(os.path.join(directorio, CANCELADO)):
+        shutil.rmtree(directorio, ignore_errors=True)
+        return
+    # Las filas modificadas después de este instante pueden no estar incluidas
+    estado["transactionTime"] = datetime.now(timezone.utc).isoformat()
+    db = ReadSessionLocal()
+    try:
+        estado["salida"] = _exportar(db, directorio, estado)
+        estado["estado"] = "completado"
+    except _Cancelado:
+        shutil.rmtree(directorio, ignore_errors=True)
+        return
+    except Exception as e:
+        estado["estado"] = "error"
+        estado["error"] = str(e)
+    finally:
+        db.close()
+    _guardar_estado(directorio, estado)
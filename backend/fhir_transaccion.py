@@ -0,0 +1,401 @@
+"""
+Bundles FHIR de tipo transaction y batch (POST /fhir).
+
+Recursos admitidos (entry.request.method POST):
+- Patient: crea el paciente. Con request.ifNoneExist, si la identificación
+  ya está registrada se usa el paciente existente en lugar de fallar
+- MedicationRequest: un medicamento. Los MedicationRequest del mismo
+  paciente (y mismo groupIdentifier, si lo traen) forman una receta
+- DiagnosticReport: una orden de laboratorio, cuyos exámenes son las
+  Observation de este Bundle referenciadas en result
+- Observation: solo como resultado de un DiagnosticReport del Bundle
+
+El subject puede ser el fullUrl de otra entrada (urn:uuid:...),
+"Patient/{id}", "Patient?identifier=[sistema|]valor" o un identifier.
+Los pacientes referenciados por id o identificación se buscan con una sola
+consulta, cada tipo de recurso se inserta con un flush (más un INSERT
+masivo para medicamentos y exámenes) y todo se confirma con un único commit.
+
+Una entrada cuyos campos no tienen la forma JSON esperada (FORMAS) falla
+con 400 Bad Request como cualquier otro error de la entrada.
+
+transaction: si alguna entrada falla no se guarda nada y se responde con
+el OperationOutcome de esa entrada. batch: las entradas con error se
+informan en el Bundle de respuesta y las demás se guardan.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Optional, Tuple
+from urllib.parse import unquote
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.orm import Session
+
+from backend import fhir_converter, models
+from backend.config import settings
+
+ROLES_POR_RECURSO = {
+    "Patient": ["recepcion", "admin", "medico"],
+    "MedicationRequest": ["medico", "admin"],
+    "DiagnosticReport": ["medico", "admin"],
+    "Observation": ["medico", "admin"],
+}
+
+
+class ErrorEntrada(Exception):
+    """Error de una entrada del Bundle; estado es el status FHIR ("400 Bad Request")"""
+
+    def __init__(self, estado: str, mensaje: str):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+    @property
+    def codigo_http(self) -> int:
+        return int(self.estado.split()[0])
+
+
+class ErrorTransaccion(Exception):
+    """Una entrada de un Bundle transaction falló: no se guarda ninguna"""
+
+    def __init__(self, indice: int, error: ErrorEntrada):
+        super().__init__(f"entry[{indice}]: {error.mensaje}")
+        self.indice = indice
+        self.error = error
+
+
+# Forma JSON de los campos que se leen de cada entrada y recurso: {campo: forma}
+# es un objeto, [forma] una lista y un tipo es un valor de ese tipo. Los campos
+# ausentes (o null) se aceptan; el resto del recurso no se revisa
+_SUBJECT = {"reference": str, "identifier": {"value": str}}
+FORMA_ENTRADA = {"fullUrl": str, "request": {"method": str, "ifNoneExist": str}}
+FORMAS = {
+    "Patient": {
+        "identifier": [{"value": str}],
+        "name": [{"family": str, "given": [str]}],
+        "telecom": [{"system": str, "value": str}],
+        "address": [{"text": str}],
+        "gender": str,
+        "birthDate": str,
+    },
+    "MedicationRequest": {
+        "subject": _SUBJECT,
+        "medicationCodeableConcept": {"text": str},
+        "dosageInstruction": [{"text": str, "route": {"text": str}}],
+        "groupIdentifier": {"value": str},
+        "note": [{"text": str}],
+    },
+    "DiagnosticReport": {
+        "subject": _SUBJECT,
+        "result": [{"reference": str}],
+        "conclusionCode": [{"text": str}],
+    },
+    "Observation": {
+        "code": {"text": str, "coding": [{"code": str, "display": str}]},
+        "valueQuantity": {"value": float, "unit": str},
+        "valueString": str,
+        "referenceRange": [{"text": str}],
+    },
+}
+_NOMBRES_FORMA = {str: "un texto", float: "un número"}
+
+
+def validar_forma(valor, forma, ruta: str):
+    """ErrorEntrada 400 si valor (no null) no tiene la forma JSON esperada"""
+    if valor is None:
+        return
+    if isinstance(forma, dict):
+        if not isinstance(valor, dict):
+            raise ErrorEntrada("400 Bad Request", f"{ruta} debe ser un objeto")
+        for campo, forma_campo in forma.items():
+            validar_forma(valor.get(campo), forma_campo, f"{ruta}.{campo}")
+    elif isinstance(forma, list):
+        if not isinstance(valor, list) or None in valor:
+            elementos = "objetos" if isinstance(forma[0], dict) else "textos"
+            raise ErrorEntrada("400 Bad Request", f"{ruta} debe ser una lista de {elementos}")
+        for i, elemento in enumerate(valor):
+            validar_forma(elemento, forma[0], f"{ruta}[{i}]")
+    elif isinstance(valor, bool) or not isinstance(valor, (int, float) if forma is float else forma):
+        raise ErrorEntrada("400 Bad Request", f"{ruta} debe ser {_NOMBRES_FORMA[forma]}")
+
+
+def operation_outcome(mensaje: str, codigo: str = "processing") -> dict:
+    return {
+        "resourceType": "OperationOutcome",
+        "issue": [{"severity": "error", "code": codigo, "diagnostics": mensaje}],
+    }
+
+
+def _referencia_paciente(subject: Optional[dict]) -> Tuple[str, object]:
+    """("url", fullUrl) | ("id", id) | ("identificacion", valor)"""
+    subject = subject or {}
+    referencia = subject.get("reference") or ""
+    if referencia.startswith("urn:"):
+        return "url", referencia
+    if referencia.startswith("Patient?identifier="):
+        return "identificacion", unquote(referencia.split("=", 1)[1]).split("|")[-1]
+    if referencia.startswith("Patient/"):
+        id_paciente = referencia.split("/", 1)[1]
+        if not id_paciente.isdigit():
+            raise ErrorEntrada("404 Not Found", f"Paciente no encontrado: {referencia}")
+        return "id", int(id_paciente)
+    if (subject.get("identifier") or {}).get("value"):
+        return "identificacion", subject["identifier"]["value"]
+    raise ErrorEntrada("400 Bad Request", "subject debe referenciar a un Patient")
+
+
+class _Procesador:
+    def __init__(self, db: Session, bundle: dict, usuario):
+        self.db = db
+        self.usuario = usuario
+        self.transaccion = bundle["type"] == "transaction"
+        self.entradas = bundle.get("entry") or []
+        self.respuestas: List[Optional[dict]] = [None] * len(self.entradas)
+        self.por_url = {}  # fullUrl -> índice de la entrada
+        self.pacientes_creados = {}  # índice de la entrada Patient -> paciente_id
+
+    def fallar(self, indice: int, error: ErrorEntrada):
+        if self.transaccion:
+            raise ErrorTransaccion(indice, error)
+        self.respuestas[indice] = {
+            "response": {"status": error.estado, "outcome": operation_outcome(error.mensaje)}
+        }
+
+    def responder(self, indice: int, estado: str, ubicacion: str):
+        self.respuestas[indice] = {"response": {"status": estado, "location": ubicacion}}
+
+    def con_error(self, indice: int) -> bool:
+        return self.respuestas[indice] is not None
+
+    def clasificar(self) -> dict:
+        """Valida forma, método, tipo de recurso y permisos de cada entrada; las agrupa por tipo"""
+        por_tipo = defaultdict(list)
+        for indice, entrada in enumerate(self.entradas):
+            try:
+                validar_forma(entrada, {**FORMA_ENTRADA, "resource": {"resourceType": str}}, "entry")
+                if entrada.get("fullUrl"):
+                    self.por_url[entrada["fullUrl"]] = indice
+                recurso = entrada.get("resource") or {}
+                tipo = recurso.get("resourceType")
+                metodo = (entrada.get("request") or {}).get("method", "POST")
+                if metodo != "POST":
+                    raise ErrorEntrada("405 Method Not Allowed", f"Método no soportado: {metodo}")
+                if tipo not in ROLES_POR_RECURSO:
+                    raise ErrorEntrada("400 Bad Request", f"Recurso no soportado: {tipo}")
+                if self.usuario.rol not in ROLES_POR_RECURSO[tipo]:
+                    raise ErrorEntrada("403 Forbidden", f"Sin permisos para crear {tipo}")
+                validar_forma(recurso, FORMAS[tipo], tipo)
+                por_tipo[tipo].append(indice)
+            except ErrorEntrada as e:
+                self.fallar(indice, e)
+        return por_tipo
+
+    def buscar_pacientes(self, identificaciones: set, ids: set) -> Tuple[dict, set]:
+        """Una sola consulta para todos los pacientes referenciados: (identificacion -> id, ids existentes)"""
+        if not identificaciones and not ids:
+            return {}, set()
+        tabla = models.Paciente.__table__
+        filas = self.db.execute(
+            select(tabla.c.id, tabla.c.identificacion)
+            .where(or_(tabla.c.identificacion.in_(identificaciones), tabla.c.id.in_(ids)))
+        ).all()
+        return {f.identificacion: f.id for f in filas}, {f.id for f in filas}
+
+    def resolver_paciente(self, referencia: Tuple[str, object], por_identificacion: dict, ids: set) -> int:
+        tipo, valor = referencia
+        if tipo == "url":
+            destino = self.por_url.get(valor)
+            if destino is None or (self.entradas[destino].get("resource") or {}).get("resourceType") != "Patient":
+                raise ErrorEntrada("400 Bad Request", f"La referencia {valor} no es un Patient del Bundle")
+            if destino not in self.pacientes_creados:
+                raise ErrorEntrada("424 Failed Dependency", f"La entrada de {valor} tiene errores")
+            return self.pacientes_creados[destino]
+        if tipo == "id" and valor in ids:
+            return valor
+        if tipo == "identificacion" and valor in por_identificacion:
+            return por_identificacion[valor]
+        raise ErrorEntrada("404 Not Found", f"Paciente no encontrado: {valor}")
+
+    def procesar(self) -> dict:
+        por_tipo = self.clasificar()
+
+        # Referencias a pacientes de todas las entradas, para una sola consulta
+        referencias = {}
+        identificaciones, ids = set(), set()
+        for indice in por_tipo["Patient"]:
+            recurso = self.entradas[indice]["resource"]
+            identificacion = (recurso.get("identifier") or [{}])[0].get("value")
+            if identificacion:
+                identificaciones.add(identificacion)
+        for indice in por_tipo["MedicationRequest"] + por_tipo["DiagnosticReport"]:
+            try:
+                referencias[indice] = _referencia_paciente(self.entradas[indice]["resource"].get("subject"))
+            except ErrorEntrada as e:
+                self.fallar(indice, e)
+                continue
+            tipo, valor = referencias[indice]
+            if tipo == "id":
+                ids.add(valor)
+            elif tipo == "identificacion":
+                identificaciones.add(valor)
+        por_identificacion, ids_existentes = self.buscar_pacientes(identificaciones, ids)
+
+        self.crear_pacientes(por_tipo["Patient"], por_identificacion)
+        pacientes = {}
+        for indice, referencia in referencias.items():
+            try:
+                pacientes[indice] = self.resolver_paciente(referencia, por_identificacion, ids_existentes)
+            except ErrorEntrada as e:
+                self.fallar(indice, e)
+        self.crear_recetas([i for i in por_tipo["MedicationRequest"] if i in pacientes], pacientes)
+        self.crear_ordenes([i for i in por_tipo["DiagnosticReport"] if i in pacientes], pacientes)
+
+        for indice in por_tipo["Observation"]:
+            if not self.con_error(indice):
+                self.fallar(indice, ErrorEntrada(
+                    "400 Bad Request", "La Observation debe ser result de un DiagnosticReport válido del Bundle"
+                ))
+
+        self.db.commit()
+        return {
+            "resourceType": "Bundle",
+            "type": f"{'transaction' if self.transaccion else 'batch'}-response",
+            "entry": self.respuestas,
+        }
+
+    def crear_pacientes(self, indices: List[int], por_identificacion: dict):
+        nuevos = []
+        vistos = set()
+        for indice in indices:
+            entrada = self.entradas[indice]
+            try:
+                datos = fhir_converter.fhir_to_paciente(entrada["resource"])
+                identificacion = datos["identificacion"]
+                if not identificacion:
+                    raise ErrorEntrada("400 Bad Request", "Patient sin identifier")
+                if identificacion in por_identificacion:
+                    if not (entrada.get("request") or {}).get("ifNoneExist"):
+                        raise ErrorEntrada("409 Conflict", "Paciente ya existe")
+                    self.pacientes_creados[indice] = por_identificacion[identificacion]
+                    self.responder(indice, "200 OK", f"Patient/{por_identificacion[identificacion]}")
+                    continue
+                if identificacion in vistos:
+                    raise ErrorEntrada("409 Conflict", "Identificación repetida en el Bundle")
+                try:
+                    fecha_nacimiento = datetime.fromisoformat(datos["fecha_nacimiento"]) if datos["fecha_nacimiento"] else None
+                except ValueError:
+                    raise ErrorEntrada("400 Bad Request", "birthDate inválida")
+            except ErrorEntrada as e:
+                self.fallar(indice, e)
+                continue
+            vistos.add(identificacion)
+            nuevos.append((indice, models.Paciente(**{**datos, "fecha_nacimiento": fecha_nacimiento})))
+
+        self.db.add_all([paciente for _, paciente in nuevos])
+        self.db.flush()
+        for indice, paciente in nuevos:
+            self.pacientes_creados[indice] = paciente.id
+            por_identificacion[paciente.identificacion] = paciente.id  # para referencias por identifier
+            self.responder(indice, "201 Created", f"Patient/{paciente.id}")
+
+    def crear_recetas(self, indices: List[int], pacientes: dict):
+        # Una receta por paciente y groupIdentifier, con los medicamentos en el orden del Bundle
+        grupos = defaultdict(list)
+        for indice in indices:
+            recurso = self.entradas[indice]["resource"]
+            medicamento = fhir_converter.fhir_to_medicamento(recurso)
+            if not medicamento["nombre"]:
+                self.fallar(indice, ErrorEntrada("400 Bad Request", "MedicationRequest sin medicationCodeableConcept.text"))
+                continue
+            grupo = (recurso.get("groupIdentifier") or {}).get("value")
+            grupos[(pacientes[indice], grupo)].append((indice, medicamento, recurso))
+        if not grupos:
+            return
+
+        recetas = []
+        for (paciente_id, _), medicamentos in grupos.items():
+            notas = [r["note"][0].get("text", "") for _, _, r in medicamentos if r.get("note")]
+            recetas.append(models.Receta(
+                paciente_id=paciente_id,
+                medico_id=self.usuario.id,
+                indicaciones_generales=notas[0] if notas else None,
+                activa=True
+            ))
+        self.db.add_all(recetas)
+        self.db.flush()
+
+        filas = []
+        for receta, medicamentos in zip(recetas, grupos.values()):
+            for posicion, (indice, med, _) in enumerate(medicamentos, 1):
+                filas.append({"receta_id": receta.id, "posicion": posicion, **med})
+                self.responder(indice, "201 Created", f"MedicationRequest/receta-{receta.id}-med-{posicion}")
+        self.db.execute(insert(models.RecetaMedicamento), filas)
+
+    def crear_ordenes(self, indices: List[int], pacientes: dict):
+        preparadas = []
+        usadas = set()  # una Observation solo puede ser examen de una orden
+        for indice in indices:
+            recurso = self.entradas[indice]["resource"]
+            try:
+                observaciones = []
+                for resultado in recurso.get("result") or []:
+                    destino = self.por_url.get(resultado.get("reference"))
+                    observacion = self.entradas[destino].get("resource") if destino is not None else None
+                    if not observacion or observacion.get("resourceType") != "Observation":
+                        raise ErrorEntrada("400 Bad Request", f"result {resultado.get('reference')} no es una Observation del Bundle")
+                    if destino in usadas:
+                        raise ErrorEntrada("400 Bad Request", f"{resultado['reference']} ya es result de otro DiagnosticReport")
+                    if self.con_error(destino):
+                        raise ErrorEntrada("424 Failed Dependency", f"La entrada de {resultado['reference']} tiene errores")
+                    examen = fhir_converter.fhir_to_examen(observacion)
+                    if not examen:
+                        raise ErrorEntrada("400 Bad Request", f"{resultado['reference']} no trae código LOINC y nombre")
+                    observaciones.append((destino, examen))
+                if not observaciones:
+                    raise ErrorEntrada("400 Bad Request", "La orden debe tener al menos un examen")
+            except ErrorEntrada as e:
+                self.fallar(indice, e)
+                continue
+            usadas.update(destino for destino, _ in observaciones)
+            completa = all(examen.get("resultado") for _, examen in observaciones)
+            conclusion = recurso.get("conclusionCode") or [{}]
+            orden = models.OrdenLaboratorio(
+                paciente_id=pacientes[indice],
+                medico_id=self.usuario.id,
+                diagnostico_presuntivo=conclusion[0].get("text") or None,
+                estado="completado" if completa else "pendiente",
+                fecha_resultado=datetime.utcnow() if completa else None
+            )
+            preparadas.append((indice, orden, observaciones))
+        if not preparadas:
+            return
+
+        self.db.add_all([orden for _, orden, _ in preparadas])
+        self.db.flush()
+
+        filas = []
+        for indice, orden, observaciones in preparadas:
+            self.responder(indice, "201 Created", f"DiagnosticReport/lab-order-{orden.id}")
+            for numero, (destino, examen) in enumerate(observaciones, 1):
+                filas.append({"orden_id": orden.id, "numero": numero, **examen})
+                self.responder(destino, "201 Created", f"Observation/obs-{orden.id}-{numero}")
+        self.db.execute(insert(models.ExamenLaboratorio), filas)
+
+
+def procesar_bundle(db: Session, bundle: dict, usuario) -> dict:
+    """
+    Aplica un Bundle transaction o batch y devuelve el Bundle de respuesta.
+    ValueError si el Bundle no es válido; ErrorTransaccion si falla una
+    entrada de un transaction (en ambos casos no se guarda nada)
+    """
+    if bundle.get("resourceType") != "Bundle" or bundle.get("type") not in ("transaction", "batch"):
+        raise ValueError("Se esperaba un Bundle de tipo transaction o batch")
+    if bundle.get("entry") is not None and not isinstance(bundle["entry"], list):
+        raise ValueError("Bundle.entry debe ser una lista")
+    if len(bundle.get("entry") or []) > settings.fhir_max_entradas:
+        raise ValueError(f"El Bundle supera el máximo de {settings.fhir_max_entradas} entradas")
+    try:
+        return _Procesador(db, bundle, usuario).procesar()
+    except Exception:
+        db.rollback()
+        raise
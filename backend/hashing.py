@@ -0,0 +1,26 @@
+"""
+Hash de contraseñas con bcrypt.
+
+Módulo liviano a propósito: se importa en los procesos del pool de hash
+(backend.auth.pool_hash), que no deben cargar la base de datos ni FastAPI.
+"""
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+from backend.config import settings
+
+# bcrypt__min_rounds marca para rehash los hashes con un costo menor al configurado
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+)
+
+
+def hashear(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verificar_y_actualizar(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """(válida, hash nuevo si el actual usa un costo o esquema desactualizado)"""
+    return pwd_context.verify_and_update(password, password_hash)
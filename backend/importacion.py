@@ -0,0 +1,275 @@
+"""
+Importación masiva de pacientes (alta de una clínica nueva).
+
+El archivo llega como cuerpo del request (CSV con encabezado o NDJSON, un
+objeto por línea) y se procesa a medida que se recibe, sin cargarlo entero
+en memoria. Las filas válidas se agrupan en lotes: por lote se buscan los
+duplicados en la base con una sola consulta y los pacientes nuevos se
+insertan con un único INSERT de varias filas.
+
+Cada lote se confirma por separado: si la importación se corta, lo ya
+importado queda guardado y volver a enviar el archivo solo agrega lo que
+falta (las filas existentes se reportan como duplicadas).
+"""
+import codecs
+import csv
+import json
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend import busqueda, models
+from backend.config import settings
+
+CAMPOS_OBLIGATORIOS = ("identificacion", "nombre", "apellidos", "fecha_nacimiento", "genero")
+CAMPOS_OPCIONALES = ("telefono", "email", "direccion")
+
+
+class ResultadoImportacion:
+    """Contadores y reporte de errores por fila (se guardan los primeros max_errores)"""
+
+    def __init__(self, max_errores: int):
+        self.max_errores = max_errores
+        self.total = 0
+        self.creados = 0
+        self.duplicados = 0
+        self.con_error = 0
+        self.errores = []
+
+    def error(self, fila: int, identificacion: Optional[str], mensaje: str, duplicado: bool = False):
+        if duplicado:
+            self.duplicados += 1
+        else:
+            self.con_error += 1
+        if len(self.errores) < self.max_errores:
+            self.errores.append({"fila": fila, "identificacion": identificacion, "error": mensaje})
+
+    def a_dict(self) -> dict:
+        return {
+            "mensaje": "Importación finalizada",
+            "total": self.total,
+            "creados": self.creados,
+            "duplicados": self.duplicados,
+            "con_error": self.con_error,
+            "errores": self.errores,
+            "errores_truncados": self.duplicados + self.con_error > len(self.errores),
+        }
+
+
+# ==================== LECTURA INCREMENTAL ====================
+
+async def _lineas(fragmentos: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    """Líneas completas (con su salto de línea) de cada fragmento recibido"""
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+    resto = ""
+    async for fragmento in fragmentos:
+        partes = (resto + decodificador.decode(fragmento)).split("\n")
+        resto = partes.pop()
+        if partes:
+            yield [f"{parte}\n" for parte in partes]
+    resto += decodificador.decode(b"", final=True)
+    if resto:
+        yield [resto]
+
+
+def _comillas_abiertas(linea: str, abiertas: bool) -> bool:
+    """
+    Si al final de la línea queda abierto un campo entre comillas. Como en
+    csv.reader, una comilla solo abre un campo cuando está al principio del
+    campo; en medio de un campo sin comillas (O"Neil) es un carácter más
+    """
+    i = linea.find('"')
+    while i != -1:
+        if abiertas:
+            if linea.startswith('"', i + 1):
+                i += 1  # "" es una comilla dentro del campo
+            else:
+                abiertas = False
+        elif i == 0 or linea[i - 1] == ",":
+            abiertas = True
+        i = linea.find('"', i + 1)
+    return abiertas
+
+
+async def filas_csv(fragmentos: AsyncIterator[bytes]):
+    """
+    (número de fila, datos, error) por registro del CSV. La primera fila es
+    el encabezado; los números de fila cuentan desde la primera fila de datos
+    """
+    encabezado = None
+    numero = 0
+    pendiente = []  # líneas del registro con un campo entre comillas abierto
+    caracteres = 0
+    abiertas = False
+    max_lineas = settings.importacion_max_lineas_registro
+    max_caracteres = settings.importacion_max_kb_registro * 1024
+
+    def registros(lineas: List[str], final: bool = False) -> List[Optional[str]]:
+        # Un campo entre comillas puede contener saltos de línea: el registro
+        # termina en la primera línea que cierra las comillas. None es un
+        # registro cuyas comillas no se cierran
+        nonlocal pendiente, caracteres, abiertas
+        cola = deque(lineas)
+        completos = []
+        while cola or (final and pendiente):
+            if cola:
+                linea = cola.popleft()
+                pendiente.append(linea)
+                caracteres += len(linea)
+                abiertas = _comillas_abiertas(linea, abiertas)
+                if not abiertas:
+                    completos.append("".join(pendiente))
+                    pendiente, caracteres = [], 0
+                    continue
+                if len(pendiente) <= max_lineas and caracteres <= max_caracteres:
+                    continue
+            # Sin cerrar dentro del límite o al terminar el archivo: la primera
+            # línea es un registro con error y las demás se leen otra vez
+            completos.append(None)
+            cola.extendleft(reversed(pendiente[1:]))
+            pendiente, caracteres, abiertas = [], 0, False
+        return completos
+
+    def filas(completos: List[Optional[str]]):
+        nonlocal encabezado, numero
+        for registro in completos:
+            if registro is None:
+                numero += 1
+                yield numero, None, "Comillas sin cerrar"
+                continue
+            valores = next(csv.reader([registro]), [])
+            if not any(v.strip() for v in valores):
+                continue
+            if encabezado is None:
+                encabezado = [v.strip().lower() for v in valores]
+                continue
+            numero += 1
+            if len(valores) != len(encabezado):
+                yield numero, None, f"Se esperaban {len(encabezado)} columnas y hay {len(valores)}"
+            else:
+                yield numero, dict(zip(encabezado, valores)), None
+
+    async for lineas in _lineas(fragmentos):
+        for fila in filas(registros(lineas)):
+            yield fila
+    for fila in filas(registros([], final=True)):
+        yield fila
+
+
+async def filas_ndjson(fragmentos: AsyncIterator[bytes]):
+    """(número de fila, datos, error) por línea no vacía del NDJSON"""
+    numero = 0
+    async for lineas in _lineas(fragmentos):
+        for linea in lineas:
+            if not linea.strip():
+                continue
+            numero += 1
+            try:
+                datos = json.loads(linea)
+            except ValueError:
+                yield numero, None, "JSON inválido"
+                continue
+            if not isinstance(datos, dict):
+                yield numero, None, "Se esperaba un objeto JSON"
+                continue
+            yield numero, datos, None
+
+
+def validar_fila(datos: dict) -> dict:
+    """Fila lista para insertar en pacientes; ValueError con el motivo si no es válida"""
+    fila = {}
+    for campo in CAMPOS_OBLIGATORIOS:
+        valor = datos.get(campo)
+        fila[campo] = "" if valor is None else str(valor).strip()
+        if not fila[campo]:
+            raise ValueError(f"Falta el campo '{campo}'")
+    for campo in CAMPOS_OPCIONALES:
+        valor = datos.get(campo)
+        fila[campo] = "" if valor is None else str(valor).strip()
+    try:
+        fila["fecha_nacimiento"] = datetime.fromisoformat(fila["fecha_nacimiento"])
+    except ValueError:
+        raise ValueError("fecha_nacimiento debe tener formato AAAA-MM-DD")
+    # Los INSERT masivos no pasan por los eventos del mapper (ver busqueda.indexar_trigramas)
+    fila["nombre_normalizado"] = busqueda.nombre_normalizado(fila["nombre"], fila["apellidos"])
+    return fila
+
+
+# ==================== ESCRITURA POR LOTES ====================
+
+async def _guardar_lote(db: AsyncSession, lote: List[Tuple[int, dict]], resultado: ResultadoImportacion, palabras_indexadas: set):
+    tabla = models.Paciente.__table__
+    for intento in range(2):
+        existentes = set((await db.execute(
+            select(tabla.c.identificacion)
+            .where(tabla.c.identificacion.in_([fila["identificacion"] for _, fila in lote]))
+        )).scalars())
+        nuevos = [fila for _, fila in lote if fila["identificacion"] not in existentes]
+        # Solo las palabras que esta importación todavía no agregó al vocabulario:
+        # los nombres se repiten mucho y cada palabra son varias filas de trigramas
+        palabras = {p for fila in nuevos for p in fila["nombre_normalizado"].split()} - palabras_indexadas
+        try:
+            if nuevos:
+                await db.execute(insert(tabla), nuevos)
+            if palabras:
+                conexion = await db.connection()
+                await conexion.run_sync(busqueda.indexar_trigramas, palabras)
+            await db.commit()
+            break
+        except IntegrityError:
+            # Otro request creó alguno de estos pacientes entre la consulta y el
+            # INSERT: se vuelve a consultar una vez y esos quedan como duplicados
+            await db.rollback()
+            if intento:
+                raise
+
+    palabras_indexadas.update(palabras)
+    resultado.creados += len(nuevos)
+    for numero, fila in lote:
+        if fila["identificacion"] in existentes:
+            resultado.error(numero, fila["identificacion"], "Paciente ya existe", duplicado=True)
+
+
+async def importar_pacientes(
+    db: AsyncSession,
+    fragmentos: AsyncIterator[bytes],
+    formato: str = "csv",
+    tam_lote: Optional[int] = None,
+) -> dict:
+    """Importa los pacientes del archivo recibido en fragmentos; formato "csv" o "ndjson" """
+    tam_lote = tam_lote or settings.importacion_tam_lote
+    resultado = ResultadoImportacion(settings.importacion_max_errores)
+    filas = filas_ndjson(fragmentos) if formato == "ndjson" else filas_csv(fragmentos)
+    vistos = {}  # identificacion -> primera fila del archivo que la trae
+    palabras_indexadas = set()
+    lote = []
+
+    async for numero, datos, error in filas:
+        resultado.total += 1
+        identificacion = datos.get("identificacion") if datos else None
+        if error is None:
+            try:
+                fila = validar_fila(datos)
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            resultado.error(numero, identificacion, error)
+            continue
+
+        primera = vistos.setdefault(fila["identificacion"], numero)
+        if primera != numero:
+            resultado.error(numero, fila["identificacion"], f"Identificación repetida (fila {primera})", duplicado=True)
+            continue
+
+        lote.append((numero, fila))
+        if len(lote) >= tam_lote:
+            await _guardar_lote(db, lote, resultado, palabras_indexadas)
+            lote = []
+
+    if lote:
+        await _guardar_lote(db, lote, resultado, palabras_indexadas)
+    return resultado.a_dict()
@@ -1,20 +1,45 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from sqlalchemy import bindparam, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from typing import Optional, List
-from backend.database import engine, get_db, Base
-from backend import models, fhir_converter
-from backend.pdf_generator import generar_receta_pdf
+from contextlib import asynccontextmanager
+import gzip
+import logging
+from backend.config import settings
+from backend.database import engine, read_engine, async_engine, get_db, get_read_db, get_async_db, reportar_pool
+from backend import models, fhir_cache, fhir_converter, fhir_everything, fhir_export, fhir_transaccion, busqueda, importacion, recetas_pdf
+from backend.migraciones import aplicar_migraciones
+from backend.paginacion import (
+    LIMITE_POR_DEFECTO,
+    LIMITE_MAXIMO,
+    aplicar_cursor,
+    cortar_pagina,
+    paginar,
+    respuesta_paginada,
+)
+from backend.cache import estadisticas_caches
+from backend.procesos import PoolSaturado, estadisticas_pools
 from backend.loinc_catalog import EXAMENES_LOINC, obtener_examenes_por_categoria, buscar_examen
 from backend.auth import (
     get_current_user, 
-    authenticate_user, 
+    get_token_usuario,
+    TokenUsuario,
+    autenticar_usuario, 
+    claims_usuario,
     create_access_token, 
-    get_password_hash,
+    create_refresh_token,
+    decodificar_token,
+    oauth2_scheme_opcional,
+    revocaciones,
+    revocar_token,
+    hashear_password,
+    pool_hash,
     require_roles,
     get_current_admin,
     get_current_medico,
@@ -23,9 +48,34 @@ from backend.auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="ECE Médico API", version="1.0.0")
+logging.basicConfig(level=logging.INFO)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El esquema se crea al iniciar y no al importar el módulo: importar la
+    # app (tests, workers que se reinician) no toca la base
+    if settings.db_auto_migrate:
+        aplicar_migraciones(engine)
+    recetas_pdf.limpiar_directorio_legado()
+    reportar_pool()
+    if read_engine is not engine:
+        reportar_pool(read_engine)
+    reportar_pool(async_engine)
+    yield
+    pool_hash.cerrar()
+    fhir_export.pool_exportacion.cerrar()
+    recetas_pdf.pool_pdf.cerrar()
+    await async_engine.dispose()
+
+app = FastAPI(title="ECE Médico API", version="1.0.0", lifespan=lifespan)
+
+@app.exception_handler(PoolSaturado)
+async def pool_saturado(request: Request, exc: PoolSaturado):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Servidor ocupado, intente de nuevo en unos segundos"},
+        headers={"Retry-After": str(exc.reintentar_en)},
+    )
 
 app.add_middleware(
     CORSMiddleware,
@@ -53,9 +103,16 @@ class UsuarioResponse(BaseModel):
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str
     usuario: UsuarioResponse
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class PacienteCreate(BaseModel):
     identificacion: str
     nombre: str
@@ -96,34 +153,26 @@ class CitaUpdate(BaseModel):
     estado: Optional[str] = None
     notas: Optional[str] = None
 
+class MedicamentoReceta(BaseModel):
+    nombre: str
+    dosis: str = ""
+    frecuencia: str = ""
+    duracion: str = ""
+    via: str = "Oral"
+
 class RecetaCreate(BaseModel):
     paciente_id: int
-    medicamento1_nombre: str
-    medicamento1_dosis: str
-    medicamento1_frecuencia: str
-    medicamento1_duracion: str
-    medicamento1_via: str
-    medicamento2_nombre: Optional[str] = None
-    medicamento2_dosis: Optional[str] = None
-    medicamento2_frecuencia: Optional[str] = None
-    medicamento2_duracion: Optional[str] = None
-    medicamento2_via: Optional[str] = None
-    medicamento3_nombre: Optional[str] = None
-    medicamento3_dosis: Optional[str] = None
-    medicamento3_frecuencia: Optional[str] = None
-    medicamento3_duracion: Optional[str] = None
-    medicamento3_via: Optional[str] = None
-    medicamento4_nombre: Optional[str] = None
-    medicamento4_dosis: Optional[str] = None
-    medicamento4_frecuencia: Optional[str] = None
-    medicamento4_duracion: Optional[str] = None
-    medicamento4_via: Optional[str] = None
-    medicamento5_nombre: Optional[str] = None
-    medicamento5_dosis: Optional[str] = None
-    medicamento5_frecuencia: Optional[str] = None
-    medicamento5_duracion: Optional[str] = None
-    medicamento5_via: Optional[str] = None
+    medicamentos: List[MedicamentoReceta]
     indicaciones_generales: Optional[str] = None
+
+class LotePdfRecetas(BaseModel):
+    """Recetas por id, o por fecha de emisión (desde/hasta inclusive), médico y/o paciente"""
+    ids: Optional[List[int]] = None
+    desde: Optional[date] = None
+    hasta: Optional[date] = None
+    medico_id: Optional[int] = None
+    paciente_id: Optional[int] = None
+
 class ExamenLaboratorio(BaseModel):
     codigo_loinc: str
     nombre: str
@@ -150,15 +199,30 @@ def root():
 def health_check():
     return {"status": "ok", "database": "connected", "fhir": "enabled"}
 
+@app.get("/api/metricas")
+def metricas(current_user: TokenUsuario = Depends(get_current_admin)):
+    """Contadores de las cachés en memoria de este worker - Solo admin"""
+    return {
+        "caches": estadisticas_caches(),
+        "fhir_condicional": fhir_cache.estadisticas(),
+        "pools": estadisticas_pools(),
+        "recetas_pdf": recetas_pdf.estadisticas(),
+        "revocaciones": revocaciones.estadisticas(),
+    }
+
 # ==================== AUTENTICACIÓN ====================
 
 @app.post("/api/auth/register", response_model=UsuarioResponse)
-def register(usuario: UsuarioCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.Usuario).filter(models.Usuario.username == usuario.username).first()
+async def register(usuario: UsuarioCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = (await db.execute(
+        select(models.Usuario).where(models.Usuario.username == usuario.username)
+    )).scalar_one_or_none()
     if db_user:
         raise HTTPException(status_code=400, detail="Usuario ya existe")
     
-    db_email = db.query(models.Usuario).filter(models.Usuario.email == usuario.email).first()
+    db_email = (await db.execute(
+        select(models.Usuario).where(models.Usuario.email == usuario.email)
+    )).scalar_one_or_none()
     if db_email:
         raise HTTPException(status_code=400, detail="Email ya registrado")
     
@@ -167,7 +231,7 @@ def register(usuario: UsuarioCreate, db: Session = Depends(get_db)):
     if usuario.rol not in roles_validos:
         raise HTTPException(status_code=400, detail=f"Rol inválido. Roles válidos: {', '.join(roles_validos)}")
     
-    password_hash = get_password_hash(usuario.password)
+    password_hash = await hashear_password(usuario.password)
     new_user = models.Usuario(
         username=usuario.username,
         email=usuario.email,
@@ -178,14 +242,14 @@ def register(usuario: UsuarioCreate, db: Session = Depends(get_db)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return new_user
 
 @app.post("/api/auth/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await autenticar_usuario(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -196,13 +260,49 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     if not user.activo:
         raise HTTPException(status_code=400, detail="Usuario inactivo")
     
+    return _respuesta_token(user)
+
+@app.post("/api/auth/refresh", response_model=Token)
+async def refresh(datos: RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    """Renueva el access token con el rol y estado actuales del usuario"""
+    payload = decodificar_token(datos.refresh_token, tipo="refresh")
+    user = await db.get(models.Usuario, payload.get("uid"))
+    # Rotación: cada refresh token se usa una sola vez. La revocación es
+    # atómica: de dos renovaciones simultáneas con el mismo token, solo una
+    # lo revoca y la otra recibe 401
+    if not user or user.username != payload["sub"] or not user.activo or not revocar_token(payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sesión expirada, inicie sesión nuevamente",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return _respuesta_token(user)
+
+@app.post("/api/auth/logout")
+def logout(datos: Optional[LogoutRequest] = None, token: Optional[str] = Depends(oauth2_scheme_opcional)):
+    """
+    Revoca el access token (cabecera Authorization) y el refresh token de la
+    sesión. No exige un access token vigente: si ya venció no hay nada que revocar
+    """
+    refresh_token = datos.refresh_token if datos else None
+    for valor, tipo in ((token, "access"), (refresh_token, "refresh")):
+        if not valor:
+            continue
+        try:
+            revocar_token(decodificar_token(valor, tipo=tipo))
+        except HTTPException:
+            pass  # vencido, inválido o ya revocado
+    return {"mensaje": "Sesión cerrada exitosamente"}
+
+def _respuesta_token(user: models.Usuario) -> dict:
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=claims_usuario(user), expires_delta=access_token_expires
     )
     
     return {
         "access_token": access_token,
+        "refresh_token": create_refresh_token(user),
         "token_type": "bearer",
         "usuario": {
             "id": user.id,
@@ -222,8 +322,8 @@ def get_me(current_user: models.Usuario = Depends(get_current_user)):
 
 @app.get("/api/usuarios")
 def listar_usuarios(
-    current_user: models.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: Session = Depends(get_read_db)
 ):
     """Listar todos los usuarios activos"""
     usuarios = db.query(models.Usuario).filter(models.Usuario.activo == True).all()
@@ -233,18 +333,51 @@ def listar_usuarios(
 
 @app.get("/api/pacientes")
 def listar_pacientes(
-    current_user: models.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limite: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    todos: bool = False,
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: Session = Depends(get_read_db)
+):
+    """Listar pacientes por páginas (todos=true devuelve la lista completa) - Todos los roles autenticados"""
+    query = db.query(models.Paciente)
+    if todos:
+        return query.order_by(models.Paciente.id).all()
+    
+    pacientes, siguiente = paginar(query, [models.Paciente.id], cursor, limite)
+    return respuesta_paginada(pacientes, siguiente)
+
+@app.get("/api/pacientes/buscar")
+def buscar_pacientes(
+    q: str = Query(..., min_length=1, max_length=200),
+    limite: int = Query(20, ge=1, le=100, alias="limit"),
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: Session = Depends(get_read_db)
+):
+    """Buscar pacientes por nombre, apellidos, identificación, teléfono o email (prefijos, por relevancia)"""
+    return busqueda.buscar_pacientes(db, q, limite)
+
+@app.post("/api/pacientes/import")
+async def importar_pacientes(
+    request: Request,
+    formato: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    current_user: TokenUsuario = Depends(require_roles(["recepcion", "admin"])),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Listar pacientes - Acceso para todos los roles autenticados"""
-    pacientes = db.query(models.Paciente).all()
-    return pacientes
+    """
+    Importar pacientes en bloque - Solo recepción y admin.
+    El cuerpo es el archivo: CSV con encabezado (text/csv) o NDJSON
+    (application/x-ndjson); formato= tiene prioridad sobre el Content-Type
+    """
+    if formato is None:
+        formato = "ndjson" if "json" in request.headers.get("content-type", "") else "csv"
+    return await importacion.importar_pacientes(db, request.stream(), formato)
 
 @app.get("/api/pacientes/{paciente_id}")
 def obtener_paciente(
     paciente_id: int,
-    current_user: models.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: Session = Depends(get_read_db)
 ):
     """Obtener paciente - Acceso para todos los roles autenticados"""
     paciente = db.query(models.Paciente).filter(models.Paciente.id == paciente_id).first()
@@ -255,7 +388,7 @@ def obtener_paciente(
 @app.post("/api/pacientes")
 def crear_paciente(
     paciente: PacienteCreate,
-    current_user: models.Usuario = Depends(require_roles(["recepcion", "admin", "medico"])),
+    current_user: TokenUsuario = Depends(require_roles(["recepcion", "admin", "medico"])),
     db: Session = Depends(get_db)
 ):
     """Crear paciente - Solo recepción, médicos y admin"""
@@ -287,7 +420,7 @@ def crear_paciente(
 def actualizar_paciente(
     paciente_id: int,
     paciente_update: PacienteUpdate,
-    current_user: models.Usuario = Depends(require_roles(["recepcion", "admin"])),
+    current_user: TokenUsuario = Depends(require_roles(["recepcion", "admin"])),
     db: Session = Depends(get_db)
 ):
     """Actualizar datos de contacto del paciente - Solo recepción y admin"""
@@ -313,7 +446,7 @@ def actualizar_paciente(
 @app.post("/api/consultas")
 def crear_consulta(
     consulta: ConsultaCreate,
-    current_user: models.Usuario = Depends(require_roles(["medico", "admin"])),
+    current_user: TokenUsuario = Depends(require_roles(["medico", "admin"])),
     db: Session = Depends(get_db)
 ):
     """Crear consulta - Solo médicos y admin"""
@@ -341,21 +474,26 @@ def crear_consulta(
 @app.get("/api/consultas/paciente/{paciente_id}")
 def obtener_consultas_paciente(
     paciente_id: int,
-    current_user: models.Usuario = Depends(require_roles(["medico", "enfermera", "admin"])),
-    db: Session = Depends(get_db)
+    limite: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    todos: bool = False,
+    current_user: TokenUsuario = Depends(require_roles(["medico", "enfermera", "admin"])),
+    db: Session = Depends(get_read_db)
 ):
-    """Ver consultas - Solo personal médico"""
-    consultas = db.query(models.Consulta).filter(
-        models.Consulta.paciente_id == paciente_id
-    ).order_by(models.Consulta.fecha.desc()).all()
+    """Ver consultas (más recientes primero) - Solo personal médico"""
+    query = db.query(models.Consulta).filter(models.Consulta.paciente_id == paciente_id)
+    orden = [models.Consulta.fecha, models.Consulta.id]
+    if todos:
+        return query.order_by(*[c.desc() for c in orden]).all()
     
-    return consultas
+    consultas, siguiente = paginar(query, orden, cursor, limite, descendente=True)
+    return respuesta_paginada(consultas, siguiente)
 
 @app.get("/api/consultas/{consulta_id}")
 def obtener_consulta(
     consulta_id: int,
-    current_user: models.Usuario = Depends(require_roles(["medico", "enfermera", "admin"])),
-    db: Session = Depends(get_db)
+    current_user: TokenUsuario = Depends(require_roles(["medico", "enfermera", "admin"])),
+    db: Session = Depends(get_read_db)
 ):
     """Ver consulta específica - Solo personal médico"""
     consulta = db.query(models.Consulta).filter(models.Consulta.id == consulta_id).first()
@@ -368,7 +506,7 @@ def obtener_consulta(
 @app.post("/api/citas")
 def crear_cita(
     cita: CitaCreate,
-    current_user: models.Usuario = Depends(require_roles(["recepcion", "admin", "medico"])),
+    current_user: TokenUsuario = Depends(require_roles(["recepcion", "admin", "medico"])),
     db: Session = Depends(get_db)
 ):
     """Crear cita - Recepción, médicos y admin"""
@@ -416,11 +554,17 @@ def listar_citas(
     medico_id: Optional[int] = None,
     paciente_id: Optional[int] = None,
     estado: Optional[str] = None,
-    current_user: models.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limite: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    todos: bool = False,
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: Session = Depends(get_read_db)
 ):
-    """Listar citas - Todos los roles autenticados"""
-    query = db.query(models.Cita)
+    """Listar citas por horario - Todos los roles autenticados"""
+    query = db.query(models.Cita).options(
+        joinedload(models.Cita.paciente),
+        joinedload(models.Cita.medico)
+    )
     
     if fecha_desde:
         query = query.filter(models.Cita.fecha_hora >= datetime.fromisoformat(fecha_desde))
@@ -437,12 +581,16 @@ def listar_citas(
     if estado:
         query = query.filter(models.Cita.estado == estado)
     
-    citas = query.order_by(models.Cita.fecha_hora).all()
+    orden = [models.Cita.fecha_hora, models.Cita.id]
+    if todos:
+        citas, siguiente = query.order_by(*orden).all(), None
+    else:
+        citas, siguiente = paginar(query, orden, cursor, limite)
     
     resultado = []
     for cita in citas:
-        paciente = db.query(models.Paciente).filter(models.Paciente.id == cita.paciente_id).first()
-        medico = db.query(models.Usuario).filter(models.Usuario.id == cita.medico_id).first()
+        paciente = cita.paciente
+        medico = cita.medico
         
         resultado.append({
             "id": cita.id,
@@ -455,24 +603,29 @@ def listar_citas(
             "motivo": cita.motivo,
             "estado": cita.estado,
             "notas": cita.notas,
-            "creado_en": cita.creado_en.isoformat()
+            "creado_en": cita.fecha_creacion.isoformat() if cita.fecha_creacion else None
         })
     
-    return resultado
+    if todos:
+        return resultado
+    return respuesta_paginada(resultado, siguiente)
 
 @app.get("/api/citas/{cita_id}")
 def obtener_cita(
     cita_id: int,
-    current_user: models.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: Session = Depends(get_read_db)
 ):
     """Obtener cita - Todos los roles autenticados"""
-    cita = db.query(models.Cita).filter(models.Cita.id == cita_id).first()
+    cita = db.query(models.Cita).options(
+        joinedload(models.Cita.paciente),
+        joinedload(models.Cita.medico)
+    ).filter(models.Cita.id == cita_id).first()
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
     
-    paciente = db.query(models.Paciente).filter(models.Paciente.id == cita.paciente_id).first()
-    medico = db.query(models.Usuario).filter(models.Usuario.id == cita.medico_id).first()
+    paciente = cita.paciente
+    medico = cita.medico
     
     return {
         "id": cita.id,
@@ -491,7 +644,7 @@ def obtener_cita(
 def actualizar_cita(
     cita_id: int,
     cita_update: CitaUpdate,
-    current_user: models.Usuario = Depends(require_roles(["recepcion", "admin", "medico"])),
+    current_user: TokenUsuario = Depends(require_roles(["recepcion", "admin", "medico"])),
     db: Session = Depends(get_db)
 ):
     """Actualizar cita - Recepción, médicos y admin"""
@@ -520,7 +673,7 @@ def actualizar_cita(
 @app.delete("/api/citas/{cita_id}")
 def cancelar_cita(
     cita_id: int,
-    current_user: models.Usuario = Depends(require_roles(["recepcion", "admin", "medico"])),
+    current_user: TokenUsuario = Depends(require_roles(["recepcion", "admin", "medico"])),
     db: Session = Depends(get_db)
 ):
     """Cancelar cita - Recepción, médicos y admin"""
@@ -537,10 +690,45 @@ def cancelar_cita(
 
 # ==================== RECETAS MÉDICAS ====================
 
+def _guardar_receta(db: Session, paciente_id: int, medico_id: int, medicamentos: List[dict], indicaciones: Optional[str]):
+    """Inserta la receta y sus medicamentos (un solo INSERT masivo para los medicamentos)"""
+    db_receta = models.Receta(
+        paciente_id=paciente_id,
+        medico_id=medico_id,
+        indicaciones_generales=indicaciones,
+        activa=True
+    )
+    db.add(db_receta)
+    db.flush()
+    
+    db.execute(insert(models.RecetaMedicamento), [
+        {
+            "receta_id": db_receta.id,
+            "posicion": posicion,
+            "nombre": med["nombre"],
+            "dosis": med.get("dosis", ""),
+            "frecuencia": med.get("frecuencia", ""),
+            "duracion": med.get("duracion", ""),
+            "via": med.get("via") or "Oral"
+        }
+        for posicion, med in enumerate(medicamentos, 1)
+    ])
+    return db_receta
+
+def _medicamento_a_dict(med: models.RecetaMedicamento) -> dict:
+    return {
+        "posicion": med.posicion,
+        "nombre": med.nombre,
+        "dosis": med.dosis,
+        "frecuencia": med.frecuencia,
+        "duracion": med.duracion,
+        "via": med.via
+    }
+
 @app.post("/api/recetas")
 def crear_receta(
     receta: RecetaCreate,
-    current_user: models.Usuario = Depends(require_roles(["medico", "admin"])),
+    current_user: TokenUsuario = Depends(require_roles(["medico", "admin"])),
     db: Session = Depends(get_db)
 ):
     """Crear receta médica - Solo médicos y admin"""
@@ -548,177 +736,142 @@ def crear_receta(
     if not paciente:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     
-    db_receta = models.Receta(
-        paciente_id=receta.paciente_id,
-        medico_id=current_user.id,
-        medicamento1_nombre=receta.medicamento1_nombre,
-        medicamento1_dosis=receta.medicamento1_dosis,
-        medicamento1_frecuencia=receta.medicamento1_frecuencia,
-        medicamento1_duracion=receta.medicamento1_duracion,
-        medicamento1_via=receta.medicamento1_via,
-        medicamento2_nombre=receta.medicamento2_nombre,
-        medicamento2_dosis=receta.medicamento2_dosis,
-        medicamento2_frecuencia=receta.medicamento2_frecuencia,
-        medicamento2_duracion=receta.medicamento2_duracion,
-        medicamento2_via=receta.medicamento2_via,
-        medicamento3_nombre=receta.medicamento3_nombre,
-        medicamento3_dosis=receta.medicamento3_dosis,
-        medicamento3_frecuencia=receta.medicamento3_frecuencia,
-        medicamento3_duracion=receta.medicamento3_duracion,
-        medicamento3_via=receta.medicamento3_via,
-        medicamento4_nombre=receta.medicamento4_nombre,
-        medicamento4_dosis=receta.medicamento4_dosis,
-        medicamento4_frecuencia=receta.medicamento4_frecuencia,
-        medicamento4_duracion=receta.medicamento4_duracion,
-        medicamento4_via=receta.medicamento4_via,
-        medicamento5_nombre=receta.medicamento5_nombre,
-        medicamento5_dosis=receta.medicamento5_dosis,
-        medicamento5_frecuencia=receta.medicamento5_frecuencia,
-        medicamento5_duracion=receta.medicamento5_duracion,
-        medicamento5_via=receta.medicamento5_via,
-        indicaciones_generales=receta.indicaciones_generales,
-        activa=True
-    )
+    if not receta.medicamentos:
+        raise HTTPException(status_code=400, detail="La receta debe tener al menos un medicamento")
     
-    db.add(db_receta)
+    db_receta = _guardar_receta(
+        db,
+        receta.paciente_id,
+        current_user.id,
+        [med.model_dump() for med in receta.medicamentos],
+        receta.indicaciones_generales
+    )
     db.commit()
-    db.refresh(db_receta)
     
     return {"mensaje": "Receta creada exitosamente", "id": db_receta.id}
 
 @app.get("/api/recetas/paciente/{paciente_id}")
 def obtener_recetas_paciente(
     paciente_id: int,
-    current_user: models.Usuario = Depends(require_roles(["medico", "enfermera", "admin"])),
-    db: Session = Depends(get_db)
+    limite: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    todos: bool = False,
+    current_user: TokenUsuario = Depends(require_roles(["medico", "enfermera", "admin"])),
+    db: Session = Depends(get_read_db)
 ):
-    """Ver recetas del paciente - Personal médico"""
-    recetas = db.query(models.Receta).filter(
-        models.Receta.paciente_id == paciente_id
-    ).order_by(models.Receta.fecha_emision.desc()).all()
+    """Ver recetas del paciente (más recientes primero) - Personal médico"""
+    query = db.query(models.Receta).options(
+        joinedload(models.Receta.medico),
+        selectinload(models.Receta.medicamentos)
+    ).filter(models.Receta.paciente_id == paciente_id)
+    orden = [models.Receta.fecha_emision, models.Receta.id]
+    if todos:
+        recetas, siguiente = query.order_by(*[c.desc() for c in orden]).all(), None
+    else:
+        recetas, siguiente = paginar(query, orden, cursor, limite, descendente=True)
     
     resultado = []
     for r in recetas:
-        medico = db.query(models.Usuario).filter(models.Usuario.id == r.medico_id).first()
+        medico = r.medico
         resultado.append({
             "id": r.id,
             "paciente_id": r.paciente_id,
             "medico_id": r.medico_id,
             "medico_nombre": medico.nombre_completo if medico else "Desconocido",
             "fecha_emision": r.fecha_emision.isoformat(),
-            "medicamento1_nombre": r.medicamento1_nombre,
-            "medicamento1_dosis": r.medicamento1_dosis,
-            "medicamento1_frecuencia": r.medicamento1_frecuencia,
-            "medicamento1_duracion": r.medicamento1_duracion,
-            "medicamento1_via": r.medicamento1_via,
-            "medicamento2_nombre": r.medicamento2_nombre,
-            "medicamento2_dosis": r.medicamento2_dosis,
-            "medicamento2_frecuencia": r.medicamento2_frecuencia,
-            "medicamento2_duracion": r.medicamento2_duracion,
-            "medicamento2_via": r.medicamento2_via,
-            "medicamento3_nombre": r.medicamento3_nombre,
-            "medicamento3_dosis": r.medicamento3_dosis,
-            "medicamento3_frecuencia": r.medicamento3_frecuencia,
-            "medicamento3_duracion": r.medicamento3_duracion,
-            "medicamento3_via": r.medicamento3_via,
-            "medicamento4_nombre": r.medicamento4_nombre,
-            "medicamento4_dosis": r.medicamento4_dosis,
-            "medicamento4_frecuencia": r.medicamento4_frecuencia,
-            "medicamento4_duracion": r.medicamento4_duracion,
-            "medicamento4_via": r.medicamento4_via,
-            "medicamento5_nombre": r.medicamento5_nombre,
-            "medicamento5_dosis": r.medicamento5_dosis,
-            "medicamento5_frecuencia": r.medicamento5_frecuencia,
-            "medicamento5_duracion": r.medicamento5_duracion,
-            "medicamento5_via": r.medicamento5_via,
+            "medicamentos": [_medicamento_a_dict(m) for m in r.medicamentos],
             "indicaciones_generales": r.indicaciones_generales,
             "activa": r.activa
         })
     
-    return resultado
+    if todos:
+        return resultado
+    return respuesta_paginada(resultado, siguiente)
+
+@app.post("/api/recetas/pdf/batch")
+async def descargar_lote_recetas_pdf(
+    lote: LotePdfRecetas,
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Un solo PDF con varias recetas (p. ej. las emitidas en un turno), una tras otra"""
+    filtros = [lote.desde, lote.hasta, lote.medico_id, lote.paciente_id]
+    if not lote.ids and all(f is None for f in filtros):
+        raise HTTPException(status_code=400, detail="Indique ids o al menos un filtro (desde, hasta, medico_id, paciente_id)")
+
+    consulta = select(models.Receta).options(
+        joinedload(models.Receta.paciente),
+        joinedload(models.Receta.medico),
+        selectinload(models.Receta.medicamentos)
+    )
+    if lote.ids:
+        consulta = consulta.where(models.Receta.id.in_(lote.ids))
+    if lote.desde:
+        consulta = consulta.where(models.Receta.fecha_emision >= datetime.combine(lote.desde, time.min))
+    if lote.hasta:
+        consulta = consulta.where(models.Receta.fecha_emision < datetime.combine(lote.hasta + timedelta(days=1), time.min))
+    if lote.medico_id is not None:
+        consulta = consulta.where(models.Receta.medico_id == lote.medico_id)
+    if lote.paciente_id is not None:
+        consulta = consulta.where(models.Receta.paciente_id == lote.paciente_id)
+
+    maximo = settings.pdf_lote_max_recetas
+    recetas = (await db.execute(
+        consulta.order_by(models.Receta.fecha_emision, models.Receta.id).limit(maximo + 1)
+    )).scalars().all()
+    if len(recetas) > maximo:
+        raise HTTPException(status_code=400, detail=f"El lote supera las {maximo} recetas; acote el filtro")
+    if lote.ids:
+        # Mismo orden que los ids pedidos
+        por_id = {receta.id: receta for receta in recetas}
+        faltantes = [i for i in lote.ids if i not in por_id]
+        if faltantes:
+            raise HTTPException(status_code=404, detail=f"Recetas no encontradas: {faltantes}")
+        recetas = [por_id[i] for i in dict.fromkeys(lote.ids)]
+    if not recetas:
+        raise HTTPException(status_code=404, detail="No hay recetas para el filtro indicado")
+
+    pdf = await recetas_pdf.pdf_lote([recetas_pdf.datos_receta(receta) for receta in recetas])
+    return Response(
+        pdf,
+        media_type='application/pdf',
+        headers={
+            "Content-Disposition": 'attachment; filename="recetas.pdf"',
+            "X-Total-Recetas": str(len(recetas)),
+        }
+    )
 
 @app.get("/api/recetas/{receta_id}/pdf")
 async def descargar_receta_pdf(
     receta_id: int,
-    current_user: models.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Genera y descarga PDF de receta"""
     
-    receta = db.query(models.Receta).filter(models.Receta.id == receta_id).first()
+    receta = (await db.execute(
+        select(models.Receta).options(
+            joinedload(models.Receta.paciente),
+            joinedload(models.Receta.medico),
+            selectinload(models.Receta.medicamentos)
+        ).where(models.Receta.id == receta_id)
+    )).scalar_one_or_none()
     if not receta:
         raise HTTPException(status_code=404, detail="Receta no encontrada")
     
-    paciente = db.query(models.Paciente).filter(models.Paciente.id == receta.paciente_id).first()
-    medico = db.query(models.Usuario).filter(models.Usuario.id == receta.medico_id).first()
-    
-    # Preparar datos
-    medicamentos = []
-    if receta.medicamento1_nombre:
-        medicamentos.append({
-            'nombre': receta.medicamento1_nombre,
-            'dosis': receta.medicamento1_dosis,
-            'frecuencia': receta.medicamento1_frecuencia,
-            'duracion': receta.medicamento1_duracion,
-            'via': receta.medicamento1_via
-        })
-    if receta.medicamento2_nombre:
-        medicamentos.append({
-            'nombre': receta.medicamento2_nombre,
-            'dosis': receta.medicamento2_dosis,
-            'frecuencia': receta.medicamento2_frecuencia,
-            'duracion': receta.medicamento2_duracion,
-            'via': receta.medicamento2_via
-        })
-    if receta.medicamento3_nombre:
-        medicamentos.append({
-            'nombre': receta.medicamento3_nombre,
-            'dosis': receta.medicamento3_dosis,
-            'frecuencia': receta.medicamento3_frecuencia,
-            'duracion': receta.medicamento3_duracion,
-            'via': receta.medicamento3_via
-        })
-    if receta.medicamento4_nombre:
-        medicamentos.append({
-            'nombre': receta.medicamento4_nombre,
-            'dosis': receta.medicamento4_dosis,
-            'frecuencia': receta.medicamento4_frecuencia,
-            'duracion': receta.medicamento4_duracion,
-            'via': receta.medicamento4_via
-        })
-    if receta.medicamento5_nombre:
-        medicamentos.append({
-            'nombre': receta.medicamento5_nombre,
-            'dosis': receta.medicamento5_dosis,
-            'frecuencia': receta.medicamento5_frecuencia,
-            'duracion': receta.medicamento5_duracion,
-            'via': receta.medicamento5_via
-        })
-    
-    receta_data = {
-        'id': receta.id,
-        'fecha': receta.fecha_emision.strftime('%d/%m/%Y'),
-        'medico_nombre': medico.nombre_completo,
-        'medico_codigo': medico.codigo_medico or "N/A",
-        'paciente_nombre': f"{paciente.nombre} {paciente.apellidos}",
-        'paciente_id': paciente.identificacion,
-        'medicamentos': medicamentos,
-        'indicaciones': receta.indicaciones_generales
-    }
-    
-    # Generar PDF
-    pdf_path = generar_receta_pdf(receta_data)
-    
-    return FileResponse(
-        pdf_path,
+    # Generar PDF en el pool de procesos (o tomarlo de la caché si la receta no cambió)
+    pdf = await recetas_pdf.pdf_receta(recetas_pdf.datos_receta(receta))
+
+    return Response(
+        pdf,
         media_type='application/pdf',
-        filename=f"receta_{receta_id}.pdf"
+        headers={"Content-Disposition": f'attachment; filename="receta_{receta_id}.pdf"'}
     )
 # ==================== ÓRDENES DE LABORATORIO ====================
 
 @app.get("/api/laboratorio/catalogo")
 def obtener_catalogo_loinc(
-    current_user: models.Usuario = Depends(get_current_user)
+    current_user: TokenUsuario = Depends(get_token_usuario)
 ):
     """Obtener catálogo de exámenes LOINC por categorías"""
     return obtener_examenes_por_categoria()
@@ -726,15 +879,40 @@ def obtener_catalogo_loinc(
 @app.get("/api/laboratorio/buscar/{termino}")
 def buscar_examenes_loinc(
     termino: str,
-    current_user: models.Usuario = Depends(get_current_user)
+    current_user: TokenUsuario = Depends(get_token_usuario)
 ):
     """Buscar exámenes por término"""
     return buscar_examen(termino)
 
+def _insertar_examenes(db: Session, orden_id: int, examenes: List[dict]):
+    """Inserta los exámenes de una orden con un solo INSERT masivo"""
+    db.execute(insert(models.ExamenLaboratorio), [
+        {
+            "orden_id": orden_id,
+            "numero": numero,
+            "codigo_loinc": examen["codigo_loinc"],
+            "nombre": examen["nombre"],
+            "valor_referencia": examen.get("valor_referencia"),
+            "unidad": examen.get("unidad"),
+            "resultado": examen.get("resultado")
+        }
+        for numero, examen in enumerate(examenes, 1)
+    ])
+
+def _examen_a_dict(examen: models.ExamenLaboratorio) -> dict:
+    return {
+        "numero": examen.numero,
+        "codigo_loinc": examen.codigo_loinc,
+        "nombre": examen.nombre,
+        "resultado": examen.resultado,
+        "valor_referencia": examen.valor_referencia,
+        "unidad": examen.unidad
+    }
+
 @app.post("/api/laboratorio/orden")
 def crear_orden_laboratorio(
     orden: OrdenLaboratorioCreate,
-    current_user: models.Usuario = Depends(require_roles(["medico", "admin"])),
+    current_user: TokenUsuario = Depends(require_roles(["medico", "admin"])),
     db: Session = Depends(get_db)
 ):
     """Crear orden de laboratorio - Solo médicos"""
@@ -745,9 +923,6 @@ def crear_orden_laboratorio(
     if not orden.examenes or len(orden.examenes) == 0:
         raise HTTPException(status_code=400, detail="Debe incluir al menos un examen")
     
-    if len(orden.examenes) > 10:
-        raise HTTPException(status_code=400, detail="Máximo 10 exámenes por orden")
-    
     # Crear orden
     db_orden = models.OrdenLaboratorio(
         paciente_id=orden.paciente_id,
@@ -758,48 +933,37 @@ def crear_orden_laboratorio(
         urgente=orden.urgente,
         estado="pendiente"
     )
-    
-    # Agregar exámenes
-    for i, examen in enumerate(orden.examenes, 1):
-        setattr(db_orden, f"examen{i}_codigo_loinc", examen.codigo_loinc)
-        setattr(db_orden, f"examen{i}_nombre", examen.nombre)
-        setattr(db_orden, f"examen{i}_valor_referencia", examen.valor_referencia)
-        setattr(db_orden, f"examen{i}_unidad", examen.unidad)
-    
     db.add(db_orden)
+    db.flush()
+    
+    _insertar_examenes(db, db_orden.id, [examen.model_dump() for examen in orden.examenes])
     db.commit()
-    db.refresh(db_orden)
     
     return {"mensaje": "Orden de laboratorio creada exitosamente", "id": db_orden.id}
 
 @app.get("/api/laboratorio/paciente/{paciente_id}")
 def obtener_ordenes_paciente(
     paciente_id: int,
-    current_user: models.Usuario = Depends(require_roles(["medico", "enfermera", "admin"])),
-    db: Session = Depends(get_db)
+    limite: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    todos: bool = False,
+    current_user: TokenUsuario = Depends(require_roles(["medico", "enfermera", "admin"])),
+    db: Session = Depends(get_read_db)
 ):
-    """Ver órdenes de laboratorio del paciente"""
-    ordenes = db.query(models.OrdenLaboratorio).filter(
-        models.OrdenLaboratorio.paciente_id == paciente_id
-    ).order_by(models.OrdenLaboratorio.fecha_orden.desc()).all()
+    """Ver órdenes de laboratorio del paciente (más recientes primero)"""
+    query = db.query(models.OrdenLaboratorio).options(
+        joinedload(models.OrdenLaboratorio.medico),
+        selectinload(models.OrdenLaboratorio.examenes)
+    ).filter(models.OrdenLaboratorio.paciente_id == paciente_id)
+    orden_por = [models.OrdenLaboratorio.fecha_orden, models.OrdenLaboratorio.id]
+    if todos:
+        ordenes, siguiente = query.order_by(*[c.desc() for c in orden_por]).all(), None
+    else:
+        ordenes, siguiente = paginar(query, orden_por, cursor, limite, descendente=True)
     
     resultado = []
     for orden in ordenes:
-        medico = db.query(models.Usuario).filter(models.Usuario.id == orden.medico_id).first()
-        
-        # Recopilar exámenes
-        examenes = []
-        for i in range(1, 11):
-            codigo = getattr(orden, f"examen{i}_codigo_loinc")
-            if codigo:
-                examenes.append({
-                    "numero": i,
-                    "codigo_loinc": codigo,
-                    "nombre": getattr(orden, f"examen{i}_nombre"),
-                    "resultado": getattr(orden, f"examen{i}_resultado"),
-                    "valor_referencia": getattr(orden, f"examen{i}_valor_referencia"),
-                    "unidad": getattr(orden, f"examen{i}_unidad")
-                })
+        medico = orden.medico
         
         resultado.append({
             "id": orden.id,
@@ -809,17 +973,19 @@ def obtener_ordenes_paciente(
             "urgente": orden.urgente,
             "indicaciones_clinicas": orden.indicaciones_clinicas,
             "diagnostico_presuntivo": orden.diagnostico_presuntivo,
-            "examenes": examenes,
+            "examenes": [_examen_a_dict(examen) for examen in orden.examenes],
             "fecha_resultado": orden.fecha_resultado.isoformat() if orden.fecha_resultado else None
         })
     
-    return resultado
+    if todos:
+        return resultado
+    return respuesta_paginada(resultado, siguiente)
 
 @app.put("/api/laboratorio/{orden_id}/resultado")
 def agregar_resultado(
     orden_id: int,
     resultados: List[ResultadoExamen],
-    current_user: models.Usuario = Depends(require_roles(["medico", "enfermera", "admin"])),
+    current_user: TokenUsuario = Depends(require_roles(["medico", "enfermera", "admin"])),
     db: Session = Depends(get_db)
 ):
     """Agregar resultados a una orden - Personal médico"""
@@ -827,25 +993,34 @@ def agregar_resultado(
     if not orden:
         raise HTTPException(status_code=404, detail="Orden no encontrada")
     
-    # Actualizar resultados
-    for res in resultados:
-        setattr(orden, f"examen{res.examen_numero}_resultado", res.resultado)
+    # Un solo UPDATE ejecutado en lote (executemany) para todos los resultados
+    if resultados:
+        tabla = models.ExamenLaboratorio.__table__
+        db.execute(
+            tabla.update()
+            .where(tabla.c.orden_id == bindparam("b_orden_id"), tabla.c.numero == bindparam("b_numero"))
+            .values(resultado=bindparam("b_resultado")),
+            [
+                {"b_orden_id": orden_id, "b_numero": res.examen_numero, "b_resultado": res.resultado}
+                for res in resultados
+            ]
+        )
     
     # Verificar si todos los exámenes tienen resultado
-    todos_completos = True
-    for i in range(1, 11):
-        codigo = getattr(orden, f"examen{i}_codigo_loinc")
-        if codigo:
-            resultado = getattr(orden, f"examen{i}_resultado")
-            if not resultado:
-                todos_completos = False
-                break
-    
-    if todos_completos:
+    pendientes = db.execute(
+        select(func.count()).select_from(models.ExamenLaboratorio).where(
+            models.ExamenLaboratorio.orden_id == orden_id,
+            (models.ExamenLaboratorio.resultado.is_(None)) | (models.ExamenLaboratorio.resultado == "")
+        )
+    ).scalar_one()
+    
+    if pendientes == 0:
         orden.estado = "completado"
         orden.fecha_resultado = datetime.utcnow()
     else:
         orden.estado = "en_proceso"
+    # El UPDATE de los exámenes no pasa por el ORM: la versión de la orden se incrementa aquí
+    models.incrementar_version(orden)
     
     db.commit()
     
@@ -854,7 +1029,7 @@ def agregar_resultado(
 @app.delete("/api/laboratorio/{orden_id}")
 def cancelar_orden(
     orden_id: int,
-    current_user: models.Usuario = Depends(require_roles(["medico", "admin"])),
+    current_user: TokenUsuario = Depends(require_roles(["medico", "admin"])),
     db: Session = Depends(get_db)
 ):
     """Cancelar orden de laboratorio"""
@@ -872,24 +1047,30 @@ def cancelar_orden(
 @app.get("/api/laboratorio/{orden_id}/fhir")
 def exportar_orden_fhir(
     orden_id: int,
-    current_user: models.Usuario = Depends(require_roles(["medico", "enfermera", "admin"])),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: TokenUsuario = Depends(require_roles(["medico", "enfermera", "admin"])),
+    db: Session = Depends(get_read_db)
 ):
     """Exportar orden de laboratorio a formato FHIR Bundle (DiagnosticReport + Observations)"""
-    orden = db.query(models.OrdenLaboratorio).filter(models.OrdenLaboratorio.id == orden_id).first()
-    if not orden:
+    version = fhir_cache.versiones(db, "laboratorio", orden_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="Orden no encontrada")
     
-    paciente = db.query(models.Paciente).filter(models.Paciente.id == orden.paciente_id).first()
-    medico = db.query(models.Usuario).filter(models.Usuario.id == orden.medico_id).first()
+    def construir():
+        orden = db.query(models.OrdenLaboratorio).options(
+            joinedload(models.OrdenLaboratorio.paciente),
+            joinedload(models.OrdenLaboratorio.medico),
+            selectinload(models.OrdenLaboratorio.examenes)
+        ).filter(models.OrdenLaboratorio.id == orden_id).first()
+        return fhir_converter.orden_laboratorio_to_fhir_bundle(orden, orden.paciente, orden.medico)
     
-    return fhir_converter.orden_laboratorio_to_fhir_bundle(orden, paciente, medico)
+    return fhir_cache.responder(request, "laboratorio", orden_id, version, construir)
 
 
 @app.post("/api/laboratorio/fhir/import")
 def importar_orden_fhir(
     fhir_bundle: dict,
-    current_user: models.Usuario = Depends(require_roles(["medico", "admin"])),
+    current_user: TokenUsuario = Depends(require_roles(["medico", "admin"])),
     db: Session = Depends(get_db)
 ):
     """Importar orden de laboratorio desde formato FHIR Bundle"""
@@ -910,22 +1091,15 @@ def importar_orden_fhir(
             estado="pendiente"
         )
         
-        # Agregar exámenes (máximo 10)
-        for i, exam in enumerate(orden_data["examenes"][:10], 1):
-            setattr(db_orden, f"examen{i}_codigo_loinc", exam["codigo_loinc"])
-            setattr(db_orden, f"examen{i}_nombre", exam["nombre"])
-            setattr(db_orden, f"examen{i}_resultado", exam.get("resultado"))
-            setattr(db_orden, f"examen{i}_valor_referencia", exam.get("valor_referencia"))
-            setattr(db_orden, f"examen{i}_unidad", exam.get("unidad"))
-        
         # Si todos los exámenes tienen resultado, marcar como completado
         if all(exam.get("resultado") for exam in orden_data["examenes"]):
             db_orden.estado = "completado"
             db_orden.fecha_resultado = datetime.utcnow()
         
         db.add(db_orden)
+        db.flush()
+        _insertar_examenes(db, db_orden.id, orden_data["examenes"])
         db.commit()
-        db.refresh(db_orden)
         
         return {
             "mensaje": "Orden de laboratorio importada exitosamente desde FHIR",
@@ -939,24 +1113,30 @@ def importar_orden_fhir(
 @app.get("/api/recetas/{receta_id}/fhir")
 def exportar_receta_fhir(
     receta_id: int,
-    current_user: models.Usuario = Depends(require_roles(["medico", "enfermera", "admin"])),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: TokenUsuario = Depends(require_roles(["medico", "enfermera", "admin"])),
+    db: Session = Depends(get_read_db)
 ):
     """Exportar receta a formato FHIR Bundle"""
-    receta = db.query(models.Receta).filter(models.Receta.id == receta_id).first()
-    if not receta:
+    version = fhir_cache.versiones(db, "receta", receta_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="Receta no encontrada")
     
-    paciente = db.query(models.Paciente).filter(models.Paciente.id == receta.paciente_id).first()
-    medico = db.query(models.Usuario).filter(models.Usuario.id == receta.medico_id).first()
+    def construir():
+        receta = db.query(models.Receta).options(
+            joinedload(models.Receta.paciente),
+            joinedload(models.Receta.medico),
+            selectinload(models.Receta.medicamentos)
+        ).filter(models.Receta.id == receta_id).first()
+        return fhir_converter.receta_to_fhir_bundle(receta, receta.paciente, receta.medico)
     
-    return fhir_converter.receta_to_fhir_bundle(receta, paciente, medico)
+    return fhir_cache.responder(request, "receta", receta_id, version, construir)
 
 
 @app.post("/api/recetas/fhir/import")
 def importar_receta_fhir(
     fhir_bundle: dict,
-    current_user: models.Usuario = Depends(require_roles(["medico", "admin"])),
+    current_user: TokenUsuario = Depends(require_roles(["medico", "admin"])),
     db: Session = Depends(get_db)
 ):
     """Importar receta desde formato FHIR Bundle"""
@@ -966,46 +1146,17 @@ def importar_receta_fhir(
         if "paciente_id" not in receta_data:
             raise HTTPException(status_code=400, detail="No se pudo identificar al paciente en el Bundle FHIR")
         
-        # Validar que al menos tenga medicamento1
-        if not receta_data.get("medicamento1_nombre"):
+        if not receta_data.get("medicamentos"):
             raise HTTPException(status_code=400, detail="La receta debe tener al menos un medicamento")
         
-        # Crear receta
-        db_receta = models.Receta(
-            paciente_id=receta_data["paciente_id"],
-            medico_id=current_user.id,
-            medicamento1_nombre=receta_data.get("medicamento1_nombre"),
-            medicamento1_dosis=receta_data.get("medicamento1_dosis", ""),
-            medicamento1_frecuencia=receta_data.get("medicamento1_frecuencia", ""),
-            medicamento1_duracion=receta_data.get("medicamento1_duracion", ""),
-            medicamento1_via=receta_data.get("medicamento1_via", "Oral"),
-            medicamento2_nombre=receta_data.get("medicamento2_nombre"),
-            medicamento2_dosis=receta_data.get("medicamento2_dosis"),
-            medicamento2_frecuencia=receta_data.get("medicamento2_frecuencia"),
-            medicamento2_duracion=receta_data.get("medicamento2_duracion"),
-            medicamento2_via=receta_data.get("medicamento2_via"),
-            medicamento3_nombre=receta_data.get("medicamento3_nombre"),
-            medicamento3_dosis=receta_data.get("medicamento3_dosis"),
-            medicamento3_frecuencia=receta_data.get("medicamento3_frecuencia"),
-            medicamento3_duracion=receta_data.get("medicamento3_duracion"),
-            medicamento3_via=receta_data.get("medicamento3_via"),
-            medicamento4_nombre=receta_data.get("medicamento4_nombre"),
-            medicamento4_dosis=receta_data.get("medicamento4_dosis"),
-            medicamento4_frecuencia=receta_data.get("medicamento4_frecuencia"),
-            medicamento4_duracion=receta_data.get("medicamento4_duracion"),
-            medicamento4_via=receta_data.get("medicamento4_via"),
-            medicamento5_nombre=receta_data.get("medicamento5_nombre"),
-            medicamento5_dosis=receta_data.get("medicamento5_dosis"),
-            medicamento5_frecuencia=receta_data.get("medicamento5_frecuencia"),
-            medicamento5_duracion=receta_data.get("medicamento5_duracion"),
-            medicamento5_via=receta_data.get("medicamento5_via"),
-            indicaciones_generales=receta_data.get("indicaciones_generales"),
-            activa=True
+        db_receta = _guardar_receta(
+            db,
+            receta_data["paciente_id"],
+            current_user.id,
+            receta_data["medicamentos"],
+            receta_data.get("indicaciones_generales")
         )
-        
-        db.add(db_receta)
         db.commit()
-        db.refresh(db_receta)
         
         return {
             "mensaje": "Receta importada exitosamente desde FHIR",
@@ -1017,22 +1168,127 @@ def importar_receta_fhir(
 
 # ==================== FHIR ENDPOINTS ====================
 
+@app.post("/fhir")
+def procesar_bundle_fhir(
+    bundle: dict,
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: Session = Depends(get_db)
+):
+    """Bundle transaction o batch con Patient, MedicationRequest y DiagnosticReport; permisos por recurso"""
+    try:
+        return fhir_transaccion.procesar_bundle(db, bundle, current_user)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content=fhir_transaccion.operation_outcome(str(e), "invalid"))
+    except fhir_transaccion.ErrorTransaccion as e:
+        return JSONResponse(status_code=e.error.codigo_http, content=fhir_transaccion.operation_outcome(str(e)))
+
+# Bulk Data $export (ver backend/fhir_export.py). Las rutas /fhir/Patient/$export
+# van antes de /fhir/Patient/{paciente_id} para que no las capture esa ruta
+FORMATOS_NDJSON = ("application/fhir+ndjson", "application/ndjson", "ndjson")
+
+@app.get("/fhir/$export")
+@app.get("/fhir/Patient/$export")
+def exportar_fhir(
+    request: Request,
+    output_format: Optional[str] = Query(None, alias="_outputFormat"),
+    since: Optional[datetime] = Query(None, alias="_since"),
+    tipos: Optional[str] = Query(None, alias="_type"),
+    current_user: TokenUsuario = Depends(require_roles(["admin"]))
+):
+    """Inicia una exportación de toda la clínica; el progreso se consulta en Content-Location"""
+    if output_format and output_format not in FORMATOS_NDJSON:
+        return JSONResponse(
+            status_code=400,
+            content=fhir_transaccion.operation_outcome(f"_outputFormat no soportado: {output_format}", "not-supported")
+        )
+    try:
+        trabajo_id = fhir_export.crear_trabajo(
+            [tipo.strip() for tipo in tipos.split(",") if tipo.strip()] if tipos else None,
+            since,
+            str(request.url),
+            current_user.id
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content=fhir_transaccion.operation_outcome(str(e), "not-supported"))
+    
+    return Response(
+        status_code=202,
+        headers={"Content-Location": str(request.url_for("estado_exportacion_fhir", trabajo_id=trabajo_id))}
+    )
+
+@app.get("/fhir/$export-status/{trabajo_id}")
+def estado_exportacion_fhir(
+    trabajo_id: str,
+    request: Request,
+    current_user: TokenUsuario = Depends(require_roles(["admin"]))
+):
+    estado = fhir_export.leer_estado(trabajo_id)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    if estado["estado"] in ("en_cola", "en_curso"):
+        return Response(
+            status_code=202,
+            headers={"X-Progress": fhir_export.progreso(estado), "Retry-After": "5"}
+        )
+    if estado["estado"] == "error":
+        return JSONResponse(status_code=500, content=fhir_transaccion.operation_outcome(estado["error"], "exception"))
+    
+    url_archivos = str(request.url.replace(query="")).replace("/$export-status/", "/$export-files/")
+    return fhir_export.manifiesto(estado, url_archivos)
+
+@app.delete("/fhir/$export-status/{trabajo_id}", status_code=202)
+def cancelar_exportacion_fhir(
+    trabajo_id: str,
+    current_user: TokenUsuario = Depends(require_roles(["admin"]))
+):
+    if not fhir_export.cancelar(trabajo_id):
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    return Response(status_code=202)
+
+@app.get("/fhir/$export-files/{trabajo_id}/{archivo}")
+def archivo_exportacion_fhir(
+    trabajo_id: str,
+    archivo: str,
+    request: Request,
+    current_user: TokenUsuario = Depends(require_roles(["admin"]))
+):
+    ruta = fhir_export.ruta_archivo(trabajo_id, archivo)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    if not ruta.endswith(".gz"):
+        return FileResponse(ruta, media_type="application/fhir+ndjson")
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return FileResponse(ruta, media_type="application/fhir+ndjson", headers={"Content-Encoding": "gzip"})
+    
+    # Cliente sin soporte de gzip: se descomprime mientras se envía
+    def descomprimir():
+        with gzip.open(ruta, "rb") as origen:
+            while bloque := origen.read(64 * 1024):
+                yield bloque
+    
+    return StreamingResponse(descomprimir(), media_type="application/fhir+ndjson")
+
 @app.get("/fhir/Patient/{paciente_id}")
 def get_fhir_patient(
     paciente_id: int,
-    current_user: models.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: Session = Depends(get_read_db)
 ):
-    paciente = db.query(models.Paciente).filter(models.Paciente.id == paciente_id).first()
-    if not paciente:
+    version = fhir_cache.versiones(db, "Patient", paciente_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     
-    return fhir_converter.paciente_to_fhir(paciente)
+    def construir():
+        paciente = db.query(models.Paciente).filter(models.Paciente.id == paciente_id).first()
+        return fhir_converter.paciente_to_fhir(paciente)
+    
+    return fhir_cache.responder(request, "Patient", paciente_id, version, construir)
 
 @app.post("/fhir/Patient")
 def create_fhir_patient(
     fhir_patient: dict,
-    current_user: models.Usuario = Depends(require_roles(["recepcion", "admin", "medico"])),
+    current_user: TokenUsuario = Depends(require_roles(["recepcion", "admin", "medico"])),
     db: Session = Depends(get_db)
 ):
     try:
@@ -1060,29 +1316,34 @@ def create_fhir_patient(
         db.commit()
         db.refresh(db_paciente)
         
-        return fhir_converter.paciente_to_fhir(db_paciente)
+        return JSONResponse(fhir_converter.paciente_to_fhir(db_paciente))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error procesando FHIR: {str(e)}")
 
 @app.get("/fhir/Encounter/{consulta_id}")
 def get_fhir_encounter(
     consulta_id: int,
-    current_user: models.Usuario = Depends(require_roles(["medico", "enfermera", "admin"])),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: TokenUsuario = Depends(require_roles(["medico", "enfermera", "admin"])),
+    db: Session = Depends(get_read_db)
 ):
-    consulta = db.query(models.Consulta).filter(models.Consulta.id == consulta_id).first()
-    if not consulta:
+    version = fhir_cache.versiones(db, "Encounter", consulta_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="Consulta no encontrada")
     
-    paciente = db.query(models.Paciente).filter(models.Paciente.id == consulta.paciente_id).first()
+    def construir():
+        consulta = db.query(models.Consulta).options(
+            joinedload(models.Consulta.paciente)
+        ).filter(models.Consulta.id == consulta_id).first()
+        return fhir_converter.consulta_to_fhir_encounter(consulta, consulta.paciente)
     
-    return fhir_converter.consulta_to_fhir_encounter(consulta, paciente)
+    return fhir_cache.responder(request, "Encounter", consulta_id, version, construir)
 
 @app.get("/fhir/Bundle/consulta/{consulta_id}")
 def get_fhir_bundle(
     consulta_id: int,
-    current_user: models.Usuario = Depends(require_roles(["medico", "enfermera", "admin"])),
-    db: Session = Depends(get_db)
+    current_user: TokenUsuario = Depends(require_roles(["medico", "enfermera", "admin"])),
+    db: Session = Depends(get_read_db)
 ):
     consulta = db.query(models.Consulta).filter(models.Consulta.id == consulta_id).first()
     if not consulta:
@@ -1090,16 +1351,14 @@ def get_fhir_bundle(
     
     paciente = db.query(models.Paciente).filter(models.Paciente.id == consulta.paciente_id).first()
     
-    return fhir_converter.consulta_to_fhir_bundle(consulta, paciente)
+    return JSONResponse(fhir_converter.consulta_to_fhir_bundle(consulta, paciente))
 
 @app.get("/fhir/Bundle/paciente/{paciente_id}")
 def get_patient_bundle(
     paciente_id: int,
-    current_user: models.Usuario = Depends(require_roles(["medico", "enfermera", "admin"])),
-    db: Session = Depends(get_db)
+    current_user: TokenUsuario = Depends(require_roles(["medico", "enfermera", "admin"])),
+    db: Session = Depends(get_read_db)
 ):
-    from fhir.resources.bundle import Bundle, BundleEntry
-    
     paciente = db.query(models.Paciente).filter(models.Paciente.id == paciente_id).first()
     if not paciente:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
@@ -1108,34 +1367,46 @@ def get_patient_bundle(
         models.Consulta.paciente_id == paciente_id
     ).order_by(models.Consulta.fecha.desc()).all()
     
-    entries = []
-    
-    patient_fhir = fhir_converter.paciente_to_fhir(paciente)
-    entries.append(BundleEntry(
-        fullUrl=f"urn:uuid:patient-{paciente.id}",
-        resource=patient_fhir
-    ))
-    
+    entries = [(f"urn:uuid:patient-{paciente.id}", fhir_converter.paciente_to_fhir(paciente))]
     for consulta in consultas:
-        encounter = fhir_converter.consulta_to_fhir_encounter(consulta, paciente)
-        entries.append(BundleEntry(
-            fullUrl=f"urn:uuid:encounter-{consulta.id}",
-            resource=encounter
+        entries.append((
+            f"urn:uuid:encounter-{consulta.id}",
+            fhir_converter.consulta_to_fhir_encounter(consulta, paciente)
         ))
     
-    bundle = Bundle(
-        type="collection",
-        entry=entries
-    )
+    return JSONResponse(fhir_converter.bundle_coleccion(entries))
+
+@app.get("/fhir/Patient/{paciente_id}/$everything")
+def get_patient_everything(
+    paciente_id: int,
+    request: Request,
+    count: int = Query(LIMITE_POR_DEFECTO, alias="_count", ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = Query(None, alias="_cursor"),
+    current_user: TokenUsuario = Depends(require_roles(["medico", "enfermera", "admin"])),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Historial clínico completo del paciente (consultas, recetas, laboratorio
+    e imagenología) como Bundle FHIR paginado, enviado en streaming
+    """
+    existe = db.query(models.Paciente.id).filter(models.Paciente.id == paciente_id).first()
+    if not existe:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    # El cursor se valida antes de empezar a responder
+    fhir_everything.decodificar_posicion(cursor)
     
-    return bundle.dict()
+    return StreamingResponse(
+        fhir_everything.generar_everything(paciente_id, count, cursor, request.url),
+        media_type="application/fhir+json"
+    )
+
 # ==================== IMAGENOLOGÍA ====================
 
 @app.post("/api/imagenologia/orden")
 async def crear_orden_imagenologia(
     datos: dict,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Crear nueva orden de imagenología"""
     try:
@@ -1151,7 +1422,7 @@ async def crear_orden_imagenologia(
         )
         
         db.add(nueva_orden)
-        db.flush()
+        await db.flush()
         
         for idx, estudio in enumerate(datos["estudios"], 1):
             nuevo_estudio = models.EstudioImagenologia(
@@ -1163,33 +1434,41 @@ async def crear_orden_imagenologia(
             )
             db.add(nuevo_estudio)
         
-        db.commit()
-        db.refresh(nueva_orden)
+        await db.commit()
         
         return {"mensaje": "Orden creada exitosamente", "id": nueva_orden.id}
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/imagenologia/paciente/{paciente_id}")
 async def obtener_ordenes_imagenologia(
     paciente_id: int,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limite: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    todos: bool = False,
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtener órdenes de imagenología de un paciente"""
-    ordenes = db.query(models.OrdenImagenologia).filter(
-        models.OrdenImagenologia.paciente_id == paciente_id
-    ).all()
+    """Obtener órdenes de imagenología de un paciente (más recientes primero)"""
+    stmt = select(models.OrdenImagenologia).options(
+        joinedload(models.OrdenImagenologia.medico),
+        selectinload(models.OrdenImagenologia.estudios)
+    ).where(models.OrdenImagenologia.paciente_id == paciente_id)
+    orden_por = [models.OrdenImagenologia.fecha_orden, models.OrdenImagenologia.id]
+    if todos:
+        stmt = stmt.order_by(*[c.desc() for c in orden_por])
+        ordenes, siguiente = (await db.execute(stmt)).scalars().all(), None
+    else:
+        stmt = aplicar_cursor(stmt, orden_por, cursor, limite, descendente=True)
+        ordenes, siguiente = cortar_pagina((await db.execute(stmt)).scalars().all(), orden_por, limite)
     
     resultado = []
     for orden in ordenes:
-        medico = db.query(models.Usuario).filter(models.Usuario.id == orden.medico_id).first()
-        estudios = db.query(models.EstudioImagenologia).filter(
-            models.EstudioImagenologia.orden_id == orden.id
-        ).all()
+        medico = orden.medico
+        estudios = orden.estudios
         
         resultado.append({
             "id": orden.id,
@@ -1212,24 +1491,26 @@ async def obtener_ordenes_imagenologia(
             } for e in estudios]
         })
     
-    return resultado
+    if todos:
+        return resultado
+    return respuesta_paginada(resultado, siguiente)
 
 
 @app.delete("/api/imagenologia/{orden_id}")
 async def cancelar_orden_imagenologia(
     orden_id: int,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: TokenUsuario = Depends(get_token_usuario),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cancelar orden de imagenología"""
     if current_user.rol not in ["medico", "admin"]:
         raise HTTPException(status_code=403, detail="No autorizado")
     
-    orden = db.query(models.OrdenImagenologia).filter(models.OrdenImagenologia.id == orden_id).first()
+    orden = await db.get(models.OrdenImagenologia, orden_id)
     if not orden:
         raise HTTPException(status_code=404, detail="Orden no encontrada")
     
     orden.estado = "cancelado"
-    db.commit()
+    await db.commit()
     
-    return {"mensaje": "Orden cancelada"}
\ No newline at end of file
+    return {"mensaje": "Orden cancelada"}
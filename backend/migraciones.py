@@ -0,0 +1,290 @@
+"""
+Migraciones versionadas del esquema.
+
+Base.metadata.create_all solo crea tablas que no existen: nunca agrega
+índices ni columnas a tablas ya creadas. Cada migración se registra con
+@migracion(version, descripcion), se ejecuta una sola vez en su propia
+transacción y queda anotada en la tabla schema_migraciones.
+
+Uso:
+    python -m backend.migraciones             # aplica las migraciones pendientes
+    python -m backend.migraciones --explicar  # verifica los planes de las consultas frecuentes
+"""
+import argparse
+import logging
+import sqlite3
+import sys
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from backend.database import engine, Base
+from backend import models
+from backend.busqueda import crear_indice_fts, reindexar_nombres
+
+logger = logging.getLogger(__name__)
+
+_metadata_migraciones = MetaData()
+
+schema_migraciones = Table(
+    "schema_migraciones",
+    _metadata_migraciones,
+    Column("version", Integer, primary_key=True),
+    Column("descripcion", String),
+    Column("aplicada_en", DateTime, default=datetime.utcnow),
+)
+
+MIGRACIONES = []
+
+
+def migracion(version: int, descripcion: str):
+    """Registra una función fn(conn) como migración con número de versión"""
+    def decorador(fn):
+        if any(v == version for v, _, _ in MIGRACIONES):
+            raise ValueError(f"Versión de migración duplicada: {version}")
+        MIGRACIONES.append((version, descripcion, fn))
+        MIGRACIONES.sort(key=lambda m: m[0])
+        return fn
+    return decorador
+
+
+def _crear_indices(conn, *tablas):
+    for tabla in tablas:
+        for indice in tabla.indexes:
+            indice.create(conn, checkfirst=True)
+
+
+def _columnas(conn, tabla: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(tabla)}
+
+
+# ==================== MIGRACIONES ====================
+
+@migracion(1, "Índices compuestos para las consultas frecuentes")
+def _indices_compuestos(conn):
+    _crear_indices(
+        conn,
+        models.Consulta.__table__,
+        models.Cita.__table__,
+        models.Receta.__table__,
+        models.OrdenLaboratorio.__table__,
+        models.OrdenImagenologia.__table__,
+        models.EstudioImagenologia.__table__,
+    )
+
+
+_CAMPOS_MEDICAMENTO = ("nombre", "dosis", "frecuencia", "duracion", "via")
+
+
+def _puede_eliminar_columnas(conn) -> bool:
+    # ALTER TABLE ... DROP COLUMN existe en SQLite desde la 3.35
+    return conn.dialect.name != "sqlite" or sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+@migracion(2, "Medicamentos de recetas en la tabla receta_medicamentos")
+def _normalizar_medicamentos(conn):
+    columnas = _columnas(conn, "recetas")
+    if "activa" not in columnas:
+        conn.execute(text("ALTER TABLE recetas ADD COLUMN activa BOOLEAN DEFAULT 1"))
+    _crear_indices(conn, models.RecetaMedicamento.__table__)
+
+    planas = [f"medicamento{i}_{campo}" for i in range(1, 6) for campo in _CAMPOS_MEDICAMENTO]
+    if "medicamento1_nombre" not in columnas:
+        return
+
+    # Una sentencia INSERT ... SELECT por posición: la conversión ocurre dentro del motor
+    for i in range(1, 6):
+        conn.execute(text(
+            "INSERT INTO receta_medicamentos "
+            "(receta_id, posicion, nombre, dosis, frecuencia, duracion, via) "
+            f"SELECT id, {i}, medicamento{i}_nombre, medicamento{i}_dosis, "
+            f"medicamento{i}_frecuencia, medicamento{i}_duracion, medicamento{i}_via "
+            f"FROM recetas WHERE medicamento{i}_nombre IS NOT NULL AND medicamento{i}_nombre != ''"
+        ))
+
+    if not _puede_eliminar_columnas(conn):
+        logger.warning("SQLite %s no permite DROP COLUMN: las columnas medicamentoN_* quedan sin uso",
+                       sqlite3.sqlite_version)
+        return
+    for columna in planas:
+        if columna in columnas:
+            conn.execute(text(f"ALTER TABLE recetas DROP COLUMN {columna}"))
+
+
+@migracion(3, "Exámenes de laboratorio como filas de examenes_laboratorio")
+def _examenes_laboratorio(conn):
+    if "consulta_id" not in _columnas(conn, "ordenes_laboratorio"):
+        conn.execute(text("ALTER TABLE ordenes_laboratorio ADD COLUMN consulta_id INTEGER REFERENCES consultas(id)"))
+    _crear_indices(conn, models.ExamenLaboratorio.__table__)
+
+
+@migracion(4, "Índice FTS5 de búsqueda de pacientes (solo SQLite)")
+def _indice_busqueda_pacientes(conn):
+    crear_indice_fts(conn)
+
+
+@migracion(5, "Nombre normalizado e índice de trigramas de pacientes")
+def _trigramas_pacientes(conn):
+    if "nombre_normalizado" not in _columnas(conn, "pacientes"):
+        conn.execute(text("ALTER TABLE pacientes ADD COLUMN nombre_normalizado VARCHAR"))
+    _crear_indices(conn, models.Paciente.__table__)
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_pacientes_nombre_normalizado_trgm "
+            "ON pacientes USING gin (nombre_normalizado gin_trgm_ops)"
+        ))
+    reindexar_nombres(conn)
+
+
+@migracion(6, "Columna version en las filas que se exportan como recursos FHIR")
+def _versiones(conn):
+    for modelo in models.VERSIONADOS:
+        tabla = modelo.__tablename__
+        if "version" not in _columnas(conn, tabla):
+            conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+
+# Fecha con la que se inicializa fecha_modificacion en las filas existentes
+_FECHA_INICIAL = {
+    "usuarios": "fecha_creacion",
+    "pacientes": "fecha_registro",
+    "consultas": "fecha",
+    "recetas": "fecha_emision",
+    "ordenes_laboratorio": "COALESCE(fecha_resultado, fecha_orden)",
+    "ordenes_imagenologia": "COALESCE(fecha_resultado, fecha_orden)",
+}
+
+
+@migracion(7, "Columna fecha_modificacion para _since de $export")
+def _fecha_modificacion(conn):
+    for modelo in models.VERSIONADOS:
+        tabla = modelo.__tablename__
+        if "fecha_modificacion" not in _columnas(conn, tabla):
+            conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN fecha_modificacion DATETIME"))
+            conn.execute(text(f"UPDATE {tabla} SET fecha_modificacion = {_FECHA_INICIAL[tabla]}"))
+
+
+# ==================== EJECUCIÓN ====================
+
+def version_actual(bind=engine) -> int:
+    _metadata_migraciones.create_all(bind)
+    with bind.connect() as conn:
+        versiones = conn.execute(select(schema_migraciones.c.version)).scalars().all()
+    return max(versiones, default=0)
+
+
+def aplicar_migraciones(bind=engine) -> list:
+    """Crea las tablas que falten y aplica las migraciones pendientes en orden"""
+    Base.metadata.create_all(bind)
+    _metadata_migraciones.create_all(bind)
+
+    with bind.connect() as conn:
+        aplicadas = set(conn.execute(select(schema_migraciones.c.version)).scalars().all())
+
+    nuevas = []
+    for version, descripcion, fn in MIGRACIONES:
+        if version in aplicadas:
+            continue
+        with bind.begin() as conn:
+            fn(conn)
+            conn.execute(schema_migraciones.insert().values(
+                version=version, descripcion=descripcion, aplicada_en=datetime.utcnow()
+            ))
+        logger.info("Migración %s aplicada: %s", version, descripcion)
+        nuevas.append(version)
+    return nuevas
+
+
+# ==================== PLANES DE CONSULTA ====================
+
+def consultas_frecuentes():
+    """Consultas calientes de main.py y el índice que debe resolver cada una"""
+    return [
+        (
+            "Consultas del paciente por fecha",
+            select(models.Consulta).where(models.Consulta.paciente_id == 1)
+            .order_by(models.Consulta.fecha.desc()),
+            "ix_consultas_paciente_fecha",
+        ),
+        (
+            "Recetas del paciente por fecha de emisión",
+            select(models.Receta).where(models.Receta.paciente_id == 1)
+            .order_by(models.Receta.fecha_emision.desc()),
+            "ix_recetas_paciente_fecha_emision",
+        ),
+        (
+            "Agenda del médico por estado y horario",
+            select(models.Cita).where(
+                models.Cita.medico_id == 1,
+                models.Cita.estado.in_(["programada", "confirmada"]),
+                models.Cita.fecha_hora >= datetime(2025, 1, 1),
+                models.Cita.fecha_hora < datetime(2025, 1, 2),
+            ),
+            "ix_citas_medico_estado_fecha_hora",
+        ),
+        (
+            "Órdenes de laboratorio del paciente por fecha",
+            select(models.OrdenLaboratorio).where(models.OrdenLaboratorio.paciente_id == 1)
+            .order_by(models.OrdenLaboratorio.fecha_orden.desc()),
+            "ix_ordenes_laboratorio_paciente_fecha",
+        ),
+        (
+            "Estudios de una orden de imagenología",
+            select(models.EstudioImagenologia).where(models.EstudioImagenologia.orden_id == 1),
+            "ix_estudios_imagenologia_orden",
+        ),
+        (
+            "Medicamentos de una página de recetas",
+            select(models.RecetaMedicamento).where(models.RecetaMedicamento.receta_id.in_([1, 2, 3]))
+            .order_by(models.RecetaMedicamento.receta_id, models.RecetaMedicamento.posicion),
+            "ix_receta_medicamentos_receta_posicion",
+        ),
+        (
+            "Exámenes de una página de órdenes de laboratorio",
+            select(models.ExamenLaboratorio).where(models.ExamenLaboratorio.orden_id.in_([1, 2, 3]))
+            .order_by(models.ExamenLaboratorio.orden_id, models.ExamenLaboratorio.numero),
+            "ix_examenes_laboratorio_orden_numero",
+        ),
+    ]
+
+
+def explicar_consultas(bind=engine) -> list:
+    """
+    Ejecuta EXPLAIN QUERY PLAN (solo SQLite) sobre cada consulta frecuente.
+    Devuelve una lista de (descripcion, indice_esperado, plan, ok)
+    """
+    if bind.dialect.name != "sqlite":
+        raise RuntimeError("EXPLAIN QUERY PLAN solo está disponible con SQLite")
+
+    resultados = []
+    with bind.connect() as conn:
+        for descripcion, stmt, indice in consultas_frecuentes():
+            sql = str(stmt.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True}))
+            plan = [fila[-1] for fila in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+            usa_indice = any(f"INDEX {indice}" in paso for paso in plan)
+            ordena_en_memoria = any("TEMP B-TREE" in paso for paso in plan)
+            resultados.append((descripcion, indice, plan, usa_indice and not ordena_en_memoria))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de ECE Médico")
+    parser.add_argument("--explicar", action="store_true",
+                        help="verificar que las consultas frecuentes usan su índice")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    nuevas = aplicar_migraciones()
+    print(f"Esquema en versión {version_actual()} ({len(nuevas)} migraciones nuevas)")
+
+    if args.explicar:
+        fallos = 0
+        for descripcion, indice, plan, ok in explicar_consultas():
+            print(f"{'OK ' if ok else 'ERR'} {descripcion} -> {indice}")
+            for paso in plan:
+                print(f"      {paso}")
+            fallos += 0 if ok else 1
+        sys.exit(1 if fallos else 0)
+
+
+if __name__ == "__main__":
+    main()
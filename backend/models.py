@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text
-from sqlalchemy.orm import relationship
+from itertools import chain
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Index, event
+from sqlalchemy.orm import Session, relationship
 from datetime import datetime
 from backend.database import Base
 
@@ -15,6 +16,8 @@ class Usuario(Base):
     rol = Column(String)  # medico, enfermera, recepcion, admin
     activo = Column(Boolean, default=True)
     fecha_creacion = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    fecha_modificacion = Column(DateTime, default=datetime.utcnow)
 
 
 class Paciente(Base):
@@ -30,10 +33,31 @@ class Paciente(Base):
     email = Column(String)
     direccion = Column(String)
     fecha_registro = Column(DateTime, default=datetime.utcnow)
+    # "nombre apellidos" sin tildes y en minúsculas (lo mantiene backend.busqueda)
+    nombre_normalizado = Column(String, index=True)
+    # Se incrementa en cada cambio (ver _incrementar_versiones); es parte del ETag FHIR.
+    # fecha_modificacion se actualiza junto con version (_since de $export)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    fecha_modificacion = Column(DateTime, default=datetime.utcnow)
+
+
+class NombreTrigrama(Base):
+    """
+    Índice de trigramas del vocabulario de nombres (cada palabra distinta de
+    pacientes.nombre_normalizado), usado por la búsqueda difusa
+    """
+    __tablename__ = "nombres_trigramas"
+    
+    trigrama = Column(String(3), primary_key=True)
+    palabra = Column(String, primary_key=True)
 
 
 class Consulta(Base):
     __tablename__ = "consultas"
+    __table_args__ = (
+        # Historial del paciente ordenado por fecha
+        Index("ix_consultas_paciente_fecha", "paciente_id", "fecha"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     paciente_id = Column(Integer, ForeignKey("pacientes.id"))
@@ -45,10 +69,20 @@ class Consulta(Base):
     tratamiento = Column(Text)
     observaciones = Column(Text)
     medico = Column(String)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    fecha_modificacion = Column(DateTime, default=datetime.utcnow)
+
+    paciente = relationship("Paciente")
 
 
 class Cita(Base):
     __tablename__ = "citas"
+    __table_args__ = (
+        # Agenda del médico y validación de conflictos de horario
+        Index("ix_citas_medico_estado_fecha_hora", "medico_id", "estado", "fecha_hora"),
+        Index("ix_citas_paciente_fecha_hora", "paciente_id", "fecha_hora"),
+        Index("ix_citas_fecha_hora", "fecha_hora"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     paciente_id = Column(Integer, ForeignKey("pacientes.id"))
@@ -60,65 +94,88 @@ class Cita(Base):
     estado = Column(String, default="programada")  # programada, confirmada, atendida, cancelada
     fecha_creacion = Column(DateTime, default=datetime.utcnow)
 
+    paciente = relationship("Paciente")
+    medico = relationship("Usuario")
+
 
 class Receta(Base):
     __tablename__ = "recetas"
+    __table_args__ = (
+        Index("ix_recetas_paciente_fecha_emision", "paciente_id", "fecha_emision"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     paciente_id = Column(Integer, ForeignKey("pacientes.id"))
     medico_id = Column(Integer, ForeignKey("usuarios.id"))
     fecha_emision = Column(DateTime, default=datetime.utcnow)
     
-    # Hasta 5 medicamentos
-    medicamento1_nombre = Column(String)
-    medicamento1_dosis = Column(String)
-    medicamento1_frecuencia = Column(String)
-    medicamento1_duracion = Column(String)
-    medicamento1_via = Column(String)
-    
-    medicamento2_nombre = Column(String, nullable=True)
-    medicamento2_dosis = Column(String, nullable=True)
-    medicamento2_frecuencia = Column(String, nullable=True)
-    medicamento2_duracion = Column(String, nullable=True)
-    medicamento2_via = Column(String, nullable=True)
-    
-    medicamento3_nombre = Column(String, nullable=True)
-    medicamento3_dosis = Column(String, nullable=True)
-    medicamento3_frecuencia = Column(String, nullable=True)
-    medicamento3_duracion = Column(String, nullable=True)
-    medicamento3_via = Column(String, nullable=True)
-    
-    medicamento4_nombre = Column(String, nullable=True)
-    medicamento4_dosis = Column(String, nullable=True)
-    medicamento4_frecuencia = Column(String, nullable=True)
-    medicamento4_duracion = Column(String, nullable=True)
-    medicamento4_via = Column(String, nullable=True)
-    
-    medicamento5_nombre = Column(String, nullable=True)
-    medicamento5_dosis = Column(String, nullable=True)
-    medicamento5_frecuencia = Column(String, nullable=True)
-    medicamento5_duracion = Column(String, nullable=True)
-    medicamento5_via = Column(String, nullable=True)
-    
     indicaciones_generales = Column(Text, nullable=True)
+    activa = Column(Boolean, default=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    fecha_modificacion = Column(DateTime, default=datetime.utcnow)
+
+    paciente = relationship("Paciente")
+    medico = relationship("Usuario")
+    medicamentos = relationship(
+        "RecetaMedicamento",
+        back_populates="receta",
+        order_by="RecetaMedicamento.posicion",
+        cascade="all, delete-orphan",
+    )
+
+
+class RecetaMedicamento(Base):
+    __tablename__ = "receta_medicamentos"
+    __table_args__ = (
+        Index("ix_receta_medicamentos_receta_posicion", "receta_id", "posicion"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    receta_id = Column(Integer, ForeignKey("recetas.id"), nullable=False)
+    posicion = Column(Integer, nullable=False)
+    nombre = Column(String, nullable=False)
+    dosis = Column(String)
+    frecuencia = Column(String)
+    duracion = Column(String)
+    via = Column(String)
+
+    receta = relationship("Receta", back_populates="medicamentos")
 
 
 class OrdenLaboratorio(Base):
     __tablename__ = "ordenes_laboratorio"
+    __table_args__ = (
+        Index("ix_ordenes_laboratorio_paciente_fecha", "paciente_id", "fecha_orden"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     paciente_id = Column(Integer, ForeignKey("pacientes.id"))
     medico_id = Column(Integer, ForeignKey("usuarios.id"))
+    consulta_id = Column(Integer, ForeignKey("consultas.id"), nullable=True)
     fecha_orden = Column(DateTime, default=datetime.utcnow)
     diagnostico_presuntivo = Column(String)
     indicaciones_clinicas = Column(String)
     urgente = Column(Boolean, default=False)
     estado = Column(String, default="pendiente")  # pendiente, en_proceso, completado, cancelado
     fecha_resultado = Column(DateTime, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    fecha_modificacion = Column(DateTime, default=datetime.utcnow)
+
+    paciente = relationship("Paciente")
+    medico = relationship("Usuario")
+    examenes = relationship(
+        "ExamenLaboratorio",
+        back_populates="orden",
+        order_by="ExamenLaboratorio.numero",
+        cascade="all, delete-orphan",
+    )
 
 
 class ExamenLaboratorio(Base):
     __tablename__ = "examenes_laboratorio"
+    __table_args__ = (
+        Index("ix_examenes_laboratorio_orden_numero", "orden_id", "numero"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     orden_id = Column(Integer, ForeignKey("ordenes_laboratorio.id"))
@@ -129,9 +186,14 @@ class ExamenLaboratorio(Base):
     unidad = Column(String)
     resultado = Column(String, nullable=True)
 
+    orden = relationship("OrdenLaboratorio", back_populates="examenes")
+
 
 class OrdenImagenologia(Base):
     __tablename__ = "ordenes_imagenologia"
+    __table_args__ = (
+        Index("ix_ordenes_imagenologia_paciente_fecha", "paciente_id", "fecha_orden"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     paciente_id = Column(Integer, ForeignKey("pacientes.id"))
@@ -145,10 +207,23 @@ class OrdenImagenologia(Base):
     estado = Column(String, default="pendiente")  # pendiente, programado, en_proceso, completado, cancelado
     fecha_resultado = Column(DateTime, nullable=True)
     informe_url = Column(String, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    fecha_modificacion = Column(DateTime, default=datetime.utcnow)
+
+    paciente = relationship("Paciente")
+    medico = relationship("Usuario")
+    estudios = relationship(
+        "EstudioImagenologia",
+        back_populates="orden",
+        order_by="EstudioImagenologia.numero",
+    )
 
 
 class EstudioImagenologia(Base):
     __tablename__ = "estudios_imagenologia"
+    __table_args__ = (
+        Index("ix_estudios_imagenologia_orden", "orden_id", "numero"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     orden_id = Column(Integer, ForeignKey("ordenes_imagenologia.id"))
@@ -156,4 +231,39 @@ class EstudioImagenologia(Base):
     categoria = Column(String)
     nombre = Column(String)
     resultado = Column(String, nullable=True)
-    estado = Column(String, default="pendiente")
\ No newline at end of file
+    estado = Column(String, default="pendiente")
+
+    orden = relationship("OrdenImagenologia", back_populates="estudios")
+
+
+# ==================== VERSIONES ====================
+
+VERSIONADOS = (Usuario, Paciente, Consulta, Receta, OrdenLaboratorio, OrdenImagenologia)
+# Filas hijas que forman parte del recurso FHIR de su padre
+_PADRES = {RecetaMedicamento: "receta", ExamenLaboratorio: "orden", EstudioImagenologia: "orden"}
+
+
+def incrementar_version(fila):
+    """
+    Marca la fila como modificada: version + 1 (en SQL, sin carreras entre
+    requests) y fecha_modificacion. Para cambios que no pasan por el ORM,
+    como los UPDATE masivos
+    """
+    fila.version = type(fila).version + 1
+    fila.fecha_modificacion = datetime.utcnow()
+
+
+@event.listens_for(Session, "before_flush")
+def _incrementar_versiones(session, contexto, instancias):
+    modificadas = {
+        fila for fila in session.dirty
+        if isinstance(fila, VERSIONADOS) and session.is_modified(fila, include_collections=False)
+    }
+    with session.no_autoflush:
+        for fila in chain(session.new, session.dirty, session.deleted):
+            atributo = _PADRES.get(type(fila))
+            padre = getattr(fila, atributo) if atributo else None
+            if padre is not None and padre not in session.new and padre not in session.deleted:
+                modificadas.add(padre)
+    for fila in modificadas:
+        incrementar_version(fila)
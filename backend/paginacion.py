@@ -0,0 +1,79 @@
+"""
+Paginación por cursor (keyset) para los endpoints de listado.
+
+En lugar de OFFSET, cada página continúa después de la última fila de la
+anterior usando la clave de orden indexada (p. ej. fecha + id), así que el
+costo de pedir la página N no crece con N. El cursor es opaco para el
+cliente: JSON con los valores de la clave codificado en base64 URL-safe.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 500
+
+
+def codificar_cursor(valores: list) -> str:
+    datos = [v.isoformat() if isinstance(v, datetime) else v for v in valores]
+    crudo = json.dumps(datos, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, columnas: list) -> list:
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if not isinstance(valores, list) or len(valores) != len(columnas):
+            raise ValueError("longitud de cursor incorrecta")
+        return [
+            datetime.fromisoformat(v) if v is not None and col.type.python_type is datetime else v
+            for v, col in zip(valores, columnas)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+
+def _condicion_keyset(columnas: list, valores: list, descendente: bool):
+    """(a, b, id) > (va, vb, vid) expandido a OR/AND para cualquier motor"""
+    condiciones = []
+    for i, (col, valor) in enumerate(zip(columnas, valores)):
+        iguales = [c == v for c, v in zip(columnas[:i], valores[:i])]
+        paso = col < valor if descendente else col > valor
+        condiciones.append(and_(*iguales, paso))
+    return or_(*condiciones)
+
+
+def aplicar_cursor(consulta, columnas: list, cursor: Optional[str], limite: int, descendente: bool = False):
+    """
+    Filtra, ordena y limita una Query o un select() para obtener una página.
+    La última columna debe ser única (normalmente el id) para desempatar.
+    Pide limite + 1 filas para saber si existe una página siguiente.
+    """
+    if cursor:
+        valores = decodificar_cursor(cursor, columnas)
+        consulta = consulta.filter(_condicion_keyset(columnas, valores, descendente))
+    orden = [c.desc() if descendente else c.asc() for c in columnas]
+    return consulta.order_by(*orden).limit(limite + 1)
+
+
+def cortar_pagina(filas: list, columnas: list, limite: int):
+    """Devuelve (filas de la página, cursor siguiente o None)"""
+    if len(filas) <= limite:
+        return filas, None
+    filas = filas[:limite]
+    ultima = filas[-1]
+    return filas, codificar_cursor([getattr(ultima, c.key) for c in columnas])
+
+
+def paginar(query, columnas: list, cursor: Optional[str], limite: int, descendente: bool = False):
+    """Atajo para sesiones síncronas: aplica el cursor y ejecuta la Query"""
+    filas = aplicar_cursor(query, columnas, cursor, limite, descendente).all()
+    return cortar_pagina(filas, columnas, limite)
+
+
+def respuesta_paginada(resultados: list, siguiente_cursor: Optional[str]) -> dict:
+    return {"resultados": resultados, "siguiente_cursor": siguiente_cursor}
@@ -2,18 +2,19 @@ from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
-from datetime import datetime
-import os
+from io import BytesIO
 
-def generar_receta_pdf(receta_data, output_path="recetas"):
+def generar_receta_pdf(receta_data) -> bytes:
     """
-    Genera PDF de receta médica
+    Genera PDF de receta médica en memoria y devuelve su contenido
     receta_data: dict con todos los datos de la receta
-    """
-    os.makedirs(output_path, exist_ok=True)
     
-    filename = f"{output_path}/receta_{receta_data['id']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    c = canvas.Canvas(filename, pagesize=letter)
+    El contenido depende solo de receta_data (sin la hora actual, también en
+    los metadatos: invariant=1), porque los PDFs se guardan en caché por
+    contenido y se vuelven a servir en descargas posteriores
+    """
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter, invariant=1)
     width, height = letter
     
     # --- ENCABEZADO ---
@@ -108,7 +109,7 @@ def generar_receta_pdf(receta_data, output_path="recetas"):
     
     # Pie de página
     c.setFont("Helvetica", 8)
-    c.drawString(1*inch, 0.5*inch, f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+    c.drawString(1*inch, 0.5*inch, f"Emitida: {receta_data['emitida']}")
     
     c.save()
-    return filename
\ No newline at end of file
+    return buffer.getvalue()
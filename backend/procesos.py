@@ -0,0 +1,117 @@
+"""
+Pools de procesos acotados para trabajo de CPU (bcrypt, PDFs, ...).
+
+El trabajo de CPU dentro de los hilos del servidor bloquea al resto de los
+requests. Aquí se envía a procesos aparte, con un límite de tareas en cola:
+si el pool está lleno se lanza PoolSaturado (la API responde 503 con
+Retry-After) en lugar de encolar sin límite.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+from typing import Callable
+
+# Todos los pools creados, por nombre (los expone /api/metricas)
+POOLS = {}
+
+
+class PoolSaturado(Exception):
+    def __init__(self, nombre: str, reintentar_en: int = 1):
+        super().__init__(f"Pool de procesos '{nombre}' saturado")
+        self.nombre = nombre
+        self.reintentar_en = reintentar_en
+
+
+class PoolProcesosAcotado:
+    """
+    max_procesos tareas en ejecución más max_pendientes en cola como máximo.
+    Los procesos se crean con "spawn" (no heredan hilos ni conexiones del
+    servidor) y solo al enviar la primera tarea
+    """
+
+    def __init__(self, nombre: str, max_procesos: int, max_pendientes: int):
+        self.nombre = nombre
+        self.max_procesos = max_procesos
+        self.max_pendientes = max_pendientes
+        self._ejecutor = None
+        self._lock = threading.Lock()
+        self._en_curso = 0
+        self.completadas = 0
+        self.fallidas = 0
+        self.rechazadas = 0
+        # Desde que se envía la tarea hasta que termina (espera en cola + ejecución)
+        self._segundos_total = 0.0
+        self._segundos_max = 0.0
+        POOLS[nombre] = self
+
+    def _obtener_ejecutor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._ejecutor is None:
+                self._ejecutor = ProcessPoolExecutor(
+                    max_workers=self.max_procesos, mp_context=get_context("spawn")
+                )
+            return self._ejecutor
+
+    def _reservar(self):
+        with self._lock:
+            if self._en_curso >= self.max_procesos + self.max_pendientes:
+                self.rechazadas += 1
+                raise PoolSaturado(self.nombre)
+            self._en_curso += 1
+
+    def _liberar(self, inicio: float, futuro: Future):
+        segundos = time.perf_counter() - inicio
+        with self._lock:
+            self._en_curso -= 1
+            if futuro.cancelled() or futuro.exception() is not None:
+                self.fallidas += 1
+            else:
+                self.completadas += 1
+                self._segundos_total += segundos
+                self._segundos_max = max(self._segundos_max, segundos)
+
+    def enviar(self, fn: Callable, *args) -> Future:
+        """Envía fn(*args) al pool; fn debe poder importarse desde un módulo (pickle)"""
+        self._reservar()
+        inicio = time.perf_counter()
+        try:
+            futuro = self._obtener_ejecutor().submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self._en_curso -= 1
+            raise
+        futuro.add_done_callback(partial(self._liberar, inicio))
+        return futuro
+
+    async def ejecutar(self, fn: Callable, *args):
+        """Versión para endpoints async: espera el resultado sin ocupar un hilo"""
+        return await asyncio.wrap_future(self.enviar(fn, *args))
+
+    def cerrar(self):
+        with self._lock:
+            ejecutor, self._ejecutor = self._ejecutor, None
+        if ejecutor is not None:
+            ejecutor.shutdown(wait=True, cancel_futures=True)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "procesos": self.max_procesos,
+                "max_pendientes": self.max_pendientes,
+                "en_curso": self._en_curso,
+                "en_cola": max(0, self._en_curso - self.max_procesos),
+                "completadas": self.completadas,
+                "fallidas": self.fallidas,
+                "rechazadas": self.rechazadas,
+                "tiempo_medio_ms": (
+                    round(self._segundos_total / self.completadas * 1000, 1) if self.completadas else None
+                ),
+                "tiempo_max_ms": round(self._segundos_max * 1000, 1),
+            }
+
+
+def estadisticas_pools() -> dict:
+    return {nombre: pool.estadisticas() for nombre, pool in POOLS.items()}
@@ -0,0 +1,185 @@
+"""
+PDF de recetas con caché por contenido.
+
+El PDF se genera en memoria (sin archivos) en un pool de procesos acotado:
+reportlab es CPU pura y en el proceso del servidor frenaría al resto de los
+requests. Con el pool lleno se lanza PoolSaturado (503 con Retry-After).
+
+El resultado se guarda en una CacheLRU acotada por tamaño. La clave es el
+hash SHA-256 de los datos que se imprimen: descargar otra vez una receta
+que no cambió no vuelve a pasar por reportlab, y si cambia cualquier dato
+la clave es otra.
+
+Los lotes (varias recetas en un solo documento) toman de la caché las que
+ya están, reparten las que faltan en varias tareas del pool para
+generarlas en paralelo y unen todo con pypdf, también en el pool.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from io import BytesIO
+from typing import List
+
+from backend.cache import CacheLRU
+from backend.config import settings
+from backend.procesos import PoolProcesosAcotado, PoolSaturado
+
+logger = logging.getLogger(__name__)
+
+cache_pdf = CacheLRU(
+    "recetas_pdf", settings.pdf_cache_max_entradas, settings.pdf_cache_ttl_segundos,
+    max_bytes=settings.pdf_cache_max_mb * 1024 * 1024,
+)
+pool_pdf = PoolProcesosAcotado("pdf", settings.pdf_procesos, settings.pdf_max_pendientes)
+
+_lock = threading.Lock()
+_generados = 0
+_segundos_total = 0.0
+_segundos_max = 0.0
+
+
+def datos_receta(receta) -> dict:
+    """Datos que imprime el PDF; la receta debe tener paciente, medico y medicamentos cargados"""
+    paciente = receta.paciente
+    medico = receta.medico
+    return {
+        'id': receta.id,
+        'fecha': receta.fecha_emision.strftime('%d/%m/%Y'),
+        'emitida': receta.fecha_emision.strftime('%d/%m/%Y %H:%M'),
+        'medico_nombre': medico.nombre_completo,
+        'medico_codigo': getattr(medico, "codigo_medico", None) or "N/A",
+        'paciente_nombre': f"{paciente.nombre} {paciente.apellidos}",
+        'paciente_id': paciente.identificacion,
+        'medicamentos': [
+            {
+                'nombre': med.nombre,
+                'dosis': med.dosis,
+                'frecuencia': med.frecuencia,
+                'duracion': med.duracion,
+                'via': med.via
+            }
+            for med in receta.medicamentos
+        ],
+        'indicaciones': receta.indicaciones_generales
+    }
+
+
+def clave_pdf(datos: dict) -> str:
+    contenido = json.dumps(datos, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def renderizar(datos: dict):
+    """(contenido del PDF, segundos de reportlab); corre en los procesos de pool_pdf"""
+    # reportlab se importa en el proceso del pool con el primer PDF, nunca en la API
+    from backend.pdf_generator import generar_receta_pdf
+
+    inicio = time.perf_counter()
+    pdf = generar_receta_pdf(datos)
+    return pdf, time.perf_counter() - inicio
+
+
+def renderizar_varios(lista: List[dict]) -> list:
+    """renderizar() de varias recetas en una sola tarea del pool"""
+    return [renderizar(datos) for datos in lista]
+
+
+def unir(pdfs: List[bytes]) -> bytes:
+    """Un solo PDF con las páginas de todos, en el mismo orden; corre en pool_pdf"""
+    from pypdf import PdfWriter
+
+    escritor = PdfWriter()
+    for pdf in pdfs:
+        escritor.append(BytesIO(pdf))
+    salida = BytesIO()
+    escritor.write(salida)
+    return salida.getvalue()
+
+
+def _registrar(segundos: float):
+    global _generados, _segundos_total, _segundos_max
+    with _lock:
+        _generados += 1
+        _segundos_total += segundos
+        _segundos_max = max(_segundos_max, segundos)
+
+
+async def pdf_receta(datos: dict) -> bytes:
+    """Contenido del PDF, de la caché o generado en pool_pdf (PoolSaturado si está lleno)"""
+    clave = clave_pdf(datos)
+    pdf = cache_pdf.obtener(clave)
+    if pdf is None:
+        pdf, segundos = await pool_pdf.ejecutar(renderizar, datos)
+        cache_pdf.guardar(clave, pdf)
+        _registrar(segundos)
+    return pdf
+
+
+async def pdf_lote(lista: List[dict]) -> bytes:
+    """
+    Un solo PDF con las recetas de la lista, en orden. Las que faltan en la
+    caché se generan en hasta 4 tareas por proceso del pool, para que las
+    descargas individuales no esperen a que termine el lote entero.
+    PoolSaturado si el pool no tiene lugar para todas las tareas
+    """
+    claves = [clave_pdf(datos) for datos in lista]
+    pdfs = {clave: cache_pdf.obtener(clave) for clave in claves}
+    faltantes = {clave: datos for clave, datos in zip(claves, lista) if pdfs[clave] is None}
+
+    grupos = list(faltantes.items())
+    tam = max(10, math.ceil(len(grupos) / (pool_pdf.max_procesos * 4)))
+    grupos = [grupos[i:i + tam] for i in range(0, len(grupos), tam)]
+    futuros = []
+    try:
+        for grupo in grupos:
+            futuros.append(pool_pdf.enviar(renderizar_varios, [datos for _, datos in grupo]))
+    except PoolSaturado:
+        for futuro in futuros:
+            futuro.cancel()
+        raise
+
+    for grupo, resultados in zip(grupos, await asyncio.gather(*map(asyncio.wrap_future, futuros))):
+        for (clave, _), (pdf, segundos) in zip(grupo, resultados):
+            pdfs[clave] = pdf
+            cache_pdf.guardar(clave, pdf)
+            _registrar(segundos)
+
+    return await pool_pdf.ejecutar(unir, [pdfs[clave] for clave in claves])
+
+
+def estadisticas() -> dict:
+    """Tiempo de reportlab por PDF (la espera en cola está en las métricas del pool "pdf")"""
+    with _lock:
+        return {
+            "generados": _generados,
+            "render_medio_ms": round(_segundos_total / _generados * 1000, 1) if _generados else None,
+            "render_max_ms": round(_segundos_max * 1000, 1),
+        }
+
+
+def limpiar_directorio_legado() -> int:
+    """
+    Borra los receta_*.pdf que escribían las versiones anteriores y tienen
+    más de pdf_retencion_legado_horas; el directorio se elimina si queda
+    vacío. Devuelve la cantidad de archivos borrados
+    """
+    directorio = settings.pdf_directorio_legado
+    if not directorio or not os.path.isdir(directorio):
+        return 0
+    limite = time.time() - settings.pdf_retencion_legado_horas * 3600
+    borrados = 0
+    for nombre in os.listdir(directorio):
+        ruta = os.path.join(directorio, nombre)
+        if nombre.startswith("receta_") and nombre.endswith(".pdf") and os.path.getmtime(ruta) <= limite:
+            os.remove(ruta)
+            borrados += 1
+    if not os.listdir(directorio):
+        os.rmdir(directorio)
+    if borrados:
+        logger.info("PDFs de recetas borrados de %s: %s", directorio, borrados)
+    return borrados
@@ -0,0 +1,133 @@
+"""
+Registro de tokens revocados (logout) por jti.
+
+En memoria: un set con todos los jti revocados (la verificación por request
+es una búsqueda en el set) y cubetas por instante de expiración para
+descartar los jti cuyo token ya venció de todas formas.
+
+En disco: un archivo de solo-agregar con una línea "jti exp" por revocación.
+Al arrancar se cargan las líneas no vencidas, y cada worker relee lo que
+otros agregaron como máximo cada `sincronizar_cada` segundos. revocar()
+toma un lock exclusivo del archivo y lo relee antes de agregar la línea,
+así que entre los workers de un mismo servidor un jti se revoca una sola
+vez (lo que necesita la rotación de refresh tokens). En Windows no hay
+flock y la exclusión queda limitada a cada proceso.
+
+Uso (mantenimiento, con la API detenida):
+    python -m backend.revocacion datos/revocaciones.log   # compacta el archivo
+"""
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class RegistroRevocaciones:
+    def __init__(self, ruta: Optional[str], ancho_cubeta: int = 60, sincronizar_cada: float = 1.0):
+        self.ruta = ruta
+        self.ancho_cubeta = ancho_cubeta
+        self.sincronizar_cada = sincronizar_cada
+        self._revocados = set()
+        self._cubetas = {}  # exp // ancho_cubeta -> [jti]
+        self._lock = threading.Lock()
+        self._posicion = 0
+        self._proxima_sincronizacion = 0.0
+        self._proxima_limpieza = 0
+
+    def _agregar(self, jti: str, exp: int) -> bool:
+        if exp <= time.time() or jti in self._revocados:
+            return False
+        self._revocados.add(jti)
+        self._cubetas.setdefault(exp // self.ancho_cubeta, []).append(jti)
+        return True
+
+    def _limpiar_vencidos(self):
+        ahora = int(time.time())
+        if ahora < self._proxima_limpieza:
+            return
+        self._proxima_limpieza = ahora + self.ancho_cubeta
+        actual = ahora // self.ancho_cubeta
+        for cubeta in [c for c in self._cubetas if c < actual]:
+            self._revocados.difference_update(self._cubetas.pop(cubeta))
+
+    def _leer_archivo(self):
+        """Incorpora las líneas agregadas al archivo desde la última lectura"""
+        if not self.ruta or not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, "rb") as archivo:
+            archivo.seek(self._posicion)
+            datos = archivo.read()
+        # Una línea incompleta (otro worker escribiendo) se lee en la próxima sincronización
+        completos = datos[:datos.rfind(b"\n") + 1]
+        self._posicion += len(completos)
+        for linea in completos.decode().splitlines():
+            partes = linea.split()
+            if len(partes) == 2 and partes[1].isdigit():
+                self._agregar(partes[0], int(partes[1]))
+
+    def cargar(self):
+        with self._lock:
+            self._posicion = 0
+            self._leer_archivo()
+            self._proxima_sincronizacion = time.monotonic() + self.sincronizar_cada
+
+    def revocar(self, jti: str, exp: int) -> bool:
+        """
+        Revoca el token hasta su expiración (exp en segundos epoch). False si
+        ya estaba revocado, en este u otro worker, o ya venció
+        """
+        with self._lock:
+            if not self.ruta:
+                nuevo = self._agregar(jti, exp)
+                self._limpiar_vencidos()
+                return nuevo
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            with open(self.ruta, "a", encoding="utf-8") as archivo:
+                if fcntl is not None:
+                    fcntl.flock(archivo, fcntl.LOCK_EX)  # se libera al cerrar
+                # Lo que otros workers revocaron desde la última sincronización
+                self._leer_archivo()
+                nuevo = self._agregar(jti, exp)
+                self._limpiar_vencidos()
+                if nuevo:
+                    archivo.write(f"{jti} {int(exp)}\n")
+            return nuevo
+
+    def esta_revocado(self, jti: Optional[str]) -> bool:
+        if jti is None:
+            return False
+        if self.ruta and time.monotonic() >= self._proxima_sincronizacion:
+            with self._lock:
+                if time.monotonic() >= self._proxima_sincronizacion:
+                    self._proxima_sincronizacion = time.monotonic() + self.sincronizar_cada
+                    self._leer_archivo()
+                    self._limpiar_vencidos()
+        return jti in self._revocados
+
+    def estadisticas(self) -> dict:
+        return {"revocados": len(self._revocados), "cubetas": len(self._cubetas)}
+
+
+def compactar(ruta: str) -> int:
+    """Reescribe el archivo solo con las revocaciones no vencidas"""
+    registro = RegistroRevocaciones(ruta)
+    registro.cargar()
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        for cubeta in sorted(registro._cubetas):
+            for jti in registro._cubetas[cubeta]:
+                archivo.write(f"{jti} {(cubeta + 1) * registro.ancho_cubeta}\n")
+    os.replace(temporal, ruta)
+    return len(registro._revocados)
+
+
+if __name__ == "__main__":
+    print(f"{compactar(sys.argv[1])} revocaciones vigentes")
@@ -0,0 +1,109 @@
+"""
+Benchmark del arranque en frío de la API.
+
+Lanza procesos nuevos de Python (como un worker de uvicorn que se reinicia)
+que importan backend.main con -X importtime, inician la app y hacen el
+primer request a /health. Sobre una base SQLite temporal ya migrada
+(`python -m backend.migraciones`), informa:
+- tiempo hasta el primer request, desde que se lanza el proceso
+- tiempo de import de backend.main y los paquetes que más tardan en
+  importarse (suma del tiempo propio de sus módulos, según importtime)
+- si algún módulo pesado que debe cargarse bajo demanda (fhir.resources,
+  reportlab) se importó durante el arranque
+
+Termina con error si la mediana del primer request supera el presupuesto o
+si se cargó algún módulo diferido.
+
+Uso:
+    python -m benchmarks.arranque --repeticiones 5 --presupuesto-ms 2500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Se cargan en el primer uso (validación FHIR, PDFs), nunca al arrancar
+DIFERIDOS = ("fhir.resources", "reportlab")
+
+PROCESO = """
+import json, sys, time
+inicio = time.perf_counter()
+from backend.main import app
+importado = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app) as cliente:
+    assert cliente.get("/health").status_code == 200
+    fin = time.time()
+print(json.dumps({
+    "importar": importado - inicio,
+    "primer_request_fin": fin,
+    "diferidos": sorted({m.split(".")[0] for m in sys.modules if m.startswith(%r)}),
+}))
+""" % (DIFERIDOS,)
+
+
+def paquetes_mas_lentos(importtime: str, cantidad: int):
+    """(paquete, segundos) sumando el tiempo propio de cada módulo del paquete"""
+    por_paquete = defaultdict(int)
+    for linea in importtime.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, _, modulo = linea[len("import time:"):].split("|")
+        por_paquete[modulo.strip().split(".")[0]] += int(propio)
+    return sorted(((p, us / 1e6) for p, us in por_paquete.items()), key=lambda x: -x[1])[:cantidad]
+
+
+def arrancar(env: dict):
+    inicio = time.time()
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROCESO],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    resultado = json.loads(proceso.stdout.strip().splitlines()[-1])
+    resultado["primer_request"] = resultado.pop("primer_request_fin") - inicio
+    return resultado, proceso.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--presupuesto-ms", type=float, default=2500,
+                        help="mediana máxima del tiempo hasta el primer request")
+    parser.add_argument("--paquetes", type=int, default=10, help="paquetes más lentos a mostrar")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, ECE_DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        subprocess.run([sys.executable, "-m", "backend.migraciones"], env=env, capture_output=True, check=True)
+
+        resultados = []
+        for _ in range(args.repeticiones):
+            resultado, importtime = arrancar(env)
+            resultados.append(resultado)
+
+    importar = statistics.median(r["importar"] for r in resultados)
+    primer_request = statistics.median(r["primer_request"] for r in resultados)
+    diferidos = sorted({m for r in resultados for m in r["diferidos"]})
+
+    print(f"import backend.main  {importar * 1000:7.0f} ms (mediana de {args.repeticiones})")
+    print(f"primer request       {primer_request * 1000:7.0f} ms  (presupuesto {args.presupuesto_ms:.0f} ms)")
+    print("paquetes más lentos (último arranque, tiempo propio de sus módulos):")
+    for paquete, segundos in paquetes_mas_lentos(importtime, args.paquetes):
+        print(f"  {paquete:<24} {segundos * 1000:7.1f} ms")
+
+    errores = []
+    if diferidos:
+        errores.append(f"módulos diferidos importados al arrancar: {', '.join(diferidos)}")
+    if primer_request * 1000 > args.presupuesto_ms:
+        errores.append(f"primer request en {primer_request * 1000:.0f} ms, supera el presupuesto")
+    if errores:
+        sys.exit("\n".join(errores))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Benchmark de búsqueda de pacientes.
+
+Compara tres estrategias sobre la misma base SQLite:
+- escaneo: traer todos los pacientes y filtrar en Python (lo que hacía el frontend)
+- like: un SELECT con LIKE '%termino%' por columna (escaneo completo en el motor)
+- fts5: la tabla pacientes_fts de backend.busqueda con prefijos y bm25
+
+Con --difusa mide además la búsqueda por trigramas (nombres_trigramas) con
+búsquedas sin tildes y con errores de tipeo, a distintos tamaños de tabla
+para comprobar que el costo no crece linealmente.
+
+Uso:
+    python -m benchmarks.busqueda_pacientes --pacientes 1000000 --repeticiones 20
+    python -m benchmarks.busqueda_pacientes --pacientes 1000000 --difusa
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from backend.busqueda import (
+    COLUMNAS_BUSQUEDA, DDL_FTS, MAX_CANDIDATOS_RANKING, expresion_fts,
+    nombre_normalizado, normalizar, puntaje_nombre, similitud, trigramas,
+)
+from backend.config import settings
+
+NOMBRES = ["José", "María", "Juan", "Ana", "Luis", "Carmen", "Carlos", "Lucía", "Jorge", "Sofía",
+           "Andrés", "Valeria", "Diego", "Daniela", "Pedro", "Gabriela", "Miguel", "Fernanda"]
+APELLIDOS = ["Pérez", "Rodríguez", "González", "Mora", "Jiménez", "Vargas", "Rojas", "Castro",
+             "Herrera", "Solís", "Araya", "Chaves", "Quesada", "Villalobos", "Brenes", "Alfaro"]
+
+BUSQUEDAS = ["jose perez", "mar", "1-0042", "villalobos chaves", "8800", "ana@", "maria 1-00"]
+BUSQUEDAS_DIFUSAS = ["Jose Peres", "maria rodriges", "VILLALOBO CHAVEZ", "andres quezada"]
+
+
+def preparar_base(ruta, total):
+    conn = sqlite3.connect(ruta)
+    conn.execute(
+        "CREATE TABLE pacientes (id INTEGER PRIMARY KEY, identificacion TEXT UNIQUE, "
+        "nombre TEXT, apellidos TEXT, telefono TEXT, email TEXT)"
+    )
+    aleatorio = random.Random(42)
+
+    def filas():
+        for i in range(total):
+            nombre = aleatorio.choice(NOMBRES)
+            apellidos = f"{aleatorio.choice(APELLIDOS)} {aleatorio.choice(APELLIDOS)}"
+            yield (
+                f"{i % 9 + 1}-{i // 9 % 10000:04d}-{i:06d}",
+                nombre,
+                apellidos,
+                f"8{aleatorio.randrange(10_000_000):07d}",
+                f"{nombre.lower()}.{i}@correo.com",
+            )
+
+    conn.executemany(
+        "INSERT INTO pacientes (identificacion, nombre, apellidos, telefono, email) VALUES (?, ?, ?, ?, ?)",
+        filas(),
+    )
+    for sentencia in DDL_FTS:
+        conn.execute(sentencia)
+    conn.commit()
+    conn.close()
+
+
+def escaneo(conn, q, limite):
+    columnas = ", ".join(("id",) + COLUMNAS_BUSQUEDA)
+    pacientes = conn.execute(f"SELECT {columnas} FROM pacientes").fetchall()
+    q = q.lower()
+    return [p for p in pacientes if q in p[1].lower() or q in p[2].lower() or q in p[3]][:limite]
+
+
+def like(conn, q, limite):
+    condiciones = " AND ".join(
+        "(" + " OR ".join(f"{c} LIKE ?" for c in COLUMNAS_BUSQUEDA) + ")" for _ in q.split()
+    )
+    parametros = [f"%{t}%" for t in q.split() for _ in COLUMNAS_BUSQUEDA]
+    return conn.execute(
+        f"SELECT id FROM pacientes WHERE {condiciones} ORDER BY apellidos, nombre LIMIT {int(limite)}",
+        parametros,
+    ).fetchall()
+
+
+def fts5(conn, q, limite):
+    # Mismas sentencias que backend.busqueda._buscar_fts
+    expresion = expresion_fts(q)
+    candidatos = conn.execute(
+        "SELECT count(*) FROM (SELECT rowid FROM pacientes_fts WHERE pacientes_fts MATCH ? LIMIT ?)",
+        (expresion, MAX_CANDIDATOS_RANKING + 1),
+    ).fetchone()[0]
+    orden = "rowid DESC" if candidatos > MAX_CANDIDATOS_RANKING else "rank"
+    return conn.execute(
+        f"SELECT p.id FROM (SELECT rowid, rank FROM pacientes_fts WHERE pacientes_fts MATCH ? "
+        f"ORDER BY {orden} LIMIT ?) r JOIN pacientes p ON p.id = r.rowid ORDER BY r.{orden}",
+        (expresion, limite),
+    ).fetchall()
+
+
+def preparar_trigramas(ruta):
+    conn = sqlite3.connect(ruta)
+    conn.execute(
+        "CREATE TABLE nombres_trigramas (trigrama VARCHAR(3), palabra VARCHAR, "
+        "PRIMARY KEY (trigrama, palabra))"
+    )
+    conn.execute("ALTER TABLE pacientes ADD COLUMN nombre_normalizado VARCHAR")
+    filas = conn.execute("SELECT id, nombre, apellidos FROM pacientes").fetchall()
+    normalizados = [(nombre_normalizado(n, a), pid) for pid, n, a in filas]
+    conn.executemany("UPDATE pacientes SET nombre_normalizado = ? WHERE id = ?", normalizados)
+    palabras = {p for n, _ in normalizados for p in n.split()}
+    conn.executemany(
+        "INSERT OR IGNORE INTO nombres_trigramas (trigrama, palabra) VALUES (?, ?)",
+        ((t, p) for p in palabras for t in trigramas(p)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def difusa(conn, q, limite):
+    # Mismas sentencias que backend.busqueda.buscar_similares
+    palabras = normalizar(q).split()
+    grupos = []
+    for palabra in palabras:
+        consulta = trigramas(palabra)
+        minimo = max(1, int(len(consulta) * settings.busqueda_similitud_minima))
+        candidatas = conn.execute(
+            f"SELECT palabra, count(*) AS comunes FROM nombres_trigramas "
+            f"WHERE trigrama IN ({', '.join('?' * len(consulta))}) "
+            f"GROUP BY palabra HAVING comunes >= ? ORDER BY comunes DESC LIMIT ?",
+            (*sorted(consulta), minimo, settings.busqueda_max_candidatos),
+        ).fetchall()
+        puntuadas = sorted(((similitud(consulta, trigramas(c)), c) for c, _ in candidatas if c != palabra), reverse=True)
+        grupos.append([palabra] + [c for s, c in puntuadas[:settings.busqueda_max_variantes]
+                                   if s >= settings.busqueda_similitud_minima])
+    expresion = " AND ".join(
+        "(" + " OR ".join([f'"{g[0]}"*'] + [f'"{v}"' for v in g[1:]]) + ")" for g in grupos
+    )
+    ids = [r[0] for r in conn.execute(
+        "SELECT rowid FROM pacientes_fts WHERE pacientes_fts MATCH ? ORDER BY rowid DESC LIMIT ?",
+        (f"{{nombre apellidos}} : ({expresion})", settings.busqueda_max_candidatos),
+    )]
+    nombres = conn.execute(
+        f"SELECT id, nombre_normalizado FROM pacientes WHERE id IN ({', '.join('?' * len(ids))})", ids
+    ).fetchall() if ids else []
+    return sorted((-puntaje_nombre(palabras, n), pid) for pid, n in nombres)[:limite]
+
+
+def medir(fn, conn, repeticiones, limite, busquedas=BUSQUEDAS):
+    tiempos = []
+    for _ in range(repeticiones):
+        for q in busquedas:
+            inicio = time.perf_counter()
+            fn(conn, q, limite)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), max(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pacientes", type=int, default=200_000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--limite", type=int, default=20)
+    parser.add_argument("--difusa", action="store_true", help="medir también la búsqueda por trigramas")
+    args = parser.parse_args()
+
+    if args.difusa:
+        for total in (args.pacientes // 10, args.pacientes):
+            with tempfile.TemporaryDirectory() as tmp:
+                ruta = os.path.join(tmp, "bench.db")
+                preparar_base(ruta, total)
+                preparar_trigramas(ruta)
+                conn = sqlite3.connect(ruta)
+                mediana, peor = medir(difusa, conn, args.repeticiones, args.limite, BUSQUEDAS_DIFUSAS)
+                print(f"trigramas {total:>9d} pacientes  mediana={mediana:9.2f} ms  peor={peor:9.2f} ms")
+                conn.close()
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, "bench.db")
+        inicio = time.perf_counter()
+        preparar_base(ruta, args.pacientes)
+        print(f"{args.pacientes} pacientes cargados e indexados en {time.perf_counter() - inicio:.1f}s")
+
+        conn = sqlite3.connect(ruta)
+        for nombre, fn in (("escaneo en Python", escaneo), ("LIKE en SQL", like), ("FTS5", fts5)):
+            mediana, peor = medir(fn, conn, args.repeticiones, args.limite)
+            print(f"{nombre:20s} mediana={mediana:9.2f} ms  peor={peor:9.2f} ms")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
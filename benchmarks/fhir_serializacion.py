@@ -0,0 +1,133 @@
+"""
+Benchmark de la serialización FHIR.
+
+Arma en memoria el historial de un paciente (consultas, recetas y órdenes de
+laboratorio, sin base de datos) y lo convierte a un Bundle collection de
+dos formas:
+- pydantic: cada recurso se valida con su modelo de fhir.resources y se
+  vuelve a convertir con .dict(), el Bundle se valida otra vez y FastAPI lo
+  recorre con jsonable_encoder antes de json.dumps (lo que hacía la API
+  antes del camino directo)
+- directo: los dicts de backend.fhir_converter y json.dumps, como lo envía
+  JSONResponse
+
+Que los dicts producen el mismo JSON que el conversor anterior con
+fhir.resources lo comprueba tests/test_fhir_conformidad.py.
+
+Uso:
+    python -m benchmarks.fhir_serializacion --consultas 2000 --repeticiones 3
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fhir.resources.R4B import get_fhir_model_class
+
+from backend import fhir_converter, models
+from backend.config import settings
+
+
+def historial(consultas: int):
+    """Paciente, médico y objetos del modelo (transitorios) con consultas/recetas/órdenes"""
+    azar = random.Random(1)
+    inicio = datetime(2015, 1, 1, 8, 0)
+    medico = models.Usuario(id=1, nombre_completo="Dra. Ana Pérez")
+    paciente = models.Paciente(
+        id=1, identificacion="1-1234-5678", nombre="José María", apellidos="Mora Solís",
+        fecha_nacimiento=datetime(1970, 5, 3), genero="Masculino", telefono="8888-0000",
+        email="jm@example.com", direccion="San José, Costa Rica"
+    )
+    filas = []
+    for i in range(consultas):
+        fecha = inicio + timedelta(days=i, microseconds=azar.randint(0, 999999))
+        filas.append(models.Consulta(
+            id=i, fecha=fecha, motivo="Control", signos_vitales="PA: 120/80, T: 36.5°C",
+            diagnostico="Hipertensión arterial", tratamiento="Dieta baja en sodio"
+        ))
+        receta = models.Receta(id=i, fecha_emision=fecha, activa=True, indicaciones_generales="Tomar con comida")
+        receta.medicamentos = [
+            models.RecetaMedicamento(posicion=k, nombre="Losartán", dosis="50 mg", frecuencia="c/24h",
+                                     duracion="30 días", via="Oral")
+            for k in (1, 2)
+        ]
+        filas.append(receta)
+        orden = models.OrdenLaboratorio(
+            id=i, fecha_orden=fecha, fecha_resultado=fecha + timedelta(hours=6),
+            estado="completado", diagnostico_presuntivo="Control"
+        )
+        orden.examenes = [
+            models.ExamenLaboratorio(numero=1, codigo_loinc="2345-7", nombre="Glucosa", resultado="95",
+                                     valor_referencia="70-100", unidad="mg/dL"),
+            models.ExamenLaboratorio(numero=2, codigo_loinc="2093-3", nombre="Colesterol", resultado="normal"),
+        ]
+        filas.append(orden)
+    return paciente, medico, filas
+
+
+def entradas(paciente, medico, filas) -> list:
+    """(fullUrl, recurso) con los dicts del camino directo"""
+    resultado = [(f"urn:uuid:patient-{paciente.id}", fhir_converter.paciente_to_fhir(paciente))]
+    for fila in filas:
+        if isinstance(fila, models.Consulta):
+            bundle = fhir_converter.consulta_to_fhir_bundle(fila, paciente)
+            resultado += [(entrada["fullUrl"], entrada["resource"]) for entrada in bundle["entry"]]
+        elif isinstance(fila, models.Receta):
+            for recurso in fhir_converter.receta_to_fhir_medication_request(fila, paciente, medico):
+                resultado.append((f"urn:uuid:{recurso['id']}", recurso))
+        else:
+            convertido = fhir_converter.orden_laboratorio_to_fhir_diagnostic_report(fila, paciente, medico)
+            for recurso in [convertido["diagnosticReport"]] + convertido["observations"]:
+                resultado.append((f"urn:uuid:{recurso['id']}", recurso))
+    return resultado
+
+
+def camino_pydantic(paciente, medico, filas) -> bytes:
+    lista = [
+        (full_url, get_fhir_model_class(recurso["resourceType"]).parse_obj(recurso).dict())
+        for full_url, recurso in entradas(paciente, medico, filas)
+    ]
+    Bundle = get_fhir_model_class("Bundle")
+    bundle = Bundle(type="collection", entry=[{"fullUrl": u, "resource": r} for u, r in lista]).dict()
+    return json.dumps(jsonable_encoder(bundle), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def camino_directo(paciente, medico, filas) -> bytes:
+    bundle = fhir_converter.bundle_coleccion(entradas(paciente, medico, filas))
+    return json.dumps(bundle, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def medir(funcion, datos, repeticiones: int):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cuerpo = funcion(*datos)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), len(cuerpo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consultas", type=int, default=2000, help="consultas (y recetas y órdenes) del historial")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    datos = historial(args.consultas)
+
+    t_pydantic, tam = medir(camino_pydantic, datos, args.repeticiones)
+    t_directo, tam_directo = medir(camino_directo, datos, args.repeticiones)
+    assert tam == tam_directo
+    settings.fhir_validar = True
+    t_validado, _ = medir(camino_directo, datos, args.repeticiones)
+    settings.fhir_validar = False
+
+    print(f"Bundle de {tam / 1e6:.1f} MB")
+    print(f"pydantic            {t_pydantic * 1000:8.0f} ms")
+    print(f"directo             {t_directo * 1000:8.0f} ms  ({t_pydantic / t_directo:.1f}x)")
+    print(f"directo + validar   {t_validado * 1000:8.0f} ms  (fhir_validar=true)")
+
+
+if __name__ == "__main__":
+    main()
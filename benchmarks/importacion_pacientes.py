@@ -0,0 +1,104 @@
+"""
+Benchmark de la importación masiva de pacientes.
+
+Compara, sobre una base SQLite temporal con las migraciones aplicadas
+(FTS5 y trigramas incluidos):
+- por fila: lo que hace POST /api/pacientes en cada llamada (consulta de
+  duplicado, INSERT por el ORM, commit y refresh), sobre una muestra
+- importación: backend.importacion.importar_pacientes con el CSV completo
+  enviado en fragmentos de 64 KiB, como llega el cuerpo del request
+
+Uso:
+    python -m benchmarks.importacion_pacientes --pacientes 100000 --muestra 2000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.database import crear_async_engine, crear_engine, url_asincrona
+from backend.importacion import importar_pacientes
+from backend.migraciones import aplicar_migraciones
+
+FRAGMENTO = 64 * 1024
+
+
+def generar_csv(total: int, desde: int = 0) -> bytes:
+    filas = ["identificacion,nombre,apellidos,fecha_nacimiento,genero,telefono,email,direccion"]
+    for i in range(desde, desde + total):
+        filas.append(
+            f"1-{i:07d},Nombre{i % 997},Apellido{i % 1499} Segundo{i % 211},1980-01-{i % 28 + 1:02d},"
+            f"Femenino,8800{i:04d},p{i}@example.com,\"Calle {i}, casa {i % 50}\""
+        )
+    return ("\n".join(filas) + "\n").encode()
+
+
+async def fragmentos(datos: bytes):
+    for inicio in range(0, len(datos), FRAGMENTO):
+        # request.stream() espera cada fragmento de la red: cede el event loop
+        await asyncio.sleep(0)
+        yield datos[inicio:inicio + FRAGMENTO]
+
+
+def por_fila(Session, total: int) -> float:
+    inicio = time.perf_counter()
+    for i in range(total):
+        with Session() as db:
+            identificacion = f"2-{i:07d}"
+            db.query(models.Paciente).filter(models.Paciente.identificacion == identificacion).first()
+            paciente = models.Paciente(
+                identificacion=identificacion, nombre=f"Nombre{i}", apellidos="Apellido",
+                fecha_nacimiento=datetime(1980, 1, 1), genero="Femenino",
+                telefono="", email="", direccion=""
+            )
+            db.add(paciente)
+            db.commit()
+            db.refresh(paciente)
+    return time.perf_counter() - inicio
+
+
+async def importar(AsyncSessionLocal, datos: bytes):
+    async with AsyncSessionLocal() as db:
+        inicio = time.perf_counter()
+        resultado = await importar_pacientes(db, fragmentos(datos), "csv")
+        return time.perf_counter() - inicio, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pacientes", type=int, default=100000)
+    parser.add_argument("--muestra", type=int, default=2000, help="filas medidas con el camino por fila")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = crear_engine(url)
+        aplicar_migraciones(engine)
+        async_engine = crear_async_engine(url_asincrona(url))
+        AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+        segundos = por_fila(sessionmaker(bind=engine, autoflush=False), args.muestra)
+        print(f"por fila     {args.muestra / segundos:9.0f} filas/s  "
+              f"(estimado para {args.pacientes}: {segundos / args.muestra * args.pacientes:6.1f} s)")
+
+        datos = generar_csv(args.pacientes)
+        segundos, resultado = asyncio.run(importar(AsyncSessionLocal, datos))
+        print(f"importación  {args.pacientes / segundos:9.0f} filas/s  total={segundos:6.1f} s  "
+              f"creados={resultado['creados']}")
+
+        # Reenviar el mismo archivo: todo duplicado, sin INSERT
+        segundos, resultado = asyncio.run(importar(AsyncSessionLocal, datos))
+        print(f"reimportación {segundos:6.1f} s  duplicados={resultado['duplicados']}")
+
+        asyncio.run(async_engine.dispose())
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark del PDF por lote de recetas (POST /api/recetas/pdf/batch).
+
+Sin base de datos: arma los datos de N recetas y compara
+- secuencial: un PDF por receta en este proceso, como N descargas de
+  /api/recetas/{id}/pdf sin caché (y sin unirlos)
+- lote en frío: backend.recetas_pdf.pdf_lote con la caché vacía (genera en
+  paralelo en pool_pdf y une con pypdf)
+- lote en caliente: el mismo lote otra vez, todas las páginas de la caché
+
+Uso:
+    python -m benchmarks.lote_pdf --recetas 300 --medicamentos 3
+"""
+import argparse
+import asyncio
+import time
+from io import BytesIO
+
+from pypdf import PdfReader
+
+from backend import recetas_pdf
+from backend.pdf_generator import generar_receta_pdf
+from benchmarks.rafaga_pdf import datos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recetas", type=int, default=300)
+    parser.add_argument("--medicamentos", type=int, default=3, help="medicamentos por receta")
+    args = parser.parse_args()
+
+    lista = [datos(i, args.medicamentos) for i in range(args.recetas)]
+    # Calienta el pool para no medir el arranque de los procesos
+    asyncio.run(recetas_pdf.pdf_lote([datos(-1, 1)]))
+
+    inicio = time.perf_counter()
+    for receta in lista:
+        generar_receta_pdf(receta)
+    print(f"secuencial        {time.perf_counter() - inicio:6.2f} s")
+
+    for etiqueta in ("lote en frío", "lote en caliente"):
+        inicio = time.perf_counter()
+        pdf = asyncio.run(recetas_pdf.pdf_lote(lista))
+        segundos = time.perf_counter() - inicio
+        paginas = len(PdfReader(BytesIO(pdf)).pages)
+        print(f"{etiqueta:17s} {segundos:6.2f} s  ({paginas} páginas, {len(pdf) / 1e6:.1f} MB)")
+
+    print(f"pool_pdf: {recetas_pdf.pool_pdf.estadisticas()}")
+    recetas_pdf.pool_pdf.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark de una ráfaga de descargas de PDF de recetas.
+
+Simula el servidor con un event loop y el pool de hilos de Starlette
+(40 hilos por defecto). Mientras llega una ráfaga de PDFs distintos (sin
+aciertos de caché) se mide la latencia de requests livianos atendidos en
+ese pool de hilos:
+- event loop: reportlab dentro del endpoint async def, sin ceder el loop
+- en hilos: reportlab con run_in_threadpool (compite por el GIL con el
+  resto de los requests)
+- pool: backend.recetas_pdf.pdf_receta, reportlab en pool_pdf (como ahora)
+
+Uso:
+    python -m benchmarks.rafaga_pdf --pdfs 200 --livianos 400 --medicamentos 40
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import recetas_pdf
+from backend.pdf_generator import generar_receta_pdf
+from backend.procesos import PoolSaturado
+
+HILOS_STARLETTE = 40
+
+
+def datos(id_receta: int, medicamentos: int) -> dict:
+    return {
+        'id': id_receta,
+        'fecha': '01/03/2025',
+        'emitida': '01/03/2025 09:30',
+        'medico_nombre': 'Dra. Ana Pérez',
+        'medico_codigo': 'MED-1234',
+        'paciente_nombre': 'José María Mora Solís',
+        'paciente_id': f'1-{id_receta:04d}-0000',
+        'medicamentos': [
+            {'nombre': f'Medicamento {k}', 'dosis': '50 mg', 'frecuencia': 'c/8h',
+             'duracion': '7 días', 'via': 'Oral'}
+            for k in range(medicamentos)
+        ],
+        'indicaciones': 'Tomar con abundante agua después de las comidas. ' * 20,
+    }
+
+
+def request_liviano():
+    # Equivale a un GET que resuelve una consulta indexada
+    sum(range(2000))
+
+
+async def ejecutar(modo, pdfs, livianos, medicamentos, primer_id):
+    loop = asyncio.get_running_loop()
+    hilos = ThreadPoolExecutor(max_workers=HILOS_STARLETTE)
+    latencias, rechazados = [], 0
+
+    async def pdf(i):
+        nonlocal rechazados
+        receta = datos(primer_id + i, medicamentos)
+        if modo == "event loop":
+            await asyncio.sleep(0)
+            generar_receta_pdf(receta)
+        elif modo == "en hilos":
+            await loop.run_in_executor(hilos, generar_receta_pdf, receta)
+        else:
+            try:
+                await recetas_pdf.pdf_receta(receta)
+            except PoolSaturado:
+                rechazados += 1  # la API responde 503 con Retry-After
+
+    async def liviano(retraso):
+        await asyncio.sleep(retraso)
+        inicio = time.perf_counter()
+        await loop.run_in_executor(hilos, request_liviano)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(
+        *[pdf(i) for i in range(pdfs)],
+        *[liviano(i * 0.005) for i in range(livianos)],
+    )
+    total = time.perf_counter() - inicio
+    hilos.shutdown()
+    latencias.sort()
+    return {
+        "total_s": total,
+        "p50_ms": statistics.median(latencias),
+        "p99_ms": latencias[int(len(latencias) * 0.99) - 1],
+        "rechazados": rechazados,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", type=int, default=200)
+    parser.add_argument("--livianos", type=int, default=400)
+    parser.add_argument("--medicamentos", type=int, default=40, help="medicamentos por receta")
+    args = parser.parse_args()
+
+    # Calienta el pool para no medir el arranque de los procesos
+    for futuro in [recetas_pdf.pool_pdf.enviar(recetas_pdf.renderizar, datos(0, 1))
+                   for _ in range(recetas_pdf.pool_pdf.max_procesos)]:
+        futuro.result()
+
+    inicio = time.perf_counter()
+    generar_receta_pdf(datos(0, args.medicamentos))
+    print(f"un PDF de {args.medicamentos} medicamentos: {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+    for n, modo in enumerate(("event loop", "en hilos", "pool")):
+        # Ids distintos en cada modo: ningún PDF sale de la caché
+        r = asyncio.run(ejecutar(modo, args.pdfs, args.livianos, args.medicamentos, (n + 1) * args.pdfs))
+        print(
+            f"{modo:10s} total={r['total_s']:6.2f}s  livianos p50={r['p50_ms']:8.2f} ms  "
+            f"p99={r['p99_ms']:8.2f} ms  PDFs rechazados (503)={r['rechazados']}"
+        )
+    print(f"pool_pdf: {recetas_pdf.pool_pdf.estadisticas()}")
+    print(f"render: {recetas_pdf.estadisticas()}")
+    recetas_pdf.pool_pdf.cerrar()
+
+
+if __name__ == "__main__":
+    main()
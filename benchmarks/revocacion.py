@@ -0,0 +1,59 @@
+"""
+Microbenchmark de RegistroRevocaciones.esta_revocado (se llama en cada
+request autenticado) con muchos jti revocados.
+
+Uso:
+    python -m benchmarks.revocacion --revocados 100000 --consultas 200000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from backend.revocacion import RegistroRevocaciones
+
+
+def medir(registro, jtis, consultas):
+    tiempos = []
+    for i in range(consultas):
+        jti = jtis[i % len(jtis)]
+        inicio = time.perf_counter()
+        registro.esta_revocado(jti)
+        tiempos.append((time.perf_counter() - inicio) * 1_000_000_000)
+    tiempos.sort()
+    return statistics.median(tiempos), tiempos[int(len(tiempos) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--revocados", type=int, default=100000)
+    parser.add_argument("--consultas", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, "revocaciones.log")
+        registro = RegistroRevocaciones(ruta)
+        exp = int(time.time()) + 3600
+        revocados = [str(uuid.uuid4()) for _ in range(args.revocados)]
+
+        inicio = time.perf_counter()
+        for jti in revocados:
+            registro.revocar(jti, exp)
+        print(f"revocar: {(time.perf_counter() - inicio) / args.revocados * 1_000_000:.1f} µs por token")
+
+        inicio = time.perf_counter()
+        otro = RegistroRevocaciones(ruta)
+        otro.cargar()
+        print(f"cargar {args.revocados} revocaciones: {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+        vigentes = [str(uuid.uuid4()) for _ in range(1000)]
+        for nombre, jtis in (("revocado", revocados), ("vigente", vigentes)):
+            mediana, p99 = medir(otro, jtis, args.consultas)
+            print(f"esta_revocado ({nombre:8s}) mediana={mediana:6.0f} ns  p99={p99:6.0f} ns")
+        print(f"registro: {otro.estadisticas()}")
+
+
+if __name__ == "__main__":
+    main()
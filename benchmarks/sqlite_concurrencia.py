@@ -0,0 +1,119 @@
+"""
+Benchmark de concurrencia lectura/escritura en SQLite.
+
+Compara el modo por defecto de pysqlite (rollback journal) con el
+perfil de rendimiento de backend.database (WAL + busy_timeout + pragmas).
+Varios hilos escriben en transacciones cortas (recepción, enfermería, médicos
+guardando a la vez) mientras otros leen el historial.
+
+Uso:
+    python -m benchmarks.sqlite_concurrencia --escritores 4 --lectores 8 --segundos 5
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from backend.database import aplicar_pragmas_sqlite
+
+
+def preparar_base(ruta, filas_iniciales=20000):
+    conn = sqlite3.connect(ruta)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute(
+        "CREATE TABLE consultas (id INTEGER PRIMARY KEY, paciente_id INTEGER, "
+        "fecha TEXT, motivo TEXT)"
+    )
+    conn.execute("CREATE INDEX ix_consultas_paciente ON consultas (paciente_id, fecha)")
+    conn.executemany(
+        "INSERT INTO consultas (paciente_id, fecha, motivo) VALUES (?, datetime('now'), ?)",
+        [(i % 500, f"motivo {i}") for i in range(filas_iniciales)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def abrir_conexion(ruta, perfil):
+    if perfil:
+        conn = sqlite3.connect(ruta, check_same_thread=False)
+        aplicar_pragmas_sqlite(conn)
+    else:
+        # Equivalente al engine original: parámetros por defecto de pysqlite
+        conn = sqlite3.connect(ruta, check_same_thread=False)
+    return conn
+
+
+def ejecutar(ruta, perfil, escritores, lectores, segundos):
+    contadores = {"escrituras": 0, "lecturas": 0, "bloqueos": 0}
+    lock = threading.Lock()
+    fin = time.perf_counter() + segundos
+
+    def sumar(clave):
+        with lock:
+            contadores[clave] += 1
+
+    def escritor(n):
+        conn = abrir_conexion(ruta, perfil)
+        i = 0
+        while time.perf_counter() < fin:
+            try:
+                conn.execute(
+                    "INSERT INTO consultas (paciente_id, fecha, motivo) VALUES (?, datetime('now'), ?)",
+                    ((n * 1000 + i) % 500, "nueva"),
+                )
+                conn.commit()
+                sumar("escrituras")
+            except sqlite3.OperationalError:
+                conn.rollback()
+                sumar("bloqueos")
+            i += 1
+        conn.close()
+
+    def lector(n):
+        conn = abrir_conexion(ruta, perfil)
+        i = 0
+        while time.perf_counter() < fin:
+            try:
+                conn.execute(
+                    "SELECT id, fecha, motivo FROM consultas WHERE paciente_id = ? "
+                    "ORDER BY fecha DESC LIMIT 50",
+                    ((n + i) % 500,),
+                ).fetchall()
+                sumar("lecturas")
+            except sqlite3.OperationalError:
+                sumar("bloqueos")
+            i += 1
+        conn.close()
+
+    hilos = [threading.Thread(target=escritor, args=(n,)) for n in range(escritores)]
+    hilos += [threading.Thread(target=lector, args=(n,)) for n in range(lectores)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return contadores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escritores", type=int, default=4)
+    parser.add_argument("--lectores", type=int, default=8)
+    parser.add_argument("--segundos", type=float, default=5.0)
+    args = parser.parse_args()
+
+    for nombre, perfil in (("rollback journal (original)", False), ("perfil WAL", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, "bench.db")
+            preparar_base(ruta)
+            r = ejecutar(ruta, perfil, args.escritores, args.lectores, args.segundos)
+            print(
+                f"{nombre:30s} escrituras/s={r['escrituras'] / args.segundos:9.1f} "
+                f"lecturas/s={r['lecturas'] / args.segundos:9.1f} "
+                f"'database is locked'={r['bloqueos']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark de "tormenta de logins" (cambio de turno).
+
+Simula el servidor con un event loop y el pool de hilos de Starlette
+(40 hilos por defecto). Mientras llega una ráfaga de logins se mide la
+latencia de requests livianos que también se atienden en ese pool de hilos:
+- en hilos: bcrypt dentro del hilo del request (endpoint def, como antes)
+- pool: bcrypt en backend.auth.pool_hash (endpoint async def, como ahora)
+
+Uso:
+    python -m benchmarks.tormenta_login --logins 200 --livianos 400
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.auth import pool_hash
+from backend.hashing import hashear, verificar_y_actualizar
+from backend.procesos import PoolSaturado
+
+HILOS_STARLETTE = 40
+
+
+def request_liviano():
+    # Equivale a un GET que resuelve una consulta indexada
+    sum(range(2000))
+
+
+async def ejecutar(modo, hash_guardado, logins, livianos):
+    loop = asyncio.get_running_loop()
+    hilos = ThreadPoolExecutor(max_workers=HILOS_STARLETTE)
+    latencias, rechazados = [], 0
+
+    async def login():
+        nonlocal rechazados
+        if modo == "en hilos":
+            await loop.run_in_executor(hilos, verificar_y_actualizar, "clave-correcta", hash_guardado)
+            return
+        try:
+            await pool_hash.ejecutar(verificar_y_actualizar, "clave-correcta", hash_guardado)
+        except PoolSaturado:
+            rechazados += 1  # la API responde 503 con Retry-After
+
+    async def liviano(retraso):
+        await asyncio.sleep(retraso)
+        inicio = time.perf_counter()
+        await loop.run_in_executor(hilos, request_liviano)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(
+        *[login() for _ in range(logins)],
+        *[liviano(i * 0.005) for i in range(livianos)],
+    )
+    total = time.perf_counter() - inicio
+    hilos.shutdown()
+    latencias.sort()
+    return {
+        "total_s": total,
+        "p50_ms": statistics.median(latencias),
+        "p99_ms": latencias[int(len(latencias) * 0.99) - 1],
+        "rechazados": rechazados,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--livianos", type=int, default=400)
+    args = parser.parse_args()
+
+    hash_guardado = hashear("clave-correcta")
+    # Calienta el pool para no medir el arranque de los procesos
+    pool_hash.enviar(hashear, "calentamiento").result()
+
+    for modo in ("en hilos", "pool"):
+        r = asyncio.run(ejecutar(modo, hash_guardado, args.logins, args.livianos))
+        print(
+            f"{modo:9s} total={r['total_s']:6.2f}s  livianos p50={r['p50_ms']:8.2f} ms  "
+            f"p99={r['p99_ms']:8.2f} ms  logins rechazados (503)={r['rechazados']}"
+        )
+    print(f"pool_hash: {pool_hash.estadisticas()}")
+    pool_hash.cerrar()
+
+
+if __name__ == "__main__":
+    main()
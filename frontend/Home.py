@@ -32,6 +32,8 @@ apply_custom_css()
 # Inicializar session_state
 if 'token' not in st.session_state:
     st.session_state.token = None
+if 'refresh_token' not in st.session_state:
+    st.session_state.refresh_token = None
 if 'usuario' not in st.session_state:
     st.session_state.usuario = None
 
@@ -68,6 +70,7 @@ if st.session_state.token is None:
                             if response.status_code == 200:
                                 data = response.json()
                                 st.session_state.token = data["access_token"]
+                                st.session_state.refresh_token = data["refresh_token"]
                                 st.session_state.usuario = data["usuario"]
                                 st.success("✅ Inicio de sesión exitoso")
                                 st.rerun()
@@ -137,8 +140,7 @@ else:
         st.divider()
         
         if st.button("🚪 Cerrar Sesión", use_container_width=True):
-            st.session_state.token = None
-            st.session_state.usuario = None
+            api_module.cerrar_sesion()
             st.rerun()
     
     # Header principal
@@ -150,12 +152,12 @@ else:
     """, unsafe_allow_html=True)
     
     # Obtener datos del sistema
-    response_pacientes = api_request("GET", "/api/pacientes")
+    response_pacientes = api_request("GET", "/api/pacientes?todos=true")
     pacientes = response_pacientes.json() if response_pacientes and response_pacientes.status_code == 200 else []
     
     # Obtener citas de hoy
     hoy = date.today()
-    response_citas_hoy = api_request("GET", f"/api/citas?fecha_desde={hoy.isoformat()}&fecha_hasta={hoy.isoformat()}")
+    response_citas_hoy = api_request("GET", f"/api/citas?todos=true&fecha_desde={hoy.isoformat()}&fecha_hasta={hoy.isoformat()}")
     citas_hoy = response_citas_hoy.json() if response_citas_hoy and response_citas_hoy.status_code == 200 else []
     
     # Métricas principales
@@ -269,7 +271,7 @@ else:
         with col1:
             st.markdown("### 📊 Citas por Estado (Últimos 7 días)")
             semana_atras = (hoy - timedelta(days=7)).isoformat()
-            response_citas_semana = api_request("GET", f"/api/citas?fecha_desde={semana_atras}&fecha_hasta={hoy.isoformat()}")
+            response_citas_semana = api_request("GET", f"/api/citas?todos=true&fecha_desde={semana_atras}&fecha_hasta={hoy.isoformat()}")
             citas_semana = response_citas_semana.json() if response_citas_semana and response_citas_semana.status_code == 200 else []
             
             if citas_semana:
@@ -2,9 +2,11 @@ import streamlit as st
 import requests
 from datetime import datetime, date, timedelta
 import json
+from urllib.parse import quote
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from utils.api import cerrar_sesion
 
 # Configuración de página
 st.set_page_config(
@@ -99,26 +101,46 @@ API_URL = "http://127.0.0.1:8000"
 # Inicializar session_state
 if 'token' not in st.session_state:
     st.session_state.token = None
+if 'refresh_token' not in st.session_state:
+    st.session_state.refresh_token = None
 if 'usuario' not in st.session_state:
     st.session_state.usuario = None
 
-# Función para hacer requests con autenticación
-def api_request(method, endpoint, data=None):
+# Renueva el access token (dura pocos minutos) con el refresh token
+def renovar_token():
+    if not st.session_state.refresh_token:
+        return False
+    response = requests.post(f"{API_URL}/api/auth/refresh", json={"refresh_token": st.session_state.refresh_token})
+    if response.status_code != 200:
+        return False
+    data = response.json()
+    st.session_state.token = data["access_token"]
+    st.session_state.refresh_token = data["refresh_token"]
+    st.session_state.usuario = data["usuario"]
+    return True
+
+def _enviar(method, url, data=None):
     headers = {}
     if st.session_state.token:
         headers["Authorization"] = f"Bearer {st.session_state.token}"
     
+    if method == "GET":
+        return requests.get(url, headers=headers)
+    elif method == "POST":
+        return requests.post(url, json=data, headers=headers)
+    elif method == "PUT":
+        return requests.put(url, json=data, headers=headers)
+    elif method == "DELETE":
+        return requests.delete(url, headers=headers)
+
+# Función para hacer requests con autenticación
+def api_request(method, endpoint, data=None):
     url = f"{API_URL}{endpoint}"
     
     try:
-        if method == "GET":
-            response = requests.get(url, headers=headers)
-        elif method == "POST":
-            response = requests.post(url, json=data, headers=headers)
-        elif method == "PUT":
-            response = requests.put(url, json=data, headers=headers)
-        elif method == "DELETE":
-            response = requests.delete(url, headers=headers)
+        response = _enviar(method, url, data)
+        if response.status_code == 401 and renovar_token():
+            response = _enviar(method, url, data)
         
         return response
     except Exception as e:
@@ -159,6 +181,7 @@ if st.session_state.token is None:
                             if response.status_code == 200:
                                 data = response.json()
                                 st.session_state.token = data["access_token"]
+                                st.session_state.refresh_token = data["refresh_token"]
                                 st.session_state.usuario = data["usuario"]
                                 st.success("✅ Inicio de sesión exitoso")
                                 st.rerun()
@@ -272,8 +295,7 @@ else:
         st.divider()
         
         if st.button("🚪 Cerrar Sesión", use_container_width=True):
-            st.session_state.token = None
-            st.session_state.usuario = None
+            cerrar_sesion()
             st.rerun()
     
     # ==================== DASHBOARD ====================
@@ -287,12 +309,12 @@ else:
         """, unsafe_allow_html=True)
         
         # Obtener datos del sistema
-        response_pacientes = api_request("GET", "/api/pacientes")
+        response_pacientes = api_request("GET", "/api/pacientes?todos=true")
         pacientes = response_pacientes.json() if response_pacientes and response_pacientes.status_code == 200 else []
         
         # Obtener citas de hoy
         hoy = date.today()
-        response_citas_hoy = api_request("GET", f"/api/citas?fecha_desde={hoy.isoformat()}&fecha_hasta={hoy.isoformat()}")
+        response_citas_hoy = api_request("GET", f"/api/citas?todos=true&fecha_desde={hoy.isoformat()}&fecha_hasta={hoy.isoformat()}")
         citas_hoy = response_citas_hoy.json() if response_citas_hoy and response_citas_hoy.status_code == 200 else []
         
         # Métricas principales
@@ -413,7 +435,7 @@ else:
             with col1:
                 st.markdown("### 📊 Citas por Estado (Últimos 7 días)")
                 semana_atras = (hoy - timedelta(days=7)).isoformat()
-                response_citas_semana = api_request("GET", f"/api/citas?fecha_desde={semana_atras}&fecha_hasta={hoy.isoformat()}")
+                response_citas_semana = api_request("GET", f"/api/citas?todos=true&fecha_desde={semana_atras}&fecha_hasta={hoy.isoformat()}")
                 citas_semana = response_citas_semana.json() if response_citas_semana and response_citas_semana.status_code == 200 else []
                 
                 if citas_semana:
@@ -463,7 +485,7 @@ else:
                     medico_id_filtro = opciones_medicos[medico_filtro]
             
             # Obtener citas
-            endpoint = f"/api/citas?fecha_desde={fecha_desde.isoformat()}&fecha_hasta={fecha_hasta.isoformat()}"
+            endpoint = f"/api/citas?todos=true&fecha_desde={fecha_desde.isoformat()}&fecha_hasta={fecha_hasta.isoformat()}"
             if medico_id_filtro:
                 endpoint += f"&medico_id={medico_id_filtro}"
             
@@ -653,11 +675,13 @@ else:
                             if agregar_receta and med_nombre:
                                 datos_receta = {
                                     "paciente_id": cita['paciente_id'],
-                                    "medicamento1_nombre": med_nombre,
-                                    "medicamento1_dosis": med_dosis,
-                                    "medicamento1_frecuencia": med_freq,
-                                    "medicamento1_duracion": med_dur,
-                                    "medicamento1_via": med_via
+                                    "medicamentos": [{
+                                        "nombre": med_nombre,
+                                        "dosis": med_dosis,
+                                        "frecuencia": med_freq,
+                                        "duracion": med_dur,
+                                        "via": med_via
+                                    }]
                                 }
                                 response_rec = api_request("POST", "/api/recetas", datos_receta)
                                 if response_rec and response_rec.status_code == 200:
@@ -678,7 +702,7 @@ else:
             if st.session_state.usuario['rol'] not in ['recepcion', 'admin', 'medico']:
                 st.error("❌ No tienes permisos para agendar citas.")
             else:
-                response_pacientes = api_request("GET", "/api/pacientes")
+                response_pacientes = api_request("GET", "/api/pacientes?todos=true")
                 response_medicos = api_request("GET", "/api/usuarios")
                 
                 pacientes = response_pacientes.json() if response_pacientes and response_pacientes.status_code == 200 else []
@@ -738,10 +762,10 @@ else:
             if st.session_state.usuario['rol'] not in ['recepcion', 'admin', 'medico']:
                 st.error("❌ No tienes permisos para gestionar citas.")
             else:
-                response = api_request("GET", "/api/citas?estado=programada")
+                response = api_request("GET", "/api/citas?todos=true&estado=programada")
                 citas_programadas = response.json() if response and response.status_code == 200 else []
                 
-                response = api_request("GET", "/api/citas?estado=confirmada")
+                response = api_request("GET", "/api/citas?todos=true&estado=confirmada")
                 citas_confirmadas = response.json() if response and response.status_code == 200 else []
                 
                 todas_citas = citas_programadas + citas_confirmadas
@@ -833,16 +857,13 @@ else:
         
         buscar = st.text_input("🔍 Buscar paciente", placeholder="Nombre, apellido o identificación")
         
-        response = api_request("GET", "/api/pacientes")
+        if buscar:
+            response = api_request("GET", f"/api/pacientes/buscar?q={quote(buscar)}&limit=100")
+        else:
+            response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
-            if buscar:
-                pacientes = [p for p in pacientes if 
-                           buscar.lower() in p['nombre'].lower() or 
-                           buscar.lower() in p['apellidos'].lower() or 
-                           buscar in p['identificacion']]
-            
             if pacientes:
                 st.info(f"📊 Total: {len(pacientes)} paciente(s)")
                 
@@ -866,7 +887,7 @@ else:
         if st.session_state.usuario['rol'] not in ['recepcion', 'admin']:
             st.error("❌ Solo recepción y administradores pueden editar pacientes.")
         else:
-            response = api_request("GET", "/api/pacientes")
+            response = api_request("GET", "/api/pacientes?todos=true")
             if response and response.status_code == 200:
                 pacientes = response.json()
                 
@@ -910,7 +931,7 @@ else:
         if st.session_state.usuario['rol'] not in ['medico', 'admin']:
             st.error("❌ Solo médicos pueden crear consultas.")
         else:
-            response = api_request("GET", "/api/pacientes")
+            response = api_request("GET", "/api/pacientes?todos=true")
             if response and response.status_code == 200:
                 pacientes = response.json()
                 
@@ -973,7 +994,7 @@ else:
         if st.session_state.usuario['rol'] not in ['medico', 'enfermera', 'admin']:
             st.error("❌ Solo personal médico puede ver historiales.")
         else:
-            response = api_request("GET", "/api/pacientes")
+            response = api_request("GET", "/api/pacientes?todos=true")
             if response and response.status_code == 200:
                 pacientes = response.json()
                 
@@ -983,7 +1004,7 @@ else:
                     paciente_seleccionado = st.selectbox("👤 Seleccionar Paciente", list(opciones_pacientes.keys()))
                     paciente_id = opciones_pacientes[paciente_seleccionado]
                     
-                    response = api_request("GET", f"/api/consultas/paciente/{paciente_id}")
+                    response = api_request("GET", f"/api/consultas/paciente/{paciente_id}?todos=true")
                     if response and response.status_code == 200:
                         consultas = response.json()
                         
@@ -1026,7 +1047,7 @@ else:
             with tab1:
                 st.subheader("📝 Emitir Nueva Receta")
                 
-                response = api_request("GET", "/api/pacientes")
+                response = api_request("GET", "/api/pacientes?todos=true")
                 if response and response.status_code == 200:
                     pacientes = response.json()
                     
@@ -1107,52 +1128,34 @@ else:
                                 if not med1_nombre or not med1_dosis or not med1_frecuencia or not med1_duracion:
                                     st.error("Debes completar al menos el medicamento 1 con todos sus campos obligatorios")
                                 else:
+                                    medicamentos = [{
+                                        "nombre": med1_nombre,
+                                        "dosis": med1_dosis,
+                                        "frecuencia": med1_frecuencia,
+                                        "duracion": med1_duracion,
+                                        "via": med1_via
+                                    }]
+                                    for nombre, dosis, frecuencia, duracion, via in [
+                                        (med2_nombre, med2_dosis, med2_frecuencia, med2_duracion, med2_via),
+                                        (med3_nombre, med3_dosis, med3_frecuencia, med3_duracion, med3_via),
+                                        (med4_nombre, med4_dosis, med4_frecuencia, med4_duracion, med4_via),
+                                        (med5_nombre, med5_dosis, med5_frecuencia, med5_duracion, med5_via),
+                                    ]:
+                                        if nombre:
+                                            medicamentos.append({
+                                                "nombre": nombre,
+                                                "dosis": dosis,
+                                                "frecuencia": frecuencia,
+                                                "duracion": duracion,
+                                                "via": via
+                                            })
+                                    
                                     datos_receta = {
                                         "paciente_id": paciente_id,
-                                        "medicamento1_nombre": med1_nombre,
-                                        "medicamento1_dosis": med1_dosis,
-                                        "medicamento1_frecuencia": med1_frecuencia,
-                                        "medicamento1_duracion": med1_duracion,
-                                        "medicamento1_via": med1_via,
+                                        "medicamentos": medicamentos,
                                         "indicaciones_generales": indicaciones
                                     }
                                     
-                                    if med2_nombre:
-                                        datos_receta.update({
-                                            "medicamento2_nombre": med2_nombre,
-                                            "medicamento2_dosis": med2_dosis,
-                                            "medicamento2_frecuencia": med2_frecuencia,
-                                            "medicamento2_duracion": med2_duracion,
-                                            "medicamento2_via": med2_via
-                                        })
-                                    
-                                    if med3_nombre:
-                                        datos_receta.update({
-                                            "medicamento3_nombre": med3_nombre,
-                                            "medicamento3_dosis": med3_dosis,
-                                            "medicamento3_frecuencia": med3_frecuencia,
-                                            "medicamento3_duracion": med3_duracion,
-                                            "medicamento3_via": med3_via
-                                        })
-                                    
-                                    if med4_nombre:
-                                        datos_receta.update({
-                                            "medicamento4_nombre": med4_nombre,
-                                            "medicamento4_dosis": med4_dosis,
-                                            "medicamento4_frecuencia": med4_frecuencia,
-                                            "medicamento4_duracion": med4_duracion,
-                                            "medicamento4_via": med4_via
-                                        })
-                                    
-                                    if med5_nombre:
-                                        datos_receta.update({
-                                            "medicamento5_nombre": med5_nombre,
-                                            "medicamento5_dosis": med5_dosis,
-                                            "medicamento5_frecuencia": med5_frecuencia,
-                                            "medicamento5_duracion": med5_duracion,
-                                            "medicamento5_via": med5_via
-                                        })
-                                    
                                     response = api_request("POST", "/api/recetas", datos_receta)
                                     if response and response.status_code == 200:
                                         st.success("✅ Receta emitida exitosamente")
@@ -1163,7 +1166,7 @@ else:
             with tab2:
                 st.subheader("📋 Historial de Recetas")
                 
-                response = api_request("GET", "/api/pacientes")
+                response = api_request("GET", "/api/pacientes?todos=true")
                 if response and response.status_code == 200:
                     pacientes = response.json()
                     
@@ -1174,7 +1177,7 @@ else:
                         paciente_id = opciones_pacientes[paciente_seleccionado]
                         
                         if st.button("🔍 Buscar Recetas"):
-                            response = api_request("GET", f"/api/recetas/paciente/{paciente_id}")
+                            response = api_request("GET", f"/api/recetas/paciente/{paciente_id}?todos=true")
                             
                             if response and response.status_code == 200:
                                 recetas = response.json()
@@ -1186,40 +1189,12 @@ else:
                                         with st.expander(f"📄 Receta #{r['id']} - {r['fecha_emision'][:10]} - Dr. {r.get('medico_nombre', 'N/A')}"):
                                             st.write("**Medicamentos:**")
                                             
-                                            if r.get('medicamento1_nombre'):
-                                                st.markdown(f"**1. {r['medicamento1_nombre']}**")
-                                                st.write(f"   • Dosis: {r['medicamento1_dosis']}")
-                                                st.write(f"   • Frecuencia: {r['medicamento1_frecuencia']}")
-                                                st.write(f"   • Duración: {r['medicamento1_duracion']}")
-                                                st.write(f"   • Vía: {r['medicamento1_via']}")
-                                            
-                                            if r.get('medicamento2_nombre'):
-                                                st.markdown(f"**2. {r['medicamento2_nombre']}**")
-                                                st.write(f"   • Dosis: {r['medicamento2_dosis']}")
-                                                st.write(f"   • Frecuencia: {r['medicamento2_frecuencia']}")
-                                                st.write(f"   • Duración: {r['medicamento2_duracion']}")
-                                                st.write(f"   • Vía: {r['medicamento2_via']}")
-                                            
-                                            if r.get('medicamento3_nombre'):
-                                                st.markdown(f"**3. {r['medicamento3_nombre']}**")
-                                                st.write(f"   • Dosis: {r['medicamento3_dosis']}")
-                                                st.write(f"   • Frecuencia: {r['medicamento3_frecuencia']}")
-                                                st.write(f"   • Duración: {r['medicamento3_duracion']}")
-                                                st.write(f"   • Vía: {r['medicamento3_via']}")
-                                            
-                                            if r.get('medicamento4_nombre'):
-                                                st.markdown(f"**4. {r['medicamento4_nombre']}**")
-                                                st.write(f"   • Dosis: {r['medicamento4_dosis']}")
-                                                st.write(f"   • Frecuencia: {r['medicamento4_frecuencia']}")
-                                                st.write(f"   • Duración: {r['medicamento4_duracion']}")
-                                                st.write(f"   • Vía: {r['medicamento4_via']}")
-                                            
-                                            if r.get('medicamento5_nombre'):
-                                                st.markdown(f"**5. {r['medicamento5_nombre']}**")
-                                                st.write(f"   • Dosis: {r['medicamento5_dosis']}")
-                                                st.write(f"   • Frecuencia: {r['medicamento5_frecuencia']}")
-                                                st.write(f"   • Duración: {r['medicamento5_duracion']}")
-                                                st.write(f"   • Vía: {r['medicamento5_via']}")
+                                            for med in r.get('medicamentos', []):
+                                                st.markdown(f"**{med['posicion']}. {med['nombre']}**")
+                                                st.write(f"   • Dosis: {med['dosis']}")
+                                                st.write(f"   • Frecuencia: {med['frecuencia']}")
+                                                st.write(f"   • Duración: {med['duracion']}")
+                                                st.write(f"   • Vía: {med['via']}")
                                             
                                             if r.get('indicaciones_generales'):
                                                 st.markdown("**Indicaciones Generales:**")
@@ -1269,7 +1244,7 @@ else:
             with tab1:
                 st.subheader("📤 Exportar Paciente a FHIR")
                 
-                response = api_request("GET", "/api/pacientes")
+                response = api_request("GET", "/api/pacientes?todos=true")
                 if response and response.status_code == 200:
                     pacientes = response.json()
                     
@@ -1301,7 +1276,7 @@ else:
             with tab2:
                 st.subheader("📤 Exportar Receta a FHIR")
                 
-                response = api_request("GET", "/api/pacientes")
+                response = api_request("GET", "/api/pacientes?todos=true")
                 if response and response.status_code == 200:
                     pacientes = response.json()
                     
@@ -1312,7 +1287,7 @@ else:
                         paciente_id = opciones_pacientes[paciente_seleccionado]
                         
                         # Obtener recetas del paciente
-                        response = api_request("GET", f"/api/recetas/paciente/{paciente_id}")
+                        response = api_request("GET", f"/api/recetas/paciente/{paciente_id}?todos=true")
                         if response and response.status_code == 200:
                             recetas = response.json()
                             
@@ -1348,7 +1323,7 @@ else:
             with tab3:
                 st.subheader("📤 Exportar Orden de Laboratorio a FHIR")
                 
-                response = api_request("GET", "/api/pacientes")
+                response = api_request("GET", "/api/pacientes?todos=true")
                 if response and response.status_code == 200:
                     pacientes = response.json()
                     
@@ -1359,7 +1334,7 @@ else:
                         paciente_id = opciones_pacientes[paciente_seleccionado]
                         
                         # Obtener órdenes del paciente
-                        response = api_request("GET", f"/api/laboratorio/paciente/{paciente_id}")
+                        response = api_request("GET", f"/api/laboratorio/paciente/{paciente_id}?todos=true")
                         if response and response.status_code == 200:
                             ordenes = response.json()
                             
@@ -28,7 +28,7 @@ else:
     with tab1:
         st.subheader("📤 Exportar Paciente a FHIR")
         
-        response = api_request("GET", "/api/pacientes")
+        response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
@@ -60,7 +60,7 @@ else:
     with tab2:
         st.subheader("📤 Exportar Receta a FHIR")
         
-        response = api_request("GET", "/api/pacientes")
+        response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
@@ -71,7 +71,7 @@ else:
                 paciente_id = opciones_pacientes[paciente_seleccionado]
                 
                 # Obtener recetas del paciente
-                response = api_request("GET", f"/api/recetas/paciente/{paciente_id}")
+                response = api_request("GET", f"/api/recetas/paciente/{paciente_id}?todos=true")
                 if response and response.status_code == 200:
                     recetas = response.json()
                     
@@ -107,7 +107,7 @@ else:
     with tab3:
         st.subheader("📤 Exportar Orden de Laboratorio a FHIR")
         
-        response = api_request("GET", "/api/pacientes")
+        response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
@@ -118,7 +118,7 @@ else:
                 paciente_id = opciones_pacientes[paciente_seleccionado]
                 
                 # Obtener órdenes del paciente
-                response = api_request("GET", f"/api/laboratorio/paciente/{paciente_id}")
+                response = api_request("GET", f"/api/laboratorio/paciente/{paciente_id}?todos=true")
                 if response and response.status_code == 200:
                     ordenes = response.json()
                     
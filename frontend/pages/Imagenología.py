@@ -26,7 +26,7 @@ else:
     with tab1:
         st.subheader("📝 Crear Nueva Orden de Imagenología")
         
-        response = api_request("GET", "/api/pacientes")
+        response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
@@ -177,7 +177,7 @@ else:
     with tab2:
         st.subheader("📋 Historial de Órdenes")
         
-        response = api_request("GET", "/api/pacientes")
+        response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
@@ -190,7 +190,7 @@ else:
                 paciente_id = opciones_pacientes[paciente_seleccionado]
                 
                 if st.button("🔍 Buscar Órdenes"):
-                    response = api_request("GET", f"/api/imagenologia/paciente/{paciente_id}")
+                    response = api_request("GET", f"/api/imagenologia/paciente/{paciente_id}?todos=true")
                     
                     if response and response.status_code == 200:
                         ordenes = response.json()
@@ -54,7 +54,7 @@ with tab1:
             medico_id_filtro = opciones_medicos[medico_filtro]
     
     # Obtener citas
-    endpoint = f"/api/citas?fecha_desde={fecha_desde.isoformat()}&fecha_hasta={fecha_hasta.isoformat()}"
+    endpoint = f"/api/citas?todos=true&fecha_desde={fecha_desde.isoformat()}&fecha_hasta={fecha_hasta.isoformat()}"
     if medico_id_filtro:
         endpoint += f"&medico_id={medico_id_filtro}"
     
@@ -121,7 +121,7 @@ with tab2:
     if st.session_state.usuario['rol'] not in ['recepcion', 'admin', 'medico']:
         st.error("❌ No tienes permisos para agendar citas.")
     else:
-        response_pacientes = api_request("GET", "/api/pacientes")
+        response_pacientes = api_request("GET", "/api/pacientes?todos=true")
         response_medicos = api_request("GET", "/api/usuarios")
         
         pacientes = response_pacientes.json() if response_pacientes and response_pacientes.status_code == 200 else []
@@ -181,10 +181,10 @@ with tab3:
     if st.session_state.usuario['rol'] not in ['recepcion', 'admin', 'medico']:
         st.error("❌ No tienes permisos para gestionar citas.")
     else:
-        response = api_request("GET", "/api/citas?estado=programada")
+        response = api_request("GET", "/api/citas?todos=true&estado=programada")
         citas_programadas = response.json() if response and response.status_code == 200 else []
         
-        response = api_request("GET", "/api/citas?estado=confirmada")
+        response = api_request("GET", "/api/citas?todos=true&estado=confirmada")
         citas_confirmadas = response.json() if response and response.status_code == 200 else []
         
         todas_citas = citas_programadas + citas_confirmadas
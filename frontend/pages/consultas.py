@@ -26,7 +26,7 @@ with tab1:
     if st.session_state.usuario['rol'] not in ['medico', 'admin']:
         st.error("❌ Solo médicos pueden crear consultas.")
     else:
-        response = api_request("GET", "/api/pacientes")
+        response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
@@ -96,7 +96,7 @@ with tab2:
     if st.session_state.usuario['rol'] not in ['medico', 'enfermera', 'admin']:
         st.error("❌ Solo personal médico puede ver historiales.")
     else:
-        response = api_request("GET", "/api/pacientes")
+        response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
@@ -106,7 +106,7 @@ with tab2:
                 paciente_seleccionado = st.selectbox("👤 Seleccionar Paciente", list(opciones_pacientes.keys()), key="hist")
                 paciente_id = opciones_pacientes[paciente_seleccionado]
                 
-                response = api_request("GET", f"/api/consultas/paciente/{paciente_id}")
+                response = api_request("GET", f"/api/consultas/paciente/{paciente_id}?todos=true")
                 if response and response.status_code == 200:
                     consultas = response.json()
                     
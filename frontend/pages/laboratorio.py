@@ -29,7 +29,7 @@ with tab1:
     if st.session_state.usuario['rol'] not in ['medico', 'admin']:
         st.error("❌ Solo médicos pueden crear órdenes de laboratorio.")
     else:
-        response = api_request("GET", "/api/pacientes")
+        response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
@@ -104,8 +104,6 @@ with tab1:
                         if submitted:
                             if not examenes_seleccionados:
                                 st.error("Debes seleccionar al menos un examen (del catálogo o personalizado)")
-                            elif len(examenes_seleccionados) > 10:
-                                st.error("Máximo 10 exámenes por orden")
                             else:
                                 datos_orden = {
                                     "paciente_id": paciente_id,
@@ -126,7 +124,7 @@ with tab1:
 with tab2:
     st.subheader("📋 Historial de Órdenes de Laboratorio")
     
-    response = api_request("GET", "/api/pacientes")
+    response = api_request("GET", "/api/pacientes?todos=true")
     if response and response.status_code == 200:
         pacientes = response.json()
         
@@ -137,7 +135,7 @@ with tab2:
             paciente_id = opciones_pacientes[paciente_seleccionado]
             
             if st.button("🔍 Buscar Órdenes"):
-                response = api_request("GET", f"/api/laboratorio/paciente/{paciente_id}")
+                response = api_request("GET", f"/api/laboratorio/paciente/{paciente_id}?todos=true")
                 
                 if response and response.status_code == 200:
                     ordenes = response.json()
@@ -2,6 +2,7 @@ import streamlit as st
 from datetime import date
 import sys
 import os
+from urllib.parse import quote
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
@@ -25,16 +26,13 @@ with tab1:
     
     buscar = st.text_input("🔍 Buscar paciente", placeholder="Nombre, apellido o identificación")
     
-    response = api_request("GET", "/api/pacientes")
+    if buscar:
+        response = api_request("GET", f"/api/pacientes/buscar?q={quote(buscar)}&limit=100")
+    else:
+        response = api_request("GET", "/api/pacientes?todos=true")
     if response and response.status_code == 200:
         pacientes = response.json()
         
-        if buscar:
-            pacientes = [p for p in pacientes if 
-                       buscar.lower() in p['nombre'].lower() or 
-                       buscar.lower() in p['apellidos'].lower() or 
-                       buscar in p['identificacion']]
-        
         if pacientes:
             st.info(f"📊 Total: {len(pacientes)} paciente(s)")
             
@@ -103,7 +101,7 @@ with tab3:
     if st.session_state.usuario['rol'] not in ['recepcion', 'admin']:
         st.error("❌ Solo recepción y administradores pueden editar pacientes.")
     else:
-        response = api_request("GET", "/api/pacientes")
+        response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
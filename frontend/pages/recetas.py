@@ -25,7 +25,7 @@ else:
     with tab1:
         st.subheader("📝 Emitir Nueva Receta")
         
-        response = api_request("GET", "/api/pacientes")
+        response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
@@ -51,10 +51,10 @@ else:
                                          key="med1_via")
                     
                     # Medicamentos adicionales
-                    num_medicamentos = st.number_input("Medicamentos adicionales", min_value=0, max_value=4, value=0)
+                    num_medicamentos = st.number_input("Medicamentos adicionales", min_value=0, max_value=19, value=0)
                     
                     medicamentos_extra = []
-                    for i in range(2, min(num_medicamentos + 2, 6)):
+                    for i in range(2, num_medicamentos + 2):
                         with st.expander(f"➕ Medicamento {i} (Opcional)"):
                             col1, col2 = st.columns(2)
                             with col1:
@@ -69,7 +69,6 @@ else:
                             
                             if nombre:
                                 medicamentos_extra.append({
-                                    'numero': i,
                                     'nombre': nombre,
                                     'dosis': dosis,
                                     'frecuencia': frecuencia,
@@ -87,22 +86,16 @@ else:
                         else:
                             datos_receta = {
                                 "paciente_id": paciente_id,
-                                "medicamento1_nombre": med1_nombre,
-                                "medicamento1_dosis": med1_dosis,
-                                "medicamento1_frecuencia": med1_frecuencia,
-                                "medicamento1_duracion": med1_duracion,
-                                "medicamento1_via": med1_via,
+                                "medicamentos": [{
+                                    "nombre": med1_nombre,
+                                    "dosis": med1_dosis,
+                                    "frecuencia": med1_frecuencia,
+                                    "duracion": med1_duracion,
+                                    "via": med1_via
+                                }] + medicamentos_extra,
                                 "indicaciones_generales": indicaciones
                             }
                             
-                            # Agregar medicamentos adicionales
-                            for med in medicamentos_extra:
-                                datos_receta[f"medicamento{med['numero']}_nombre"] = med['nombre']
-                                datos_receta[f"medicamento{med['numero']}_dosis"] = med['dosis']
-                                datos_receta[f"medicamento{med['numero']}_frecuencia"] = med['frecuencia']
-                                datos_receta[f"medicamento{med['numero']}_duracion"] = med['duracion']
-                                datos_receta[f"medicamento{med['numero']}_via"] = med['via']
-                            
                             response = api_request("POST", "/api/recetas", datos_receta)
                             if response and response.status_code == 200:
                                 st.success("✅ Receta emitida exitosamente")
@@ -113,7 +106,7 @@ else:
     with tab2:
         st.subheader("📋 Historial de Recetas")
         
-        response = api_request("GET", "/api/pacientes")
+        response = api_request("GET", "/api/pacientes?todos=true")
         if response and response.status_code == 200:
             pacientes = response.json()
             
@@ -124,7 +117,7 @@ else:
                 paciente_id = opciones_pacientes[paciente_seleccionado]
                 
                 if st.button("🔍 Buscar Recetas"):
-                    response = api_request("GET", f"/api/recetas/paciente/{paciente_id}")
+                    response = api_request("GET", f"/api/recetas/paciente/{paciente_id}?todos=true")
                     
                     if response and response.status_code == 200:
                         recetas = response.json()
@@ -136,14 +129,12 @@ else:
                                 with st.expander(f"📄 Receta #{r['id']} - {r['fecha_emision'][:10]} - Dr. {r.get('medico_nombre', 'N/A')}"):
                                     st.write("**Medicamentos:**")
                                     
-                                    for i in range(1, 6):
-                                        nombre_key = f"medicamento{i}_nombre"
-                                        if r.get(nombre_key):
-                                            st.markdown(f"**{i}. {r[nombre_key]}**")
-                                            st.write(f"   • Dosis: {r[f'medicamento{i}_dosis']}")
-                                            st.write(f"   • Frecuencia: {r[f'medicamento{i}_frecuencia']}")
-                                            st.write(f"   • Duración: {r[f'medicamento{i}_duracion']}")
-                                            st.write(f"   • Vía: {r[f'medicamento{i}_via']}")
+                                    for med in r.get('medicamentos', []):
+                                        st.markdown(f"**{med['posicion']}. {med['nombre']}**")
+                                        st.write(f"   • Dosis: {med['dosis']}")
+                                        st.write(f"   • Frecuencia: {med['frecuencia']}")
+                                        st.write(f"   • Duración: {med['duracion']}")
+                                        st.write(f"   • Vía: {med['via']}")
                                     
                                     if r.get('indicaciones_generales'):
                                         st.markdown("**Indicaciones Generales:**")
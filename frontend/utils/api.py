@@ -3,23 +3,60 @@ import streamlit as st
 
 API_URL = "http://127.0.0.1:8000"
 
-def api_request(method, endpoint, data=None):
-    """Función centralizada para hacer requests al API"""
+def renovar_token():
+    """Pide un access token nuevo con el refresh token. False si la sesión ya no es válida"""
+    refresh_token = st.session_state.get('refresh_token')
+    if not refresh_token:
+        return False
+    response = requests.post(f"{API_URL}/api/auth/refresh", json={"refresh_token": refresh_token})
+    if response.status_code != 200:
+        return False
+    data = response.json()
+    st.session_state.token = data["access_token"]
+    st.session_state.refresh_token = data["refresh_token"]
+    st.session_state.usuario = data["usuario"]
+    return True
+
+def cerrar_sesion():
+    """Revoca los tokens en el servidor y limpia la sesión local"""
+    headers = {}
+    if st.session_state.get('token'):
+        headers["Authorization"] = f"Bearer {st.session_state.token}"
+    try:
+        requests.post(
+            f"{API_URL}/api/auth/logout",
+            json={"refresh_token": st.session_state.get('refresh_token')},
+            headers=headers
+        )
+    except Exception:
+        pass  # sin conexión: igual se cierra la sesión local
+    st.session_state.token = None
+    st.session_state.refresh_token = None
+    st.session_state.usuario = None
+
+def _enviar(method, url, data=None):
     headers = {}
     if 'token' in st.session_state and st.session_state.token:
         headers["Authorization"] = f"Bearer {st.session_state.token}"
     
+    if method == "GET":
+        return requests.get(url, headers=headers)
+    elif method == "POST":
+        return requests.post(url, json=data, headers=headers)
+    elif method == "PUT":
+        return requests.put(url, json=data, headers=headers)
+    elif method == "DELETE":
+        return requests.delete(url, headers=headers)
+
+def api_request(method, endpoint, data=None):
+    """Función centralizada para hacer requests al API"""
     url = f"{API_URL}{endpoint}"
     
     try:
-        if method == "GET":
-            response = requests.get(url, headers=headers)
-        elif method == "POST":
-            response = requests.post(url, json=data, headers=headers)
-        elif method == "PUT":
-            response = requests.put(url, json=data, headers=headers)
-        elif method == "DELETE":
-            response = requests.delete(url, headers=headers)
+        response = _enviar(method, url, data)
+        # El access token dura pocos minutos: se renueva una vez y se reintenta
+        if response.status_code == 401 and renovar_token():
+            response = _enviar(method, url, data)
         
         return response
     except Exception as e:
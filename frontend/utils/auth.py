@@ -1,4 +1,5 @@
 import streamlit as st
+from utils.api import cerrar_sesion
 
 def check_authentication():
     """Verifica si el usuario está autenticado, si no redirige a login"""
@@ -33,6 +34,5 @@ def show_user_info():
         """, unsafe_allow_html=True)
         
         if st.sidebar.button("🚪 Cerrar Sesión", use_container_width=True):
-            st.session_state.token = None
-            st.session_state.usuario = None
+            cerrar_sesion()
             st.rerun()
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+Configuración compartida de los tests.
+
+La configuración se lee al importar backend.config, así que las variables
+ECE_ se fijan aquí, antes de importar cualquier módulo del backend: base
+SQLite, registro de revocaciones y exportaciones en un directorio temporal
+y bcrypt con el costo mínimo.
+"""
+import itertools
+import os
+import tempfile
+from datetime import datetime
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="ece-tests-")
+os.environ.update({
+    "ECE_DATABASE_URL": f"sqlite:///{os.path.join(_TMP, 'test.db')}",
+    "ECE_REVOCACION_ARCHIVO": os.path.join(_TMP, "revocaciones.log"),
+    "ECE_EXPORT_DIRECTORIO": os.path.join(_TMP, "exportaciones"),
+    "ECE_PDF_DIRECTORIO_LEGADO": os.path.join(_TMP, "recetas"),
+    "ECE_BCRYPT_ROUNDS": "4",
+})
+
+from backend import models  # noqa: E402
+from backend.auth import claims_usuario, create_access_token  # noqa: E402
+from backend.database import SessionLocal, engine  # noqa: E402
+from backend.hashing import hashear  # noqa: E402
+from backend.migraciones import aplicar_migraciones  # noqa: E402
+
+_secuencia = itertools.count(1)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def esquema():
+    aplicar_migraciones(engine)
+
+
+@pytest.fixture
+def db():
+    sesion = SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+
+
+@pytest.fixture
+def crear_usuario(db):
+    """crear_usuario(rol) -> Usuario nuevo con contraseña "clave" """
+    def crear(rol: str = "medico") -> models.Usuario:
+        n = next(_secuencia)
+        usuario = models.Usuario(
+            username=f"{rol}{n}", email=f"{rol}{n}@example.com", password_hash=hashear("clave"),
+            nombre_completo=f"Usuario {n}", rol=rol, activo=True,
+        )
+        db.add(usuario)
+        db.commit()
+        return usuario
+    return crear
+
+
+@pytest.fixture
+def crear_paciente(db):
+    def crear(**campos) -> models.Paciente:
+        n = next(_secuencia)
+        paciente = models.Paciente(**{
+            "identificacion": f"9-{n:04d}-0000", "nombre": "Ana", "apellidos": f"Mora {n}",
+            "fecha_nacimiento": datetime(1980, 1, 1), "genero": "Femenino",
+            "telefono": "", "email": "", "direccion": "", **campos,
+        })
+        db.add(paciente)
+        db.commit()
+        return paciente
+    return crear
+
+
+@pytest.fixture
+def encabezados():
+    """encabezados(usuario) -> Authorization con un access token de ese usuario"""
+    def armar(usuario: models.Usuario) -> dict:
+        return {"Authorization": f"Bearer {create_access_token(claims_usuario(usuario))}"}
+    return armar
@@ -0,0 +1,419 @@
+"""
+Referencia para tests/test_fhir_conformidad.py: el conversor FHIR anterior
+a los dicts directos (backend/fhir_converter.py antes de user-020), que
+armaba cada recurso con los modelos de fhir.resources y devolvía .dict().
+
+Se copia sin cambios, solo con los recursos que se comparan.
+"""
+import re
+from datetime import datetime, timezone
+from fhir.resources.R4B.patient import Patient
+from fhir.resources.R4B.humanname import HumanName
+from fhir.resources.R4B.contactpoint import ContactPoint
+from fhir.resources.R4B.address import Address
+from fhir.resources.R4B.encounter import Encounter
+from fhir.resources.R4B.observation import Observation
+from fhir.resources.R4B.condition import Condition
+from fhir.resources.R4B.medicationrequest import MedicationRequest
+from fhir.resources.R4B.identifier import Identifier
+from fhir.resources.R4B.reference import Reference
+from fhir.resources.R4B.codeableconcept import CodeableConcept
+from fhir.resources.R4B.coding import Coding
+from backend import models
+
+def _instante(fecha: datetime) -> str:
+    """Las fechas se guardan en UTC sin zona; el tipo instant de FHIR exige la zona"""
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return fecha.isoformat()
+
+_DOSIS = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*(.*?)\s*$")
+
+def _dosis_fhir(dosis: str) -> list:
+    """"400 mg" -> doseQuantity 400 mg; si la dosis no empieza con un número queda solo en el texto"""
+    coincidencia = _DOSIS.match(dosis or "")
+    if not coincidencia:
+        return []
+    return [{
+        "doseQuantity": {
+            "value": float(coincidencia.group(1).replace(",", ".")),
+            "unit": coincidencia.group(2) or "unidad"
+        }
+    }]
+
+def paciente_to_fhir(paciente: models.Paciente) -> dict:
+    """Convierte un paciente del modelo interno a FHIR Patient"""
+    
+    # Crear nombre en formato FHIR
+    name = HumanName(
+        family=paciente.apellidos,
+        given=[paciente.nombre],
+        use="official"
+    )
+    
+    # Crear contacto (teléfono)
+    telecom = []
+    if paciente.telefono:
+        telecom.append(ContactPoint(
+            system="phone",
+            value=paciente.telefono,
+            use="mobile"
+        ))
+    if paciente.email:
+        telecom.append(ContactPoint(
+            system="email",
+            value=paciente.email
+        ))
+    
+    # Crear dirección
+    address = []
+    if paciente.direccion:
+        address.append(Address(
+            use="home",
+            text=paciente.direccion
+        ))
+    
+    # Crear identificador
+    identifier = [Identifier(
+        system="urn:oid:ece-medico",
+        value=paciente.identificacion
+    )]
+    
+    # Determinar género en formato FHIR
+    gender_map = {
+        "Masculino": "male",
+        "Femenino": "female",
+        "Otro": "other"
+    }
+    
+    # Crear recurso Patient FHIR
+    fhir_patient = Patient(
+        id=str(paciente.id),
+        identifier=identifier,
+        name=[name],
+        telecom=telecom,
+        gender=gender_map.get(paciente.genero, "unknown"),
+        birthDate=paciente.fecha_nacimiento.date() if paciente.fecha_nacimiento else None,
+        address=address,
+        active=True
+    )
+    
+    return fhir_patient.dict()
+
+def consulta_to_fhir_encounter(consulta: models.Consulta, paciente: models.Paciente) -> dict:
+    """Convierte una consulta a FHIR Encounter"""
+    
+    # Crear referencia al paciente
+    patient_reference = Reference(
+        reference=f"Patient/{paciente.id}",
+        display=f"{paciente.nombre} {paciente.apellidos}"
+    )
+    
+    # Crear Encounter
+    encounter = Encounter(
+        id=str(consulta.id),
+        status="finished",
+        class_fhir=Coding(
+            system="http://terminology.hl7.org/CodeSystem/v3-ActCode",
+            code="AMB",
+            display="ambulatory"
+        ),
+        subject=patient_reference,
+        period={
+            "start": consulta.fecha.isoformat()
+        },
+        reasonCode=[CodeableConcept(
+            text=consulta.motivo
+        )]
+    )
+    
+    return encounter.dict()
+
+def consulta_to_fhir_bundle(consulta: models.Consulta, paciente: models.Paciente) -> dict:
+    """
+    Convierte una consulta completa a un FHIR Bundle con:
+    - Encounter (la consulta)
+    - Observations (signos vitales)
+    - Condition (diagnóstico)
+    - MedicationRequest (tratamiento)
+    """
+    
+    from fhir.resources.R4B.bundle import Bundle, BundleEntry
+    from fhir.resources.R4B.quantity import Quantity
+    
+    entries = []
+    
+    # 1. Encounter (consulta)
+    encounter = consulta_to_fhir_encounter(consulta, paciente)
+    entries.append(BundleEntry(
+        fullUrl=f"urn:uuid:encounter-{consulta.id}",
+        resource=encounter
+    ))
+    
+    # 2. Observations (signos vitales)
+    if consulta.signos_vitales:
+        # Parsear signos vitales (formato: "PA: 120/80, T: 36.5°C, ...")
+        signos = {}
+        for item in consulta.signos_vitales.split(','):
+            if ':' in item:
+                key, value = item.split(':', 1)
+                signos[key.strip()] = value.strip()
+        
+        # Presión arterial
+        if 'PA' in signos and signos['PA']:
+            pa_obs = Observation(
+                id=f"obs-pa-{consulta.id}",
+                status="final",
+                code=CodeableConcept(
+                    coding=[Coding(
+                        system="http://loinc.org",
+                        code="85354-9",
+                        display="Blood pressure panel"
+                    )],
+                    text="Presión Arterial"
+                ),
+                subject=Reference(reference=f"Patient/{paciente.id}"),
+                valueString=signos['PA']
+            )
+            entries.append(BundleEntry(
+                fullUrl=f"urn:uuid:obs-pa-{consulta.id}",
+                resource=pa_obs.dict()
+            ))
+        
+        # Temperatura
+        if 'T' in signos and signos['T'] and signos['T'] != '°C':
+            temp_obs = Observation(
+                id=f"obs-temp-{consulta.id}",
+                status="final",
+                code=CodeableConcept(
+                    coding=[Coding(
+                        system="http://loinc.org",
+                        code="8310-5",
+                        display="Body temperature"
+                    )],
+                    text="Temperatura"
+                ),
+                subject=Reference(reference=f"Patient/{paciente.id}"),
+                valueString=signos['T']
+            )
+            entries.append(BundleEntry(
+                fullUrl=f"urn:uuid:obs-temp-{consulta.id}",
+                resource=temp_obs.dict()
+            ))
+    
+    # 3. Condition (diagnóstico)
+    if consulta.diagnostico:
+        condition = Condition(
+            id=f"condition-{consulta.id}",
+            clinicalStatus=CodeableConcept(
+                coding=[Coding(
+                    system="http://terminology.hl7.org/CodeSystem/condition-clinical",
+                    code="active"
+                )]
+            ),
+            code=CodeableConcept(
+                text=consulta.diagnostico
+            ),
+            subject=Reference(reference=f"Patient/{paciente.id}")
+        )
+        entries.append(BundleEntry(
+            fullUrl=f"urn:uuid:condition-{consulta.id}",
+            resource=condition.dict()
+        ))
+    
+    # 4. MedicationRequest (tratamiento)
+    if consulta.tratamiento:
+        med_request = MedicationRequest(
+            id=f"medication-{consulta.id}",
+            status="active",
+            intent="order",
+            medicationCodeableConcept=CodeableConcept(
+                text=consulta.tratamiento
+            ),
+            subject=Reference(reference=f"Patient/{paciente.id}"),
+            authoredOn=consulta.fecha.isoformat()
+        )
+        entries.append(BundleEntry(
+            fullUrl=f"urn:uuid:medication-{consulta.id}",
+            resource=med_request.dict()
+        ))
+    
+    # Crear Bundle
+    bundle = Bundle(
+        type="collection",
+        entry=entries
+    )
+    
+    return bundle.dict()
+
+def receta_to_fhir_medication_request(receta: models.Receta, paciente: models.Paciente, medico: models.Usuario) -> dict:
+    """Convierte una receta a FHIR MedicationRequest"""
+    from fhir.resources.R4B.medicationrequest import MedicationRequest
+    from fhir.resources.R4B.dosage import Dosage
+    
+    # Crear MedicationRequests para cada medicamento
+    medication_requests = []
+    
+    # Función auxiliar para crear un MedicationRequest
+    def create_med_request(nombre, dosis, frecuencia, duracion, via, index):
+        dosage = Dosage(
+            text=f"{dosis} - {frecuencia} - {duracion}",
+            route=CodeableConcept(text=via),
+            doseAndRate=_dosis_fhir(dosis)
+        )
+        
+        med_request = MedicationRequest(
+            id=f"receta-{receta.id}-med-{index}",
+            status="active" if receta.activa else "cancelled",
+            intent="order",
+            medicationCodeableConcept=CodeableConcept(text=nombre),
+            subject=Reference(
+                reference=f"Patient/{paciente.id}",
+                display=f"{paciente.nombre} {paciente.apellidos}"
+            ),
+            requester=Reference(
+                reference=f"Practitioner/{medico.id}",
+                display=medico.nombre_completo
+            ),
+            authoredOn=receta.fecha_emision.isoformat(),
+            dosageInstruction=[dosage],
+            note=[{
+                "text": receta.indicaciones_generales or ""
+            }] if receta.indicaciones_generales else []
+        )
+        
+        return med_request.dict()
+    
+    # Agregar medicamentos en el orden de la receta
+    for med in receta.medicamentos:
+        medication_requests.append(create_med_request(
+            med.nombre,
+            med.dosis,
+            med.frecuencia,
+            med.duracion,
+            med.via,
+            med.posicion
+        ))
+    
+    return medication_requests
+
+def orden_laboratorio_to_fhir_diagnostic_report(orden: models.OrdenLaboratorio, paciente: models.Paciente, medico: models.Usuario) -> dict:
+    """Convierte una orden de laboratorio a FHIR DiagnosticReport con Observations"""
+    from fhir.resources.R4B.diagnosticreport import DiagnosticReport
+    from fhir.resources.R4B.observation import Observation, ObservationReferenceRange
+    
+    # Mapeo de estados
+    status_map = {
+        "pendiente": "registered",
+        "en_proceso": "partial",
+        "completado": "final",
+        "cancelado": "cancelled"
+    }
+    
+    # Crear DiagnosticReport
+    diagnostic_report = DiagnosticReport(
+        id=f"lab-order-{orden.id}",
+        status=status_map.get(orden.estado, "unknown"),
+        code=CodeableConcept(
+            text="Panel de Laboratorio",
+            coding=[Coding(
+                system="http://loinc.org",
+                code="11502-2",
+                display="Laboratory report"
+            )]
+        ),
+        subject=Reference(
+            reference=f"Patient/{paciente.id}",
+            display=f"{paciente.nombre} {paciente.apellidos}"
+        ),
+        performer=[Reference(
+            reference=f"Practitioner/{medico.id}",
+            display=medico.nombre_completo
+        )],
+        effectiveDateTime=orden.fecha_orden.isoformat(),
+        issued=_instante(orden.fecha_resultado or datetime.utcnow()),
+        conclusionCode=[CodeableConcept(
+            text=orden.diagnostico_presuntivo or "Diagnóstico no especificado"
+        )] if orden.diagnostico_presuntivo else None
+    )
+    
+    # Agregar observaciones (resultados de exámenes)
+    observations = []
+    result_references = []
+    
+    for examen in orden.examenes:
+        i = examen.numero
+        codigo = examen.codigo_loinc
+        nombre = examen.nombre
+        resultado = examen.resultado
+        valor_ref = examen.valor_referencia
+        unidad = examen.unidad
+        
+        # Crear Observation
+        obs = Observation(
+            id=f"obs-{orden.id}-{i}",
+            status="final" if resultado else "registered",
+            code=CodeableConcept(
+                text=nombre,
+                coding=[Coding(
+                    system="http://loinc.org",
+                    code=codigo,
+                    display=nombre
+                )]
+            ),
+            subject=Reference(
+                reference=f"Patient/{paciente.id}",
+                display=f"{paciente.nombre} {paciente.apellidos}"
+            ),
+            effectiveDateTime=orden.fecha_orden.isoformat(),
+            performer=[Reference(
+                reference=f"Practitioner/{medico.id}",
+                display=medico.nombre_completo
+            )]
+        )
+        
+        # Agregar resultado si existe
+        if resultado:
+            # Intentar parsear como número
+            try:
+                valor_numerico = float(resultado.replace(',', '.').split()[0])
+                from fhir.resources.R4B.quantity import Quantity
+                obs.valueQuantity = Quantity(
+                    value=valor_numerico,
+                    unit=unidad or "",
+                    system="http://unitsofmeasure.org",
+                    code=unidad or ""
+                )
+            except (ValueError, AttributeError):
+                # Si no es número, guardar como string
+                obs.valueString = resultado
+            
+            # Agregar valor de referencia
+            if valor_ref:
+                obs.referenceRange = [ObservationReferenceRange(
+                    text=valor_ref
+                )]
+        
+        observations.append(obs.dict())
+        result_references.append(Reference(
+            reference=f"Observation/obs-{orden.id}-{i}",
+            display=nombre
+        ))
+    
+    # Agregar referencias a resultados en el DiagnosticReport
+    if result_references:
+        diagnostic_report.result = result_references
+    
+    return {
+        "diagnosticReport": diagnostic_report.dict(),
+        "observations": observations
+    }
+
+def bundle_coleccion(entradas: list) -> dict:
+    """Bundle collection como lo armaba /fhir/Bundle/paciente/{id}"""
+    from fhir.resources.R4B.bundle import Bundle, BundleEntry
+
+    return Bundle(
+        type="collection",
+        entry=[BundleEntry(fullUrl=full_url, resource=recurso) for full_url, recurso in entradas]
+    ).dict()
@@ -0,0 +1,100 @@
+"""
+Los endpoints de imagenología (AsyncSession) no serializan los requests.
+
+Cada sentencia de la base se hace lenta con un progress handler de SQLite,
+que corre en el hilo de la conexión aiosqlite: mientras una consulta espera,
+el event loop queda libre. N requests lentos en paralelo deben tardar
+aproximadamente lo que tarda uno, y un request liviano que llega en medio
+debe responder sin esperarlos.
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+from sqlalchemy import event
+
+from backend.database import async_engine
+from backend.main import app
+
+RETARDO = 0.2  # segundos por sentencia
+CONCURRENTES = 8
+
+
+@pytest.fixture
+def base_lenta():
+    pendientes = {}  # conexión aiosqlite -> debe dormir en la próxima sentencia
+
+    def al_conectar(dbapi_connection, registro):
+        conexion = dbapi_connection.driver_connection
+        pendientes[conexion] = False
+
+        def progreso():
+            if pendientes.get(conexion):
+                pendientes[conexion] = False
+                time.sleep(RETARDO)  # en el hilo de aiosqlite, no en el event loop
+            return 0
+
+        dbapi_connection.run_async(lambda c: c.set_progress_handler(progreso, 1))
+
+    def antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+        pendientes[conn.connection.driver_connection] = True
+
+    # Conexiones nuevas: las del pool ya abiertas no tienen el progress handler
+    async_engine.sync_engine.pool.dispose()
+    event.listen(async_engine.sync_engine, "connect", al_conectar)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", antes_de_ejecutar)
+    yield
+    event.remove(async_engine.sync_engine, "connect", al_conectar)
+    event.remove(async_engine.sync_engine, "before_cursor_execute", antes_de_ejecutar)
+    async_engine.sync_engine.pool.dispose()
+
+
+async def _medir(cliente, metodo, url, **kwargs):
+    inicio = time.perf_counter()
+    respuesta = await cliente.request(metodo, url, **kwargs)
+    assert respuesta.status_code == 200, respuesta.text
+    return time.perf_counter() - inicio
+
+
+def _ejecutar(solicitudes):
+    async def todas():
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+            # Una primera vuelta abre las conexiones del pool fuera de la medición
+            await asyncio.gather(*[_medir(cliente, *s[:2], **s[2]) for s in solicitudes[:CONCURRENTES]])
+            inicio = time.perf_counter()
+            tiempos = await asyncio.gather(*[_medir(cliente, *s[:2], **s[2]) for s in solicitudes])
+            return time.perf_counter() - inicio, tiempos
+    return asyncio.run(todas())
+
+
+def test_lecturas_concurrentes_no_se_serializan(base_lenta, crear_usuario, crear_paciente, encabezados):
+    medico = crear_usuario("medico")
+    paciente = crear_paciente()
+    h = encabezados(medico)
+    lento = ("GET", f"/api/imagenologia/paciente/{paciente.id}", {"headers": h})
+
+    (_, (un_request,)) = _ejecutar([lento])
+    total, tiempos = _ejecutar([lento] * CONCURRENTES + [("GET", "/health", {})])
+
+    assert un_request >= RETARDO
+    # Serializados tardarían CONCURRENTES veces un request
+    assert total < un_request * 2.5, (total, un_request)
+    # El request liviano no espera a los lentos
+    assert tiempos[-1] < RETARDO, tiempos[-1]
+
+
+def test_escrituras_no_bloquean_el_event_loop(base_lenta, crear_usuario, crear_paciente, encabezados):
+    medico = crear_usuario("medico")
+    paciente = crear_paciente()
+    orden = {
+        "paciente_id": paciente.id,
+        "estudios": [{"categoria": "Rayos X", "nombre": "Tórax PA"}],
+    }
+    crear = ("POST", "/api/imagenologia/orden", {"headers": encabezados(medico), "json": orden})
+
+    _, tiempos = _ejecutar([crear] * CONCURRENTES + [("GET", "/health", {})])
+
+    # SQLite serializa las escrituras, pero mientras esperan el loop sigue atendiendo
+    assert tiempos[-1] < RETARDO, tiempos[-1]
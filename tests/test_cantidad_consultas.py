@@ -0,0 +1,88 @@
+"""
+Los endpoints de listas cargan las relaciones con una cantidad fija de
+consultas (joinedload / selectinload), sin una consulta más por fila.
+
+Se cuentan las sentencias que llegan a los tres engines (escritura,
+lectura y async) para un paciente con una fila de cada tipo y para otro
+con 50, cada una de un médico distinto.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from backend import models
+from backend.database import async_engine, engine, read_engine
+from backend.main import app
+
+ENDPOINTS = [
+    "/api/citas?paciente_id={id}&limite=100",
+    "/api/recetas/paciente/{id}?limite=100",
+    "/api/laboratorio/paciente/{id}?limite=100",
+    "/api/imagenologia/paciente/{id}?limite=100",
+]
+
+
+@pytest.fixture
+def contador():
+    sentencias = []
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    engines = {engine, read_engine, async_engine.sync_engine}
+    for e in engines:
+        event.listen(e, "before_cursor_execute", contar)
+    yield sentencias
+    for e in engines:
+        event.remove(e, "before_cursor_execute", contar)
+
+
+def _historial(db, paciente, medicos):
+    inicio = datetime(2024, 1, 1, 8, 0)
+    for i, medico in enumerate(medicos):
+        fecha = inicio + timedelta(hours=i)
+        db.add(models.Cita(paciente_id=paciente.id, medico_id=medico.id, fecha_hora=fecha, motivo="Control"))
+        receta = models.Receta(paciente_id=paciente.id, medico_id=medico.id, fecha_emision=fecha)
+        receta.medicamentos = [
+            models.RecetaMedicamento(posicion=k, nombre=f"Medicamento {k}", dosis="1", frecuencia="c/8h",
+                                     duracion="7 días", via="Oral")
+            for k in (1, 2)
+        ]
+        orden = models.OrdenLaboratorio(paciente_id=paciente.id, medico_id=medico.id, fecha_orden=fecha)
+        orden.examenes = [
+            models.ExamenLaboratorio(numero=k, codigo_loinc="2345-7", nombre="Glucosa") for k in (1, 2)
+        ]
+        imagen = models.OrdenImagenologia(paciente_id=paciente.id, medico_id=medico.id, fecha_orden=fecha)
+        imagen.estudios = [
+            models.EstudioImagenologia(numero=k, categoria="Rayos X", nombre="Tórax") for k in (1, 2)
+        ]
+        db.add_all([receta, orden, imagen])
+    db.commit()
+
+
+def _consultas(cliente, contador, url, h, filas):
+    del contador[:]
+    respuesta = cliente.get(url, headers=h)
+    assert respuesta.status_code == 200, respuesta.text
+    assert len(respuesta.json()["resultados"]) == filas
+    return len(contador)
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_consultas_constantes(endpoint, contador, db, crear_usuario, crear_paciente, encabezados):
+    medicos = [crear_usuario("medico") for _ in range(50)]
+    uno, cincuenta = crear_paciente(), crear_paciente()
+    _historial(db, uno, medicos[:1])
+    _historial(db, cincuenta, medicos)
+
+    cliente = TestClient(app)
+    h = encabezados(medicos[0])
+    # Calienta el pool y los planes de consulta
+    _consultas(cliente, contador, endpoint.format(id=uno.id), h, 1)
+
+    con_una = _consultas(cliente, contador, endpoint.format(id=uno.id), h, 1)
+    con_cincuenta = _consultas(cliente, contador, endpoint.format(id=cincuenta.id), h, 50)
+    assert con_una > 0
+    assert con_una == con_cincuenta, contador
@@ -0,0 +1,51 @@
+"""
+$export con _since: incluye las filas modificadas después de esa fecha,
+no solo las creadas (Bulk Data define _since como "modificado desde").
+"""
+import json
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from fastapi.testclient import TestClient
+
+from backend.main import app
+
+
+def _ruta(url: str) -> str:
+    partes = urlsplit(url)
+    return partes.path + (f"?{partes.query}" if partes.query else "")
+
+
+def _exportar(cliente, h, since: str) -> list:
+    """Patients exportados con ese _since"""
+    respuesta = cliente.get("/fhir/Patient/$export", params={"_type": "Patient", "_since": since}, headers=h)
+    assert respuesta.status_code == 202, respuesta.text
+    estado = _ruta(respuesta.headers["content-location"])
+    limite = time.monotonic() + 60
+    while (respuesta := cliente.get(estado, headers=h)).status_code == 202:
+        assert time.monotonic() < limite, "la exportación no terminó"
+        time.sleep(0.2)
+    assert respuesta.status_code == 200, respuesta.text
+    recursos = []
+    for salida in respuesta.json()["output"]:
+        archivo = cliente.get(_ruta(salida["url"]), headers=h)
+        recursos += [json.loads(linea) for linea in archivo.text.splitlines()]
+    return recursos
+
+
+def test_since_incluye_pacientes_modificados(db, crear_usuario, crear_paciente, encabezados):
+    admin = crear_usuario("admin")
+    paciente = crear_paciente()
+    time.sleep(0.01)
+    since = datetime.now(timezone.utc).isoformat()
+
+    with TestClient(app) as cliente:
+        h = encabezados(admin)
+        assert str(paciente.id) not in {r["id"] for r in _exportar(cliente, h, since)}
+
+        paciente.telefono = "8888-0000"
+        db.commit()
+        exportados = {r["id"]: r for r in _exportar(cliente, h, since)}
+        assert str(paciente.id) in exportados
+        assert exportados[str(paciente.id)]["telecom"][0]["value"] == "8888-0000"
@@ -0,0 +1,173 @@
+"""
+Los dicts de backend.fhir_converter producen el mismo JSON que el conversor
+anterior con modelos de fhir.resources (tests/fhir_pydantic.py), que la API
+pasaba por jsonable_encoder: mismos campos, mismo orden, mismas omisiones
+de valores vacíos.
+
+Los objetos del modelo son transitorios, sin base de datos.
+"""
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from backend import fhir_converter, models
+from backend.config import settings
+from tests import fhir_pydantic
+
+FECHA = datetime(2024, 3, 5, 14, 30, 15, 123456)
+
+MEDICO = models.Usuario(id=7, nombre_completo="Dra. Ana Pérez")
+
+PACIENTES = {
+    "completo": models.Paciente(
+        id=1, identificacion="1-1234-5678", nombre="José María", apellidos="Mora Solís",
+        fecha_nacimiento=datetime(1970, 5, 3), genero="Masculino", telefono="8888-0000",
+        email="jm@example.com", direccion="San José, Costa Rica"
+    ),
+    "sin_contacto": models.Paciente(
+        id=2, identificacion="2-0000-0001", nombre="Lucía", apellidos="Rojas",
+        fecha_nacimiento=None, genero=None, telefono=None, email=None, direccion=None
+    ),
+    "vacios": models.Paciente(
+        id=3, identificacion="3-0000-0002", nombre="Ana", apellidos="Vargas",
+        fecha_nacimiento=datetime(2001, 1, 1), genero="Otro", telefono="", email="", direccion=""
+    ),
+}
+
+CONSULTAS = {
+    "completa": dict(signos_vitales="PA: 120/80, T: 36.5°C, FC: 72", diagnostico="Hipertensión arterial",
+                     tratamiento="Dieta baja en sodio"),
+    "signos_vacios": dict(signos_vitales="PA: , T: °C", diagnostico=None, tratamiento=None),
+    "solo_pa": dict(signos_vitales="PA: 110/70", diagnostico="Control", tratamiento=None),
+    "sin_datos": dict(signos_vitales=None, diagnostico=None, tratamiento=None),
+}
+
+MEDICAMENTOS = {
+    "dosis": dict(nombre="Losartán", dosis="50 mg", frecuencia="c/24h", duracion="30 días", via="Oral"),
+    "dosis_coma": dict(nombre="Jarabe", dosis="2,5 ml", frecuencia="c/8h", duracion="5 días", via="Oral"),
+    "sin_numero": dict(nombre="Crema", dosis="según indicación", frecuencia="c/12h", duracion="", via=None),
+    "sin_unidad": dict(nombre="Tabletas", dosis="2", frecuencia="c/8h", duracion="3 días", via="Oral"),
+}
+
+RECETAS = {
+    "activa": dict(activa=True, indicaciones_generales="Tomar con comida", medicamentos=["dosis", "dosis_coma"]),
+    "cancelada": dict(activa=False, indicaciones_generales=None, medicamentos=["sin_numero", "sin_unidad"]),
+    "indicaciones_vacias": dict(activa=True, indicaciones_generales="", medicamentos=["dosis"]),
+    "sin_medicamentos": dict(activa=True, indicaciones_generales=None, medicamentos=[]),
+}
+
+EXAMENES = {
+    "con_unidad": dict(codigo_loinc="2345-7", nombre="Glucosa", resultado="95", valor_referencia="70-100",
+                       unidad="mg/dL"),
+    "coma_y_texto": dict(codigo_loinc="718-7", nombre="Hemoglobina", resultado="13,5 g/dL", unidad="g/dL"),
+    "sin_unidad": dict(codigo_loinc="5811-5", nombre="Densidad", resultado="1.020", valor_referencia="1.005-1.030"),
+    "texto": dict(codigo_loinc="2093-3", nombre="Colesterol", resultado="normal", unidad="mg/dL"),
+    "pendiente": dict(codigo_loinc="2160-0", nombre="Creatinina", resultado=None, valor_referencia="0.7-1.3"),
+    "sin_loinc": dict(codigo_loinc=None, nombre="Examen externo", resultado=""),
+}
+
+ORDENES = {
+    "completada": dict(estado="completado", diagnostico_presuntivo="Control", examenes=list(EXAMENES)),
+    "pendiente": dict(estado="pendiente", diagnostico_presuntivo=None, examenes=["pendiente"]),
+    "estado_desconocido": dict(estado="otro", diagnostico_presuntivo="", examenes=[]),
+}
+
+
+def consulta(id_consulta, caso):
+    return models.Consulta(id=id_consulta, fecha=FECHA, motivo="Control", **CONSULTAS[caso])
+
+
+def receta(id_receta, caso):
+    campos = dict(RECETAS[caso])
+    fila = models.Receta(id=id_receta, fecha_emision=FECHA, **{k: v for k, v in campos.items() if k != "medicamentos"})
+    fila.medicamentos = [
+        models.RecetaMedicamento(posicion=k, **MEDICAMENTOS[m]) for k, m in enumerate(campos["medicamentos"], 1)
+    ]
+    return fila
+
+
+def orden(id_orden, caso):
+    campos = dict(ORDENES[caso])
+    fila = models.OrdenLaboratorio(id=id_orden, fecha_orden=FECHA, fecha_resultado=FECHA,
+                                   **{k: v for k, v in campos.items() if k != "examenes"})
+    fila.examenes = [
+        models.ExamenLaboratorio(numero=k, **EXAMENES[e]) for k, e in enumerate(campos["examenes"], 1)
+    ]
+    return fila
+
+
+def mismo_json(anterior, directo):
+    esperado = json.dumps(jsonable_encoder(anterior), ensure_ascii=False)
+    assert json.dumps(directo, ensure_ascii=False) == esperado
+
+
+@pytest.mark.parametrize("caso", PACIENTES)
+def test_patient(caso):
+    paciente = PACIENTES[caso]
+    mismo_json(fhir_pydantic.paciente_to_fhir(paciente), fhir_converter.paciente_to_fhir(paciente))
+
+
+@pytest.mark.parametrize("caso", CONSULTAS)
+def test_encounter_y_observations(caso):
+    paciente, fila = PACIENTES["completo"], consulta(10, caso)
+    mismo_json(fhir_pydantic.consulta_to_fhir_encounter(fila, paciente),
+               fhir_converter.consulta_to_fhir_encounter(fila, paciente))
+    mismo_json(fhir_pydantic.consulta_to_fhir_bundle(fila, paciente),
+               fhir_converter.consulta_to_fhir_bundle(fila, paciente))
+
+
+@pytest.mark.parametrize("caso", RECETAS)
+def test_medication_request(caso):
+    paciente, fila = PACIENTES["sin_contacto"], receta(20, caso)
+    mismo_json(fhir_pydantic.receta_to_fhir_medication_request(fila, paciente, MEDICO),
+               fhir_converter.receta_to_fhir_medication_request(fila, paciente, MEDICO))
+
+
+@pytest.mark.parametrize("caso", ORDENES)
+def test_diagnostic_report_y_observations(caso):
+    paciente, fila = PACIENTES["completo"], orden(30, caso)
+    mismo_json(fhir_pydantic.orden_laboratorio_to_fhir_diagnostic_report(fila, paciente, MEDICO),
+               fhir_converter.orden_laboratorio_to_fhir_diagnostic_report(fila, paciente, MEDICO))
+
+
+def _entradas(conversor):
+    """(fullUrl, recurso) de un historial con todos los casos, como los arma /fhir/Bundle/paciente"""
+    paciente = PACIENTES["completo"]
+    entradas = [(f"urn:uuid:patient-{paciente.id}", conversor.paciente_to_fhir(paciente))]
+    for n, caso in enumerate(CONSULTAS):
+        bundle = conversor.consulta_to_fhir_bundle(consulta(100 + n, caso), paciente)
+        entradas += [(entrada["fullUrl"], entrada["resource"]) for entrada in bundle["entry"]]
+    for n, caso in enumerate(RECETAS):
+        for recurso in conversor.receta_to_fhir_medication_request(receta(200 + n, caso), paciente, MEDICO):
+            entradas.append((f"urn:uuid:{recurso['id']}", recurso))
+    for n, caso in enumerate(ORDENES):
+        convertido = conversor.orden_laboratorio_to_fhir_diagnostic_report(orden(300 + n, caso), paciente, MEDICO)
+        for recurso in [convertido["diagnosticReport"]] + convertido["observations"]:
+            entradas.append((f"urn:uuid:{recurso['id']}", recurso))
+    return entradas
+
+
+def test_bundle_coleccion():
+    mismo_json(fhir_pydantic.bundle_coleccion(_entradas(fhir_pydantic)),
+               fhir_converter.bundle_coleccion(_entradas(fhir_converter)))
+    assert fhir_converter.bundle_coleccion([])["entry"] == []
+
+
+def test_casos_que_el_conversor_anterior_rechazaba(monkeypatch):
+    """Sin motivo, con vía vacía o con resultado en blanco el anterior lanzaba excepción; ahora salen recursos válidos"""
+    monkeypatch.setattr(settings, "fhir_validar", True)
+    paciente = PACIENTES["completo"]
+
+    sin_motivo = models.Consulta(id=40, fecha=FECHA, motivo=None)
+    assert "reasonCode" not in fhir_converter.consulta_to_fhir_encounter(sin_motivo, paciente)
+
+    fila = receta(41, "activa")
+    fila.medicamentos[0].via = ""
+    assert "route" not in fhir_converter.receta_to_fhir_medication_request(fila, paciente, MEDICO)[0]["dosageInstruction"][0]
+
+    fila = orden(42, "pendiente")
+    fila.examenes[0].resultado = "   "
+    (observacion,) = fhir_converter.orden_laboratorio_to_fhir_diagnostic_report(fila, paciente, MEDICO)["observations"]
+    assert observacion["valueString"] == "   "
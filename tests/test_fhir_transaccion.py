@@ -0,0 +1,207 @@
+"""
+POST /fhir con Bundles transaction y batch: referencias entre entradas
+(urn:uuid), transaction todo o nada, batch con errores por entrada y
+entradas con una forma JSON inválida (400, nunca 500).
+"""
+import itertools
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import models
+from backend.main import app
+
+_secuencia = itertools.count(1)
+
+
+@pytest.fixture
+def cliente():
+    return TestClient(app)
+
+
+@pytest.fixture
+def medico(crear_usuario, encabezados):
+    return encabezados(crear_usuario("medico"))
+
+
+def identificacion() -> str:
+    return f"TX-{next(_secuencia)}"
+
+
+def patient(valor: str) -> dict:
+    return {
+        "resourceType": "Patient",
+        "identifier": [{"system": "urn:oid:ece-medico", "value": valor}],
+        "name": [{"family": "Mora Solís", "given": ["José", "María"]}],
+        "gender": "male",
+        "birthDate": "1970-05-03",
+    }
+
+
+def medication_request(subject: dict, nombre: str = "Losartán") -> dict:
+    return {
+        "resourceType": "MedicationRequest",
+        "status": "active",
+        "intent": "order",
+        "subject": subject,
+        "medicationCodeableConcept": {"text": nombre},
+        "dosageInstruction": [{"text": "50 mg - c/24h - 30 días", "route": {"text": "Oral"}}],
+        "groupIdentifier": {"value": "receta-1"},
+        "note": [{"text": "Tomar con comida"}],
+    }
+
+
+def observation(codigo: str, nombre: str, valor: float) -> dict:
+    return {
+        "resourceType": "Observation",
+        "status": "final",
+        "code": {"coding": [{"system": "http://loinc.org", "code": codigo, "display": nombre}]},
+        "valueQuantity": {"value": valor, "unit": "mg/dL"},
+    }
+
+
+def diagnostic_report(subject: dict, resultados: list) -> dict:
+    return {
+        "resourceType": "DiagnosticReport",
+        "status": "final",
+        "subject": subject,
+        "result": [{"reference": r} for r in resultados],
+        "conclusionCode": [{"text": "Control"}],
+    }
+
+
+def entrada(recurso: dict, full_url: str = None, **request) -> dict:
+    resultado = {"resource": recurso, "request": {"method": "POST", "url": recurso["resourceType"], **request}}
+    if full_url:
+        resultado["fullUrl"] = full_url
+    return resultado
+
+
+def bundle(tipo: str, entradas: list) -> dict:
+    return {"resourceType": "Bundle", "type": tipo, "entry": entradas}
+
+
+def estados(respuesta) -> list:
+    return [e["response"]["status"] for e in respuesta.json()["entry"]]
+
+
+def test_referencias_urn_uuid_entre_entradas(cliente, medico, db):
+    valor = identificacion()
+    subject = {"reference": "urn:uuid:paciente"}
+    respuesta = cliente.post("/fhir", headers=medico, json=bundle("transaction", [
+        entrada(patient(valor), "urn:uuid:paciente"),
+        entrada(medication_request(subject, "Losartán")),
+        entrada(medication_request(subject, "Metformina")),
+        entrada(observation("2345-7", "Glucosa", 95), "urn:uuid:glucosa"),
+        entrada(observation("2093-3", "Colesterol", 180.5), "urn:uuid:colesterol"),
+        entrada(diagnostic_report(subject, ["urn:uuid:glucosa", "urn:uuid:colesterol"])),
+    ]))
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert respuesta.json()["type"] == "transaction-response"
+    assert estados(respuesta) == ["201 Created"] * 6
+
+    nuevo = db.query(models.Paciente).filter(models.Paciente.identificacion == valor).one()
+    (receta,) = db.query(models.Receta).filter(models.Receta.paciente_id == nuevo.id).all()
+    assert [m.nombre for m in receta.medicamentos] == ["Losartán", "Metformina"]
+    assert receta.indicaciones_generales == "Tomar con comida"
+    (orden,) = db.query(models.OrdenLaboratorio).filter(models.OrdenLaboratorio.paciente_id == nuevo.id).all()
+    assert [(e.codigo_loinc, e.resultado) for e in orden.examenes] == [("2345-7", "95"), ("2093-3", "180.5")]
+    assert orden.estado == "completado"
+
+    ubicaciones = [e["response"]["location"] for e in respuesta.json()["entry"]]
+    assert ubicaciones[0] == f"Patient/{nuevo.id}"
+    assert ubicaciones[3:] == [f"Observation/obs-{orden.id}-1", f"Observation/obs-{orden.id}-2",
+                               f"DiagnosticReport/lab-order-{orden.id}"]
+
+
+def test_transaction_no_guarda_nada_si_falla_una_entrada(cliente, medico, db):
+    valor = identificacion()
+    subject = {"reference": "urn:uuid:paciente"}
+    respuesta = cliente.post("/fhir", headers=medico, json=bundle("transaction", [
+        entrada(patient(valor), "urn:uuid:paciente"),
+        entrada(medication_request(subject)),
+        entrada(diagnostic_report(subject, ["urn:uuid:no-existe"])),
+    ]))
+
+    assert respuesta.status_code == 400, respuesta.text
+    assert respuesta.json()["resourceType"] == "OperationOutcome"
+    assert respuesta.json()["issue"][0]["diagnostics"].startswith("entry[2]: ")
+    assert db.query(models.Paciente).filter(models.Paciente.identificacion == valor).count() == 0
+
+
+def test_batch_guarda_las_entradas_validas(cliente, medico, crear_paciente, db):
+    existente = crear_paciente()
+    valor = identificacion()
+    respuesta = cliente.post("/fhir", headers=medico, json=bundle("batch", [
+        entrada(patient(valor)),
+        entrada(patient(existente.identificacion)),
+        entrada(medication_request({"reference": f"Patient/{existente.id}"})),
+        entrada(medication_request({"reference": "Patient/999999999"})),
+        {**entrada(patient(identificacion())), "request": {"method": "PUT"}},
+        entrada(patient(existente.identificacion), ifNoneExist=f"identifier={existente.identificacion}"),
+    ]))
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert respuesta.json()["type"] == "batch-response"
+    assert estados(respuesta) == [
+        "201 Created", "409 Conflict", "201 Created", "404 Not Found", "405 Method Not Allowed", "200 OK",
+    ]
+    assert respuesta.json()["entry"][1]["response"]["outcome"]["resourceType"] == "OperationOutcome"
+    assert respuesta.json()["entry"][5]["response"]["location"] == f"Patient/{existente.id}"
+    assert db.query(models.Paciente).filter(models.Paciente.identificacion == valor).count() == 1
+    assert db.query(models.Receta).filter(models.Receta.paciente_id == existente.id).count() == 1
+
+
+MALFORMADOS = {
+    "entrada_numero": lambda p: 1,
+    "entrada_texto": lambda p: "x",
+    "resource_texto": lambda p: {"resource": "Patient"},
+    "full_url_objeto": lambda p: {**entrada(patient(identificacion())), "fullUrl": {"a": 1}},
+    "request_lista": lambda p: {**entrada(patient(identificacion())), "request": ["POST"]},
+    "resource_type_objeto": lambda p: entrada({**patient(identificacion()), "resourceType": {}}),
+    "subject_texto": lambda p: entrada(medication_request(f"Patient/{p.id}")),
+    "identifier_objeto": lambda p: entrada({**patient(identificacion()), "identifier": {"value": "1"}}),
+    "given_texto": lambda p: entrada({**patient(identificacion()), "name": [{"family": "A", "given": "B"}]}),
+    "birth_date_numero": lambda p: entrada({**patient(identificacion()), "birthDate": 1970}),
+    "texto_objeto": lambda p: entrada({**medication_request({"reference": f"Patient/{p.id}"}),
+                                       "medicationCodeableConcept": {"text": {"es": "Losartán"}}}),
+    "result_texto": lambda p: entrada(diagnostic_report({"reference": f"Patient/{p.id}"}, []) | {
+        "result": ["Observation/1"]}),
+    "valor_texto": lambda p: entrada({**observation("2345-7", "Glucosa", 95), "valueQuantity": {"value": "95"}}),
+}
+
+
+@pytest.mark.parametrize("caso", MALFORMADOS)
+def test_forma_invalida_en_transaction_es_400(caso, cliente, medico, crear_paciente, db):
+    existente = crear_paciente()
+    valor = identificacion()
+    respuesta = cliente.post("/fhir", headers=medico, json=bundle("transaction", [
+        entrada(patient(valor)),
+        MALFORMADOS[caso](existente),
+    ]))
+
+    assert respuesta.status_code == 400, respuesta.text
+    assert respuesta.json()["resourceType"] == "OperationOutcome"
+    assert respuesta.json()["issue"][0]["diagnostics"].startswith("entry[1]: ")
+    assert db.query(models.Paciente).filter(models.Paciente.identificacion == valor).count() == 0
+
+
+@pytest.mark.parametrize("caso", MALFORMADOS)
+def test_forma_invalida_en_batch_es_error_de_la_entrada(caso, cliente, medico, crear_paciente, db):
+    existente = crear_paciente()
+    valor = identificacion()
+    respuesta = cliente.post("/fhir", headers=medico, json=bundle("batch", [
+        entrada(patient(valor)),
+        MALFORMADOS[caso](existente),
+    ]))
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert estados(respuesta) == ["201 Created", "400 Bad Request"]
+    assert db.query(models.Paciente).filter(models.Paciente.identificacion == valor).count() == 1
+
+
+def test_entry_que_no_es_lista_es_400(cliente, medico):
+    respuesta = cliente.post("/fhir", headers=medico, json={"resourceType": "Bundle", "type": "batch", "entry": {}})
+    assert respuesta.status_code == 400
+    assert respuesta.json()["issue"][0]["code"] == "invalid"
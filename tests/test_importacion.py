@@ -0,0 +1,193 @@
+"""
+POST /api/pacientes/import: el archivo llega en fragmentos chicos (cortando
+líneas y caracteres UTF-8 por la mitad) y se importa por lotes.
+"""
+import asyncio
+import itertools
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import importacion, models
+from backend.config import settings
+from backend.database import AsyncSessionLocal
+from backend.main import app
+
+ENCABEZADO = "identificacion,nombre,apellidos,fecha_nacimiento,genero,telefono,email,direccion\n"
+
+_archivo = itertools.count(1)
+
+
+@pytest.fixture
+def ids():
+    """ids(n) -> n identificaciones que no usa ningún otro test"""
+    prefijo = f"IMP{next(_archivo)}"
+    return lambda n: [f"{prefijo}-{i}" for i in range(1, n + 1)]
+
+
+@pytest.fixture
+def recepcion(crear_usuario, encabezados):
+    return encabezados(crear_usuario("recepcion"))
+
+
+async def _fragmentos(contenido: bytes, tam: int):
+    for i in range(0, len(contenido), tam):
+        yield contenido[i:i + tam]
+
+
+def _cliente():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def importar(h, texto: str, formato: str = "csv", tam: int = 7) -> dict:
+    async def enviar():
+        async with _cliente() as cliente:
+            return await cliente.post(f"/api/pacientes/import?formato={formato}", headers=h,
+                                      content=_fragmentos(texto.encode(), tam))
+    respuesta = asyncio.run(enviar())
+    assert respuesta.status_code == 200, respuesta.text
+    return respuesta.json()
+
+
+def csv_fila(identificacion, nombre="Ana", apellidos="Mora", direccion="San José"):
+    return f"{identificacion},{nombre},{apellidos},1990-01-01,Femenino,8888-0000,,{direccion}\n"
+
+
+def paciente(db, identificacion) -> models.Paciente:
+    return db.query(models.Paciente).filter(models.Paciente.identificacion == identificacion).one()
+
+
+@pytest.mark.parametrize("tam", [1, 7, 4096])
+def test_csv_en_fragmentos(tam, ids, recepcion, db):
+    a, b, c = ids(3)
+    texto = (
+        "\ufeff" + ENCABEZADO
+        + csv_fila(a, "José María", "Núñez Solís", '"Del parque, 100 m norte\ncasa ""La Esquina"""')
+        + csv_fila(b, "Ana", 'O"Neil')
+        + "\n"
+        + csv_fila(c).replace("\n", "\r\n")
+    )
+
+    resultado = importar(recepcion, texto, tam=tam)
+
+    assert (resultado["total"], resultado["creados"], resultado["errores"]) == (3, 3, [])
+    assert paciente(db, a).nombre == "José María"
+    assert paciente(db, a).direccion == 'Del parque, 100 m norte\ncasa "La Esquina"'
+    assert paciente(db, b).apellidos == 'O"Neil'
+    assert paciente(db, c).direccion == "San José"
+
+
+def test_ndjson_en_fragmentos(ids, recepcion, db):
+    a, b, c = ids(3)
+    fila = {"nombre": "Lucía", "apellidos": "Rojas", "fecha_nacimiento": "1985-02-03", "genero": "Femenino",
+            "direccion": "Línea 1\nLínea 2"}
+    texto = "\n".join([
+        json.dumps({"identificacion": a, **fila}, ensure_ascii=False),
+        "{no es json",
+        "",
+        "[1, 2]",
+        json.dumps({"identificacion": b, **fila, "fecha_nacimiento": "03/02/1985"}),
+        json.dumps({"identificacion": c, **fila, "telefono": 88880000}),
+    ])
+
+    resultado = importar(recepcion, texto, formato="ndjson", tam=5)
+
+    assert (resultado["total"], resultado["creados"], resultado["con_error"]) == (5, 2, 3)
+    assert [(e["fila"], e["error"]) for e in resultado["errores"]] == [
+        (2, "JSON inválido"),
+        (3, "Se esperaba un objeto JSON"),
+        (4, "fecha_nacimiento debe tener formato AAAA-MM-DD"),
+    ]
+    assert paciente(db, a).direccion == "Línea 1\nLínea 2"
+    assert paciente(db, c).telefono == "88880000"
+
+
+def test_duplicados_en_el_archivo_y_en_la_base(ids, recepcion, crear_paciente):
+    a, b, c = ids(3)
+    crear_paciente(identificacion=b)
+    texto = ENCABEZADO + csv_fila(a) + csv_fila(b) + csv_fila(c) + csv_fila(a, "Otra")
+
+    resultado = importar(recepcion, texto)
+
+    assert (resultado["total"], resultado["creados"], resultado["duplicados"]) == (4, 2, 2)
+    assert sorted((e["fila"], e["identificacion"], e["error"]) for e in resultado["errores"]) == [
+        (2, b, "Paciente ya existe"),
+        (4, a, "Identificación repetida (fila 1)"),
+    ]
+
+
+def test_reenvio_despues_de_una_importacion_cortada(ids, recepcion, db):
+    identificaciones = ids(6)
+    filas = [csv_fila(i) for i in identificaciones]
+
+    async def cortada():
+        async def fragmentos():
+            yield (ENCABEZADO + "".join(filas[:5])).encode()
+            raise ConnectionError("conexión cortada")
+
+        async with AsyncSessionLocal() as sesion:
+            with pytest.raises(ConnectionError):
+                await importacion.importar_pacientes(sesion, fragmentos(), tam_lote=2)
+
+    asyncio.run(cortada())
+    # Los lotes completos quedaron guardados; la quinta fila no llegó a confirmarse
+    guardados = db.query(models.Paciente.identificacion).filter(
+        models.Paciente.identificacion.in_(identificaciones)
+    ).all()
+    assert sorted(i for i, in guardados) == identificaciones[:4]
+
+    resultado = importar(recepcion, ENCABEZADO + "".join(filas))
+    assert (resultado["creados"], resultado["duplicados"], resultado["con_error"]) == (2, 4, 0)
+
+
+def test_errores_truncados(ids, recepcion, monkeypatch):
+    monkeypatch.setattr(settings, "importacion_max_errores", 3)
+    (valida,) = ids(1)
+    texto = ENCABEZADO + "".join(f"x{i},,,,\n" for i in range(5)) + csv_fila(valida)
+
+    resultado = importar(recepcion, texto)
+
+    assert (resultado["total"], resultado["creados"], resultado["con_error"]) == (6, 1, 5)
+    assert len(resultado["errores"]) == 3
+    assert resultado["errores_truncados"] is True
+    assert importar(recepcion, ENCABEZADO)["errores_truncados"] is False
+
+
+def test_comillas_sin_cerrar_son_un_error_de_su_fila(ids, recepcion, monkeypatch):
+    monkeypatch.setattr(settings, "importacion_max_lineas_registro", 3)
+    a, b, c, d, e = ids(5)
+    # Las filas 2 y 6 abren comillas que no se cierran: la 2 llega al límite de
+    # líneas y la 6 al final del archivo
+    texto = (
+        ENCABEZADO + csv_fila(a) + csv_fila(b, direccion='"sin cerrar')
+        + csv_fila(c) + csv_fila(d) + csv_fila(e) + csv_fila("x", direccion='"tampoco')
+    )
+
+    resultado = importar(recepcion, texto)
+
+    assert (resultado["total"], resultado["creados"], resultado["con_error"]) == (6, 4, 2)
+    assert [(e["fila"], e["error"]) for e in resultado["errores"]] == [
+        (2, "Comillas sin cerrar"), (6, "Comillas sin cerrar"),
+    ]
+
+
+def test_busqueda_encuentra_a_los_importados(ids, recepcion, crear_usuario, encabezados):
+    a, b = ids(2)
+    texto = ENCABEZADO + csv_fila(a, "Eustaquio", "Villalobos Quesada") + csv_fila(b, "Fermina", "Ulloa Zúñiga")
+    assert importar(recepcion, texto)["creados"] == 2
+
+    cliente = TestClient(app)
+    h = encabezados(crear_usuario("medico"))
+
+    def buscar(q):
+        respuesta = cliente.get("/api/pacientes/buscar", params={"q": q}, headers=h)
+        assert respuesta.status_code == 200, respuesta.text
+        return [p["identificacion"] for p in respuesta.json()]
+
+    # Prefijos (FTS) y nombres con errores de tipeo y sin tildes (trigramas)
+    assert buscar("Eustaq Villal")[0] == a
+    assert b in buscar("Fermina Zuniga")
+    assert a in buscar("Eustakio Vilalobos")
+    assert b in buscar("Fermina Uloa")
@@ -0,0 +1,35 @@
+"""
+Las consultas frecuentes (migraciones.consultas_frecuentes) se resuelven con
+su índice y sin ordenar en memoria, sobre una base recién migrada. Es la
+misma verificación que `python -m backend.migraciones --explicar`.
+"""
+import pytest
+from sqlalchemy import text
+
+from backend.database import crear_engine
+from backend.migraciones import aplicar_migraciones, consultas_frecuentes, explicar_consultas
+
+
+@pytest.fixture
+def base_migrada(tmp_path):
+    bind = crear_engine(f"sqlite:///{tmp_path / 'indices.db'}")
+    aplicar_migraciones(bind)
+    yield bind
+    bind.dispose()
+
+
+def test_consultas_frecuentes_usan_su_indice(base_migrada):
+    resultados = explicar_consultas(base_migrada)
+
+    assert len(resultados) == len(consultas_frecuentes())
+    fallos = {descripcion: (indice, plan) for descripcion, indice, plan, ok in resultados if not ok}
+    assert fallos == {}
+
+
+@pytest.mark.parametrize("indice", [indice for _, _, indice in consultas_frecuentes()])
+def test_sin_el_indice_la_verificacion_falla(indice, base_migrada):
+    with base_migrada.begin() as conn:
+        conn.execute(text(f"DROP INDEX {indice}"))
+
+    (ok,) = [ok for _, esperado, _, ok in explicar_consultas(base_migrada) if esperado == indice]
+    assert not ok
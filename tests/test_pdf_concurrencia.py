@@ -0,0 +1,115 @@
+"""
+Una ráfaga de PDFs de recetas no frena al resto de los requests: reportlab
+corre en recetas_pdf.pool_pdf y el event loop sigue atendiendo. Con el pool
+lleno la descarga responde 503 con Retry-After en lugar de encolar.
+
+Los requests livianos salen a intervalos fijos durante la ráfaga y su
+latencia se cuenta desde el momento en que debían salir: si el loop queda
+bloqueado generando un PDF, la espera se suma aunque el request aún no se
+haya enviado.
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from backend import models, recetas_pdf
+from backend.main import app
+from benchmarks.rafaga_pdf import datos
+
+PDFS = 16  # cabe en pool_pdf (pdf_procesos + pdf_max_pendientes) sin rechazos
+MEDICAMENTOS = 200
+INTERVALO = 0.02  # segundos entre requests livianos
+
+
+@pytest.fixture
+def pool_pdf():
+    """pool_pdf con los procesos ya iniciados y sin PDFs en la caché"""
+    pool = recetas_pdf.pool_pdf
+
+    async def iniciar():
+        await asyncio.gather(*[pool.ejecutar(time.sleep, 0) for _ in range(pool.max_procesos)])
+
+    recetas_pdf.cache_pdf.limpiar()
+    asyncio.run(iniciar())
+    yield pool
+    recetas_pdf.pool_pdf.cerrar()
+    recetas_pdf.cache_pdf.limpiar()
+
+
+def _cliente():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def _un_pdf() -> float:
+    """Segundos de reportlab para un PDF de la ráfaga, en este proceso"""
+    recetas_pdf.renderizar(datos(0, MEDICAMENTOS))  # importa reportlab fuera de la medición
+    return min(recetas_pdf.renderizar(datos(0, MEDICAMENTOS))[1] for _ in range(3))
+
+
+def test_rafaga_de_pdfs_no_frena_requests_livianos(pool_pdf):
+    un_pdf = _un_pdf()
+
+    async def rafaga():
+        latencias = []
+        async with _cliente() as cliente:
+            async def liviano(salida):
+                assert (await cliente.get("/health")).status_code == 200
+                latencias.append(time.perf_counter() - salida)
+
+            # Ids distintos: ningún PDF sale de la caché
+            pdfs = asyncio.gather(*[recetas_pdf.pdf_receta(datos(i, MEDICAMENTOS)) for i in range(1, PDFS + 1)])
+            salida, livianos = time.perf_counter(), []
+            while not pdfs.done():
+                livianos.append(asyncio.ensure_future(liviano(salida)))
+                salida += INTERVALO
+                await asyncio.sleep(max(0.0, salida - time.perf_counter()))
+            await asyncio.gather(*livianos)
+            return await pdfs, latencias
+
+    generadas = pool_pdf.completadas
+    pdfs, latencias = asyncio.run(rafaga())
+
+    assert len(pdfs) == PDFS and all(pdf.startswith(b"%PDF") for pdf in pdfs)
+    assert pool_pdf.completadas - generadas == PDFS
+    assert len(latencias) >= 10, latencias
+    latencias.sort()
+    p99 = latencias[int(len(latencias) * 0.99) - 1]
+    # Con reportlab en el event loop los PDFs se generan uno tras otro sin ceder el
+    # loop: los requests livianos esperan la ráfaga entera (PDFS * un_pdf)
+    assert p99 < PDFS * un_pdf / 2, (p99, un_pdf, latencias[-5:])
+
+
+def test_pool_lleno_responde_503_con_retry_after(pool_pdf, monkeypatch, db, crear_usuario, crear_paciente,
+                                                 encabezados):
+    medico = crear_usuario("medico")
+    paciente = crear_paciente()
+    receta = models.Receta(paciente_id=paciente.id, medico_id=medico.id)
+    receta.medicamentos = [
+        models.RecetaMedicamento(posicion=1, nombre="Losartán", dosis="50 mg", frecuencia="c/24h",
+                                 duracion="30 días", via="Oral")
+    ]
+    db.add(receta)
+    db.commit()
+    h = encabezados(medico)
+    monkeypatch.setattr(pool_pdf, "max_procesos", 1)
+    monkeypatch.setattr(pool_pdf, "max_pendientes", 0)
+
+    async def descargar():
+        async with _cliente() as cliente:
+            return await cliente.get(f"/api/recetas/{receta.id}/pdf", headers=h)
+
+    # Una tarea larga ocupa el único lugar del pool
+    ocupado = pool_pdf.enviar(time.sleep, 1)
+    rechazadas = pool_pdf.rechazadas
+    respuesta = asyncio.run(descargar())
+    assert respuesta.status_code == 503, respuesta.text
+    assert int(respuesta.headers["Retry-After"]) >= 1
+    assert pool_pdf.rechazadas == rechazadas + 1
+
+    # Con lugar libre la misma descarga funciona
+    ocupado.result()
+    respuesta = asyncio.run(descargar())
+    assert respuesta.status_code == 200
+    assert respuesta.content.startswith(b"%PDF")
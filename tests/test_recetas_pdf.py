@@ -0,0 +1,40 @@
+"""
+El PDF de una receta depende solo de sus datos: la caché por contenido
+(recetas_pdf.clave_pdf) puede servirlo otra vez sin que quede una hora de
+generación vieja impresa.
+"""
+import time
+from datetime import datetime
+from io import BytesIO
+
+from pypdf import PdfReader
+
+from backend import models, recetas_pdf
+from benchmarks.rafaga_pdf import datos
+
+
+def texto(pdf: bytes) -> str:
+    return "\n".join(pagina.extract_text() for pagina in PdfReader(BytesIO(pdf)).pages)
+
+
+def test_mismo_contenido_en_cualquier_momento():
+    primero, _ = recetas_pdf.renderizar(datos(1, 3))
+    time.sleep(1.1)
+    segundo, _ = recetas_pdf.renderizar(datos(1, 3))
+
+    assert primero == segundo
+    assert "Emitida: 01/03/2025 09:30" in texto(primero)
+    assert "Generado" not in texto(primero)
+
+
+def test_pie_con_la_fecha_de_emision_de_la_receta(db, crear_usuario, crear_paciente):
+    receta = models.Receta(paciente_id=crear_paciente().id, medico_id=crear_usuario("medico").id,
+                           fecha_emision=datetime(2024, 3, 5, 14, 30))
+    db.add(receta)
+    db.commit()
+
+    contenido = recetas_pdf.datos_receta(receta)
+    pdf, _ = recetas_pdf.renderizar(contenido)
+
+    assert contenido["emitida"] == "05/03/2024 14:30"
+    assert "Emitida: 05/03/2024 14:30" in texto(pdf)
@@ -0,0 +1,47 @@
+"""
+Rotación de refresh tokens: cada uno se usa una sola vez, también cuando
+llegan dos renovaciones simultáneas con el mismo token.
+"""
+import asyncio
+import time
+
+import httpx
+
+from backend.main import app
+from backend.revocacion import RegistroRevocaciones
+
+
+def test_revocar_informa_si_ya_estaba_revocado(tmp_path):
+    # Dos registros sobre el mismo archivo, como dos workers de uvicorn
+    ruta = str(tmp_path / "datos" / "revocaciones.log")
+    worker_a = RegistroRevocaciones(ruta, sincronizar_cada=3600)
+    worker_b = RegistroRevocaciones(ruta, sincronizar_cada=3600)
+    exp = int(time.time()) + 600
+
+    assert worker_a.revocar("jti-1", exp) is True
+    # worker_b todavía no sincronizó, pero revocar() relee el archivo
+    assert worker_b.revocar("jti-1", exp) is False
+    assert worker_a.revocar("jti-1", exp) is False
+    assert worker_b.revocar("jti-2", exp) is True
+    assert worker_a.revocar("jti-2", exp) is False
+
+
+def test_refresh_concurrente_solo_uno_gana(crear_usuario):
+    usuario = crear_usuario("medico")
+
+    async def escenario():
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+            login = await cliente.post(
+                "/api/auth/login", data={"username": usuario.username, "password": "clave"}
+            )
+            assert login.status_code == 200, login.text
+            refresh_token = login.json()["refresh_token"]
+            return await asyncio.gather(*[
+                cliente.post("/api/auth/refresh", json={"refresh_token": refresh_token})
+                for _ in range(5)
+            ])
+
+    respuestas = asyncio.run(escenario())
+    codigos = sorted(r.status_code for r in respuestas)
+    assert codigos == [200, 401, 401, 401, 401], codigos